@@ -0,0 +1,315 @@
+"""writes decoded MSG.1 columns straight into per-group Arrow/Parquet files, without pandas or per-row python objects"""
+import os
+import json
+import hashlib
+from contextlib import ExitStack
+from dataclasses import asdict
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from datasets import Dataset
+from helpers.column_store import ColumnStoreWriter
+from helpers.raw_sidecar import RawRecordWriter
+from helpers.regions import attach_region_columns
+from helpers.extraction import (
+    FMISS,
+    GROUP_DEFINITIONS,
+    iter_tar_members_parallel,
+    validate_and_create_path,
+)
+
+ARROW_FILENAME = "data-00000-of-00001.arrow"
+PARQUET_FILENAME = "data.parquet"
+
+
+def group_schema(group, compact=False):
+    """
+    arrow schema of a group split, same columns and types as the process_chunk_hf -> Dataset.from_pandas chain
+    compact=True downcasts header fields to small ints, statistics to float32, dictionary-encodes source_file and
+    drops date_string (derive it on read with helpers.hf.add_date_string); every statistic is (coded + base) * unit
+    with coded < 2**16, so float32 still separates all distinct coded values
+    """
+    if compact:
+        fields = [
+            ('year', pa.int16()),
+            ('month', pa.int8()),
+            ('longitude', pa.float32()),
+            ('latitude', pa.float32()),
+            ('box_size_degrees', pa.float32()),
+            ('platform_id1', pa.int8()),
+            ('platform_id2', pa.int8()),
+            ('data_group', pa.int8()),
+            ('checksum', pa.int8()),
+            ('source_file', pa.dictionary(pa.int16(), pa.string())),
+        ]
+    else:
+        fields = [
+            ('year', pa.int64()),
+            ('month', pa.int64()),
+            ('longitude', pa.float64()),
+            ('latitude', pa.float64()),
+            ('box_size_degrees', pa.float64()),
+            ('platform_id1', pa.float64()),
+            ('platform_id2', pa.float64()),
+            ('data_group', pa.int64()),
+            ('checksum', pa.int64()),
+            ('source_file', pa.large_string()),
+        ]
+    stat_type = pa.float32() if compact else pa.float64()
+    for var_name in GROUP_DEFINITIONS[group]['variables'].values():
+        for stat in ('tercile1', 'median', 'tercile3', 'mean'):
+            fields.append((f'{var_name}_{stat}', stat_type))
+    if not compact:
+        fields.append(('date_string', pa.large_string()))
+    return pa.schema(fields)
+
+
+def columns_to_record_batch(columns, schema):
+    """
+    converts a decoded columnar table into an arrow record batch
+    FMISS values become nulls in the validity bitmap instead of python None objects
+    """
+    arrays = []
+    for field in schema:
+        if field.name == 'date_string':
+            year = pc.cast(pa.array(columns['year']), pa.large_string())
+            month = pc.utf8_lpad(pc.cast(pa.array(columns['month']), pa.large_string()), 2, '0')
+            arrays.append(pc.binary_join_element_wise(year, month, pa.scalar('-', pa.large_string())))
+        elif pa.types.is_dictionary(field.type):
+            indices, dictionary = pd.factorize(columns[field.name])
+            arrays.append(pa.DictionaryArray.from_arrays(
+                pa.array(indices.astype(field.type.index_type.to_pandas_dtype())),
+                pa.array(list(dictionary), type=field.type.value_type),
+            ))
+        elif pa.types.is_floating(field.type):
+            values = columns[field.name]
+            arrays.append(pa.array(values.astype(field.type.to_pandas_dtype(), copy=False), mask=values == FMISS))
+        else:
+            arrays.append(pa.array(columns[field.name].astype(field.type.to_pandas_dtype(), copy=False)))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+class GroupArrowWriter:
+    """
+    appends decoded columnar batches to one file per group
+    file_format "arrow" writes the save_to_disk layout (readable with load_from_disk),
+    file_format "parquet" writes one parquet file per group directory (readable with load_dataset("parquet", ...))
+    compact=True writes the compact schema of group_schema
+    leaving the with block by an exception only closes the files (see abort), so a failed ingest never looks complete
+    """
+
+    def __init__(self, output_path, file_format="arrow", compact=False):
+        if file_format not in ("arrow", "parquet"):
+            raise ValueError(f"Unknown file format: {file_format}. Choose from ['arrow', 'parquet'].")
+        self.output_path = output_path
+        self.file_format = file_format
+        self.compact = compact
+        self.writers = {}
+        self.schemas = {}
+        self.num_rows = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def split_path(self, group):
+        return os.path.join(self.output_path, str(group))
+
+    def _open(self, group):
+        schema = group_schema(group, self.compact)
+        os.makedirs(self.split_path(group), exist_ok=True)
+
+        if self.file_format == "arrow":
+            sink = pa.OSFile(os.path.join(self.split_path(group), ARROW_FILENAME), 'wb')
+            writer = pa.ipc.new_stream(sink, schema)
+        else:
+            writer = pq.ParquetWriter(os.path.join(self.split_path(group), PARQUET_FILENAME), schema)
+
+        self.writers[group] = writer
+        self.schemas[group] = schema
+        self.num_rows[group] = 0
+
+    def write(self, group, columns):
+        if len(columns['year']) == 0:
+            return
+        if group not in self.writers:
+            self._open(group)
+
+        batch = columns_to_record_batch(columns, self.schemas[group])
+        self.writers[group].write_batch(batch)
+        self.num_rows[group] += batch.num_rows
+
+    def close(self):
+        """
+        closes all group files and writes the HF metadata for the arrow layout
+        """
+        for group, writer in self.writers.items():
+            writer.close()
+
+        if self.file_format == "arrow" and self.writers:
+            for group in self.writers:
+                write_split_metadata(self.split_path(group))
+            write_dataset_dict_metadata(self.output_path, [str(group) for group in self.writers])
+
+        self.writers = {}
+        return dict(self.num_rows)
+
+    def abort(self):
+        """
+        closes all group files without writing metadata after a failed ingest: stale state.json /
+        dataset_info.json / dataset_dict.json of an earlier run are removed so load_from_disk refuses the
+        partial splits, partial parquet files are renamed to data.parquet.partial
+        """
+        for group, writer in self.writers.items():
+            writer.close()
+            split_path = self.split_path(group)
+            if self.file_format == "arrow":
+                for filename in ("state.json", "dataset_info.json"):
+                    if os.path.exists(os.path.join(split_path, filename)):
+                        os.remove(os.path.join(split_path, filename))
+            else:
+                path = os.path.join(split_path, PARQUET_FILENAME)
+                os.replace(path, path + ".partial")
+
+        dataset_dict_path = os.path.join(self.output_path, "dataset_dict.json")
+        if self.writers and os.path.exists(dataset_dict_path):
+            os.remove(dataset_dict_path)
+        self.writers = {}
+        return dict(self.num_rows)
+
+
+def write_split_metadata(split_path, data_files=(ARROW_FILENAME,)):
+    """
+    writes state.json and dataset_info.json next to arrow stream files so load_from_disk can open the split
+    data_files are concatenated in the given order when the split is loaded
+    """
+    dataset = Dataset.from_file(os.path.join(split_path, data_files[0]))
+    
+    # fingerprint changes whenever a data file is added, replaced or reordered
+    file_stats = []
+    for filename in data_files:
+        stat = os.stat(os.path.join(split_path, filename))
+        file_stats.append([filename, stat.st_size, stat.st_mtime_ns])
+    fingerprint = hashlib.sha1(json.dumps(file_stats).encode()).hexdigest()[:16]
+
+    state = {
+        "_data_files": [{"filename": filename} for filename in data_files],
+        "_fingerprint": fingerprint,
+        "_format_columns": None,
+        "_format_kwargs": {},
+        "_format_type": None,
+        "_output_all_columns": False,
+        "_split": None,
+    }
+    with open(os.path.join(split_path, "state.json"), "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+
+    dataset_info = asdict(dataset.info)
+    with open(os.path.join(split_path, "dataset_info.json"), "w", encoding="utf-8") as f:
+        json.dump({key: dataset_info[key] for key in sorted(dataset_info)}, f, indent=2)
+
+
+def write_arrow_shard(path, group, columns):
+    """
+    durably writes one decoded table as a standalone arrow stream file
+    the file is written under a temporary name, fsynced and then renamed, so a crash never leaves a partial shard
+    """
+    schema = group_schema(group)
+    tmp_path = path + ".tmp"
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with pa.ipc.new_stream(sink, schema) as writer:
+            writer.write_batch(columns_to_record_batch(columns, schema))
+    with open(tmp_path, 'rb+') as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def write_dataset_dict_metadata(output_path, splits):
+    with open(os.path.join(output_path, "dataset_dict.json"), "w", encoding="utf-8") as f:
+        json.dump({"splits": list(splits)}, f)
+
+
+def parse_all_groups_arrow(base_directory, file_list, output_path, workers=None, file_format="arrow", column_store_path=None,
+                           compact=False, raw_sidecar_path=None, region_cache_dir=None):
+    """
+    decodes all tar files and streams every monthly member straight into per-group arrow/parquet files
+    replaces the records -> pandas -> Dataset chain of parse_all_groups_optimized_hf, rows keep the serial order
+    if column_store_path is given, the same rows are also written to a memory-mappable column store in the same pass
+    compact=True writes the compact schema (small ints, float32 statistics, dictionary source_file, no date_string)
+    if raw_sidecar_path is given, the packed 64 byte records are kept in a sidecar aligned row for row with the splits
+    if region_cache_dir is given, basin_id / region_bits / land_percent columns are attached to the column store
+    (see helpers.regions), the lookup tables are cached in region_cache_dir
+    Returns:
+        tuple: (output_path, {group: number of rows}) or (None, None) on failure
+    """
+    print("="*80)
+    print("ICOADS MSG.1 MULTI-GROUP PARSER (ARROW WRITER)")
+    print("="*80)
+
+    try:
+        output_path = validate_and_create_path(output_path)
+    except OSError as e:
+        print(f"ERROR: {e}")
+        return None, None
+
+    tar_paths = []
+    for filename in file_list:
+        tar_path = os.path.join(base_directory, filename)
+        if not os.path.exists(tar_path):
+            print(f"ERROR: File not found: {tar_path}")
+            return None, None
+        tar_paths.append(tar_path)
+
+    failed_members = []
+    # all writers close together, on an exception none of them publishes its metadata
+    with ExitStack() as stack:
+        writer = stack.enter_context(GroupArrowWriter(output_path, file_format, compact))
+        store_writer = None
+        if column_store_path is not None:
+            store_writer = stack.enter_context(ColumnStoreWriter(column_store_path))
+        raw_writer = None
+        if raw_sidecar_path is not None:
+            raw_writer = stack.enter_context(RawRecordWriter(raw_sidecar_path))
+        for (tar_path, member_name, offset, size), tables, error in iter_tar_members_parallel(tar_paths, workers, keep_raw=raw_writer is not None):
+            if error is not None:
+                print(f"Error processing {os.path.basename(tar_path)}/{member_name}: {error}")
+                failed_members.append((tar_path, member_name))
+                continue
+
+            for group, columns in tables.items():
+                writer.write(group, columns)
+                if store_writer is not None:
+                    store_writer.write(group, columns)
+                if raw_writer is not None:
+                    raw_writer.write(group, columns)
+
+    if store_writer is not None:
+        print(f"Column store written to: {column_store_path}")
+        if region_cache_dir is not None:
+            for group in store_writer.meta:
+                attach_region_columns(column_store_path, str(group), region_cache_dir)
+    if raw_writer is not None:
+        print(f"Raw record sidecar written to: {raw_sidecar_path}")
+
+    group_rows = writer.num_rows
+
+    print(f"\n{'='*60}")
+    print(f"PROCESSING COMPLETE")
+    print(f"Total records processed: {sum(group_rows.values()):,}")
+    if failed_members:
+        print(f"Failed members: {len(failed_members)}")
+    for group, rows in group_rows.items():
+        print(f"  Group {group}: {rows:,} records")
+    print(f"{'='*60}")
+
+    if not group_rows:
+        print("ERROR: No group datasets were created!")
+        return None, None
+
+    return output_path, group_rows
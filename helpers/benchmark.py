@@ -0,0 +1,390 @@
+"""benchmarks for the MSG.1 extraction pipeline"""
+import io
+import os
+import gzip
+import json
+import time
+import platform
+import tarfile
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+import datasets
+from scipy import stats
+from datasets import Dataset, concatenate_datasets
+from helpers.arrow_writer import parse_all_groups_arrow
+from helpers.derived import DERIVED_VARIABLES, derive_variable
+from helpers.extraction import (
+    FMISS,
+    convert_to_true_values,
+    convert_to_true_values_batch,
+    create_record_columns,
+    create_record_columns_batch,
+    iter_tar_members_parallel,
+    msg1_record_view,
+    process_chunk_hf,
+    unpack_msg1_record,
+    unpack_msg1_records,
+)
+from helpers.hf import load_column_store, load_dataset
+from helpers.cubes import load_cube
+from helpers.trends import compute_trend_grids, deseasonalize
+from helpers.regrid import aggregation_matrix_path, regrid_store
+
+
+def benchmark_parallel_ingestion(tar_paths, worker_counts=(1, 2, 4, 8)):
+    """
+    measures decode throughput of iter_tar_members_parallel for each worker count
+    Args:
+        tar_paths (list): paths of MSG.1 tar files to decode
+        worker_counts (tuple): worker counts to compare
+    Returns:
+        list: one dict per worker count with records, seconds, records_per_s and speedup
+    """
+    input_bytes = sum(os.path.getsize(path) for path in tar_paths)
+    results = []
+    
+    for workers in worker_counts:
+        start = time.perf_counter()
+        records = 0
+        for unit, tables, error in iter_tar_members_parallel(tar_paths, workers):
+            if error is None:
+                records += sum(len(columns['year']) for columns in tables.values())
+        seconds = time.perf_counter() - start
+        
+        results.append({
+            'workers': workers,
+            'records': records,
+            'seconds': seconds,
+            'records_per_s': records / seconds if seconds > 0 else float('inf'),
+            'mb_per_s': input_bytes / 1e6 / seconds if seconds > 0 else float('inf'),
+        })
+    
+    baseline = results[0]['seconds']
+    print(f"{'workers':>8} {'records':>12} {'seconds':>9} {'records/s':>12} {'MB/s':>8} {'speedup':>8}")
+    for result in results:
+        result['speedup'] = baseline / result['seconds'] if result['seconds'] > 0 else float('inf')
+        print(f"{result['workers']:>8} {result['records']:>12,} {result['seconds']:>9.2f} "
+              f"{result['records_per_s']:>12,.0f} {result['mb_per_s']:>8.1f} {result['speedup']:>8.2f}")
+    
+    return results
+
+
+def benchmark_schema_modes(base_directory, file_list, output_dir, file_format="parquet", workers=1):
+    """
+    compares the default and the compact output schema: bytes on disk, write time and full read time
+    Args:
+        base_directory (str): folder with the MSG.1 tar files
+        file_list (list): tar files to ingest
+        output_dir (str): scratch folder, one sub folder per schema mode is written
+        file_format (str): "arrow" or "parquet"
+        workers (int): ingestion workers
+    Returns:
+        list: one dict per schema mode
+    """
+    results = []
+    for compact in (False, True):
+        mode = "compact" if compact else "default"
+        output_path = os.path.join(output_dir, f"{mode}_{file_format}")
+        
+        start = time.perf_counter()
+        _, group_rows = parse_all_groups_arrow(base_directory, file_list, output_path, workers=workers,
+                                               file_format=file_format, compact=compact)
+        write_seconds = time.perf_counter() - start
+        
+        disk_bytes = 0
+        for root, dirs, files in os.walk(output_path):
+            disk_bytes += sum(os.path.getsize(os.path.join(root, file)) for file in files)
+        
+        start = time.perf_counter()
+        dataset = load_dataset(output_path)
+        for split in dataset.values():
+            split.with_format("arrow")[:]
+        read_seconds = time.perf_counter() - start
+        
+        rows = sum(group_rows.values())
+        results.append({
+            'mode': mode,
+            'rows': rows,
+            'disk_bytes': disk_bytes,
+            'bytes_per_row': disk_bytes / rows if rows else 0,
+            'write_seconds': write_seconds,
+            'read_seconds': read_seconds,
+        })
+    
+    print(f"{'mode':>8} {'rows':>12} {'MB':>9} {'bytes/row':>10} {'write s':>8} {'read s':>8}")
+    for result in results:
+        print(f"{result['mode']:>8} {result['rows']:>12,} {result['disk_bytes'] / 1e6:>9.1f} "
+              f"{result['bytes_per_row']:>10.1f} {result['write_seconds']:>8.2f} {result['read_seconds']:>8.2f}")
+    
+    return results
+
+
+def naive_saturation_humidity(df, pressure=1013.25):
+    es = 6.112 * np.exp(17.67 * df.iloc[:, 0] / (df.iloc[:, 0] + 243.5))
+    return 622.0 * es / (pressure - 0.378 * es)
+
+
+# pandas one-liners of DERIVED_VARIABLES, every operation allocates a full length temporary
+NAIVE_DERIVED_VARIABLES = {
+    'saturation_humidity': naive_saturation_humidity,
+    'humidity_deficit': lambda df: naive_saturation_humidity(df) - df.iloc[:, 1],
+    'wind_stress_u': lambda df: df.iloc[:, 0] * df.iloc[:, 1],
+    'wind_stress_v': lambda df: df.iloc[:, 0] * df.iloc[:, 1],
+    'wind_cubed': lambda df: df.iloc[:, 0] ** 3,
+}
+
+
+def benchmark_derived_variables(store_path, split, names, chunk_rows=(16384, 65536, 262144)):
+    """
+    compares the chunked derived-variable engine with the naive pandas version: time and peak traced memory
+    the pandas version loads the input columns into a DataFrame and evaluates the formula in one go
+    Args:
+        store_path (str): path to the column store
+        split (str): group split (e.g., "3")
+        names (list): derived variables (see helpers.derived.DERIVED_VARIABLES)
+        chunk_rows (tuple): chunk sizes of the engine to compare
+    Returns:
+        list: one dict per (variable, method)
+    """
+    results = []
+    for name in names:
+        inputs = DERIVED_VARIABLES[name][1]
+
+        def run(method, function):
+            tracemalloc.start()
+            start = time.perf_counter()
+            rows = function()
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results.append({
+                'variable': name,
+                'method': method,
+                'rows': rows,
+                'seconds': seconds,
+                'rows_per_s': rows / seconds if seconds > 0 else float('inf'),
+                'peak_bytes': peak,
+            })
+
+        def pandas_version():
+            store = load_column_store(store_path, split, inputs)
+            df = pd.DataFrame({column: np.asarray(store[column]) for column in inputs})
+            values = NAIVE_DERIVED_VARIABLES[name](df).to_numpy(dtype=np.float32)
+            values.tofile(os.path.join(store_path, split, f"naive_{name}.bin"))
+            return len(values)
+
+        run('pandas', pandas_version)
+        os.remove(os.path.join(store_path, split, f"naive_{name}.bin"))
+        for rows in chunk_rows:
+            run(f'chunked {rows}', lambda: derive_variable(store_path, split, name, chunk_rows=rows))
+
+    print(f"{'variable':>20} {'method':>16} {'rows':>12} {'seconds':>9} {'rows/s':>12} {'peak MB':>9}")
+    for result in results:
+        print(f"{result['variable']:>20} {result['method']:>16} {result['rows']:>12,} {result['seconds']:>9.3f} "
+              f"{result['rows_per_s']:>12,.0f} {result['peak_bytes'] / 1e6:>9.1f}")
+
+    return results
+
+
+def benchmark_pipeline_stages(tar_path, output_dir, results_path="benchmark_results.jsonl", chunk_size=50000):
+    """
+    times every stage of the extraction pipeline separately on one MSG.1 tar file (e.g. from
+    helpers.synthetic.write_synthetic_tar) and appends the result as one JSON line to results_path,
+    so runs of different versions can be compared
+    the scalar stages are the ones of parse_all_groups_optimized_hf, the *_batch stages the vectorized decoder;
+    parity records whether both decoders produce the same values
+    Args:
+        tar_path (str): MSG.1 tar file
+        output_dir (str): scratch folder for save_to_disk
+        results_path (str): JSONL file the result is appended to, None to skip writing
+        chunk_size (int): records per process_chunk_hf chunk
+    Returns:
+        dict: run metadata and {stage: {seconds, records_per_s}}
+    """
+    stages = {}
+
+    def timed(stage, function, *args):
+        start = time.perf_counter()
+        value = function(*args)
+        stages[stage] = {'seconds': time.perf_counter() - start}
+        return value
+
+    def read_members():
+        with tarfile.open(tar_path, 'r') as tar:
+            members = sorted((member for member in tar.getmembers() if member.name.endswith('.gz')),
+                             key=lambda member: member.name)
+            return [(os.path.basename(member.name), tar.extractfile(member).read()) for member in members]
+
+    def gunzip(members):
+        return [(name, gzip.decompress(data)) for name, data in members]
+
+    def unpack(buffers):
+        unpacked = []
+        for name, data in buffers:
+            for offset in range(0, len(data) - 63, 64):
+                record_bytes = data[offset:offset + 64]
+                if record_bytes[1] % 16 == 1:
+                    unpacked.append((name, unpack_msg1_record(record_bytes)))
+        return unpacked
+
+    def convert(unpacked):
+        return [(name, coded[8], convert_to_true_values(coded, coded[8])) for name, coded in unpacked]
+
+    def create(converted):
+        return [create_record_columns(ftrue, group, name) for name, group, ftrue in converted]
+
+    def process(records):
+        with redirect_stdout(io.StringIO()):
+            return [process_chunk_hf(records[start:start + chunk_size]) for start in range(0, len(records), chunk_size)]
+
+    def from_pandas(frames):
+        return [Dataset.from_pandas(df, preserve_index=False) for df in frames if len(df)]
+
+    def save(dataset):
+        dataset.save_to_disk(os.path.join(output_dir, "benchmark_stages"))
+
+    def batch_records(buffers):
+        records = np.concatenate([msg1_record_view(data) for name, data in buffers])
+        return records[(records[:, 1] % 16) == 1]
+
+    members = timed('tar_read', read_members)
+    buffers = timed('gunzip', gunzip, members)
+    unpacked = timed('unpack_msg1_record', unpack, buffers)
+    n_records = len(unpacked)
+    converted = timed('convert_to_true_values', convert, unpacked)
+    records = timed('create_record_columns', create, converted)
+    frames = timed('process_chunk_hf', process, records)
+    chunks = timed('Dataset.from_pandas', from_pandas, frames)
+    dataset = timed('concatenate_datasets', concatenate_datasets, chunks)
+    timed('save_to_disk', save, dataset)
+
+    packed = batch_records(buffers)
+    coded = timed('unpack_msg1_records_batch', unpack_msg1_records, packed)
+    group = int(coded[0, 8]) if len(coded) else 3
+    ftrue = timed('convert_to_true_values_batch', convert_to_true_values_batch, coded, group)
+    timed('create_record_columns_batch', create_record_columns_batch, ftrue, group, "benchmark")
+
+    for timing in stages.values():
+        timing['records_per_s'] = n_records / timing['seconds'] if timing['seconds'] > 0 else float('inf')
+
+    scalar = np.array([ftrue_row for name, group_row, ftrue_row in converted], dtype=np.float64)
+    parity = bool(len(scalar) == len(ftrue) and np.array_equal(scalar[:, 1:], ftrue[:, 1:]))
+
+    result = {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'tar': os.path.basename(tar_path),
+        'input_bytes': os.path.getsize(tar_path),
+        'records': n_records,
+        'missing_ratio': float(np.mean(ftrue[:, 10:50] == FMISS)) if len(ftrue) else 0.0,
+        'parity': parity,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'datasets': datasets.__version__,
+        'stages': stages,
+    }
+    if results_path is not None:
+        with open(results_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(result) + "\n")
+
+    print(f"{'stage':>30} {'seconds':>9} {'records/s':>12}")
+    for stage, timing in stages.items():
+        print(f"{stage:>30} {timing['seconds']:>9.3f} {timing['records_per_s']:>12,.0f}")
+    print(f"records: {n_records:,}, scalar/batch parity: {parity}")
+
+    return result
+
+
+def benchmark_trend_engine(cube_path, split, variable, max_cells=2000, min_count=24):
+    """
+    compares compute_trend_grids with a per box loop of scipy.stats.linregress on the same deseasonalized series
+    the loop only runs over the first max_cells boxes with data, its time for the whole grid is extrapolated
+    Returns:
+        dict: boxes, seconds of both methods, speedup and the largest slope / p-value differences
+    """
+    start = time.perf_counter()
+    grids = compute_trend_grids(cube_path, split, variable, min_count=min_count,
+                                output_path=os.path.join(cube_path, split, "trends", f"benchmark_{variable}.npz"))
+    batched_seconds = time.perf_counter() - start
+
+    cube, coords = load_cube(cube_path, split, variable)
+    times = coords['year'] + (coords['month'] - 1) / 12.0
+    times = times - times[0]
+    cells = np.argwhere(grids['count'] >= min_count)
+
+    start = time.perf_counter()
+    max_slope_diff = max_p_diff = 0.0
+    for i, j in cells[:max_cells]:
+        series = deseasonalize(np.asarray(cube[:, i, j], dtype=np.float64)[:, None])[:, 0]
+        valid = ~np.isnan(series)
+        fit = stats.linregress(times[valid], series[valid])
+        max_slope_diff = max(max_slope_diff, abs(fit.slope * 10.0 - grids['slope_per_decade'][i, j]))
+        max_p_diff = max(max_p_diff, abs(fit.pvalue - grids['p_value'][i, j]))
+    looped = min(max_cells, len(cells))
+    loop_seconds = (time.perf_counter() - start) / max(looped, 1) * len(cells)
+
+    result = {
+        'boxes': int(len(cells)),
+        'looped_boxes': int(looped),
+        'batched_seconds': batched_seconds,
+        'loop_seconds_extrapolated': loop_seconds,
+        'speedup': loop_seconds / batched_seconds if batched_seconds > 0 else float('inf'),
+        'max_slope_diff': float(max_slope_diff),
+        'max_p_value_diff': float(max_p_diff),
+    }
+    print(f"{result['boxes']:,} boxes: batched {batched_seconds:.2f} s, scipy loop {loop_seconds:.2f} s "
+          f"(extrapolated from {looped:,} boxes), speedup {result['speedup']:.0f}x")
+    print(f"max |slope diff| {max_slope_diff:.2e} per decade, max |p-value diff| {max_p_diff:.2e}")
+    return result
+
+
+def benchmark_regridding(store_path, split, variable, target_degrees=10.0, cache_dir="./icoads_regrid"):
+    """
+    compares a cos(latitude) weighted pandas groupby coarsening of a column store split with regrid_store
+    Returns:
+        dict: seconds of both methods (regrid_store with a cold and a cached aggregation matrix) and the largest
+              difference of the coarse means
+    """
+    target = f"grid:{target_degrees:g}"
+    store = load_column_store(store_path, split, ['year', 'month', 'latitude', 'longitude', 'box_size_degrees', variable])
+
+    start = time.perf_counter()
+    df = pd.DataFrame({column: np.asarray(values) for column, values in store.items()})
+    resolution = float(df['box_size_degrees'].mode()[0])
+    df = df[df['box_size_degrees'] == resolution].dropna(subset=[variable])
+    centre = df['latitude'] + resolution / 2.0
+    df['weight'] = np.cos(np.deg2rad(centre))
+    df['weighted'] = df['weight'] * df[variable]
+    df['t'] = (df['year'] - df['year'].min()) * 12 + df['month'] - 1
+    df['i'] = np.floor((centre + 90.0) / target_degrees).astype(int)
+    df['j'] = np.floor(np.mod(df['longitude'] + resolution / 2.0, 360.0) / target_degrees).astype(int)
+    grouped = df.groupby(['t', 'i', 'j'])[['weighted', 'weight']].sum()
+    expected = grouped['weighted'] / grouped['weight']
+    pandas_seconds = time.perf_counter() - start
+
+    matrix_path = aggregation_matrix_path(resolution, target, cache_dir)
+    if os.path.exists(matrix_path):
+        os.remove(matrix_path)
+    timings = {}
+    for run in ('cold', 'cached'):
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            result = regrid_store(store_path, split, variable, target, resolution=resolution, cache_dir=cache_dir)
+        timings[run] = time.perf_counter() - start
+
+    t, i, j = (expected.index.get_level_values(level) for level in range(3))
+    max_diff = float(np.nanmax(np.abs(result['values'][t, i, j] - expected.values)))
+    output = {
+        'rows': int(len(df)),
+        'pandas_seconds': pandas_seconds,
+        'regrid_cold_seconds': timings['cold'],
+        'regrid_cached_seconds': timings['cached'],
+        'speedup': pandas_seconds / timings['cached'] if timings['cached'] > 0 else float('inf'),
+        'max_diff': max_diff,
+    }
+    print(f"{output['rows']:,} rows -> {target}: pandas {pandas_seconds:.2f} s, regrid {timings['cold']:.2f} s cold / "
+          f"{timings['cached']:.2f} s cached ({output['speedup']:.1f}x), max |diff| {max_diff:.2e}")
+    return output
@@ -0,0 +1,226 @@
+"""compact, memory-mappable columnar store for decoded MSG.1 boxes"""
+import os
+import json
+import numpy as np
+import pandas as pd
+from helpers.extraction import FMISS, GROUP_DEFINITIONS
+
+STORE_META_FILENAME = "meta.json"
+STORE_INDEX_FILENAME = "index.npz"
+BOX_KEY_COLUMN = "box_key"
+
+# low bits of a box key below the (year, month, lat tile, lon tile) key: 9 bit latitude, 10 bit longitude and
+# 3 bit box size code, at the 0.5 degree resolution of the MSG.1 coordinates
+BOX_KEY_BITS = 22
+
+# fixed width on-disk types, the header values are small integers in every group
+HEADER_DTYPES = {
+    'year': 'int16',
+    'month': 'int8',
+    'longitude': 'float32',
+    'latitude': 'float32',
+    'box_size_degrees': 'float32',
+    'platform_id1': 'int8',
+    'platform_id2': 'int8',
+    'data_group': 'int8',
+    'checksum': 'int8',
+    'source_file_id': 'int16',
+}
+
+
+def store_dtypes(group):
+    """
+    column -> dtype of a group in the column store, statistics are float32 with NaN for FMISS
+    """
+    dtypes = dict(HEADER_DTYPES)
+    for var_name in GROUP_DEFINITIONS[group]['variables'].values():
+        for stat in ('tercile1', 'median', 'tercile3', 'mean'):
+            dtypes[f'{var_name}_{stat}'] = 'float32'
+    return dtypes
+
+
+class ColumnStoreWriter:
+    """
+    appends decoded columnar tables to one raw little-endian file per group and column
+    layout: store_path/{group}/{column}.bin plus store_path/{group}/meta.json with dtypes, row count and the
+    source file dictionary (source_file is stored as an int16 id instead of a string per row)
+    on close every group is sorted by box key and indexed by (year, month, lat/lon tile), unless index_tile_degrees is None
+    leaving the with block by an exception only closes the files (see abort)
+    """
+
+    def __init__(self, store_path, index_tile_degrees=10.0):
+        self.store_path = store_path
+        self.index_tile_degrees = index_tile_degrees
+        self.files = {}
+        self.meta = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _open(self, group):
+        group_path = os.path.join(self.store_path, str(group))
+        os.makedirs(group_path, exist_ok=True)
+
+        dtypes = store_dtypes(group)
+        self.files[group] = {column: open(os.path.join(group_path, f"{column}.bin"), 'wb') for column in dtypes}
+        self.meta[group] = {
+            'group': group,
+            'num_rows': 0,
+            'dtypes': {column: np.dtype(dtype).newbyteorder('<').str for column, dtype in dtypes.items()},
+            'source_files': [],
+        }
+
+    def write(self, group, columns):
+        n_rows = len(columns['year'])
+        if n_rows == 0:
+            return
+        if group not in self.files:
+            self._open(group)
+        meta = self.meta[group]
+
+        source_index, source_files = pd.factorize(columns['source_file'])
+        file_ids = []
+        for source_file in source_files:
+            if source_file not in meta['source_files']:
+                meta['source_files'].append(source_file)
+            file_ids.append(meta['source_files'].index(source_file))
+
+        for column, f in self.files[group].items():
+            dtype = np.dtype(meta['dtypes'][column])
+            if column == 'source_file_id':
+                values = np.asarray(file_ids, dtype=dtype)[source_index]
+            elif dtype.kind == 'f' and column not in HEADER_DTYPES:
+                values = np.where(columns[column] == FMISS, np.nan, columns[column]).astype(dtype)
+            else:
+                values = columns[column].astype(dtype)
+            f.write(values.tobytes())
+
+        meta['num_rows'] += n_rows
+
+    def close(self):
+        for group, files in self.files.items():
+            for f in files.values():
+                f.close()
+            with open(os.path.join(self.store_path, str(group), STORE_META_FILENAME), 'w', encoding='utf-8') as f:
+                json.dump(self.meta[group], f, indent=2)
+            if self.index_tile_degrees is not None:
+                build_time_tile_index(self.store_path, group, self.index_tile_degrees)
+        self.files = {}
+        return {group: meta['num_rows'] for group, meta in self.meta.items()}
+
+    def abort(self):
+        """
+        closes all column files after a failed ingest without writing meta.json or the index, stale ones of an
+        earlier run are removed so load_column_store refuses the partial groups
+        """
+        for group, files in self.files.items():
+            for f in files.values():
+                f.close()
+            for filename in (STORE_META_FILENAME, STORE_INDEX_FILENAME):
+                path = os.path.join(self.store_path, str(group), filename)
+                if os.path.exists(path):
+                    os.remove(path)
+        self.files = {}
+
+
+def tile_grid(tile_degrees):
+    """
+    number of (lat, lon) tiles for a tile size, the extra latitude row holds boxes at exactly 90N
+    """
+    n_lat = int(np.ceil(180.0 / tile_degrees)) + 1
+    n_lon = int(np.ceil(360.0 / tile_degrees))
+    return n_lat, n_lon
+
+
+def time_tile_keys(year, month, latitude, longitude, tile_degrees):
+    """
+    encodes (year, month, lat tile, lon tile) into one sortable int64 key per row
+    longitudes are wrapped to [0, 360)
+    """
+    n_lat, n_lon = tile_grid(tile_degrees)
+    lat_tile = np.clip(np.floor((np.asarray(latitude, dtype=np.float64) + 90.0) / tile_degrees), 0, n_lat - 1).astype(np.int64)
+    lon_tile = np.floor(np.mod(np.asarray(longitude, dtype=np.float64), 360.0) / tile_degrees).astype(np.int64) % n_lon
+    time_index = np.asarray(year, dtype=np.int64) * 12 + (np.asarray(month, dtype=np.int64) - 1)
+    return (time_index * n_lat + lat_tile) * n_lon + lon_tile
+
+
+def box_keys(year, month, latitude, longitude, box_size_degrees, tile_degrees):
+    """
+    encodes (year, month, lat, lon, box size) into one int64 key per row
+    the high bits are the time_tile_keys of the row, so sorting by box key also sorts by (year, month, tile)
+    and the index key of a row is box_key >> BOX_KEY_BITS
+    """
+    lat_code = np.clip(np.rint((np.asarray(latitude, dtype=np.float64) + 90.0) * 2.0), 0, 511).astype(np.int64)
+    lon_code = np.rint(np.mod(np.asarray(longitude, dtype=np.float64), 360.0) * 2.0).astype(np.int64) % 720
+    box_code = np.clip(np.rint(np.asarray(box_size_degrees, dtype=np.float64)) + 1, 0, 7).astype(np.int64)
+    keys = time_tile_keys(year, month, latitude, longitude, tile_degrees)
+    return (keys << BOX_KEY_BITS) | (lat_code << 13) | (lon_code << 3) | box_code
+
+
+def decode_box_keys(keys, tile_degrees):
+    """
+    inverse of box_keys
+    Returns:
+        dict: year, month, latitude, longitude and box_size_degrees arrays
+    """
+    keys = np.asarray(keys, dtype=np.int64)
+    n_lat, n_lon = tile_grid(tile_degrees)
+    time_index = (keys >> BOX_KEY_BITS) // (n_lat * n_lon)
+    return {
+        'year': (time_index // 12).astype(np.int16),
+        'month': (time_index % 12 + 1).astype(np.int8),
+        'latitude': ((keys >> 13) & 511).astype(np.float32) * 0.5 - 90.0,
+        'longitude': ((keys >> 3) & 1023).astype(np.float32) * 0.5,
+        'box_size_degrees': ((keys & 7) - 1).astype(np.float32),
+    }
+
+
+def build_time_tile_index(store_path, group, tile_degrees=10.0):
+    """
+    sorts all columns of a group by box key and persists the row range of every (year, month, lat tile, lon tile)
+    the box keys are stored as an extra int64 column, so cross-group joins (see helpers.join) are merges of sorted keys
+    the sort is stable, so duplicated boxes keep their ingest order; columns are rewritten one at a time
+    """
+    group_path = os.path.join(store_path, str(group))
+    with open(os.path.join(group_path, STORE_META_FILENAME), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+
+    def read_column(column):
+        return np.fromfile(os.path.join(group_path, f"{column}.bin"), dtype=meta['dtypes'][column])
+
+    keys = box_keys(read_column('year'), read_column('month'), read_column('latitude'),
+                    read_column('longitude'), read_column('box_size_degrees'), tile_degrees)
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+
+    if np.any(order != np.arange(len(order))):
+        for column in meta['dtypes']:
+            if column == BOX_KEY_COLUMN:
+                continue
+            path = os.path.join(group_path, f"{column}.bin")
+            read_column(column)[order].tofile(path + ".tmp")
+            os.replace(path + ".tmp", path)
+
+    path = os.path.join(group_path, f"{BOX_KEY_COLUMN}.bin")
+    keys.astype('<i8').tofile(path + ".tmp")
+    os.replace(path + ".tmp", path)
+    meta['dtypes'][BOX_KEY_COLUMN] = np.dtype('<i8').str
+
+    unique_keys, starts = np.unique(keys >> BOX_KEY_BITS, return_index=True)
+    stops = np.append(starts[1:], len(keys))
+    np.savez(os.path.join(group_path, STORE_INDEX_FILENAME),
+             keys=unique_keys, starts=starts.astype(np.int64), stops=stops.astype(np.int64),
+             tile_degrees=np.float64(tile_degrees))
+
+    meta['sorted_by'] = [BOX_KEY_COLUMN]
+    meta['index_tile_degrees'] = tile_degrees
+    with open(os.path.join(group_path, STORE_META_FILENAME), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+
+    print(f"Indexed group {group}: {len(unique_keys):,} (year, month, tile) keys over {len(keys):,} rows")
@@ -0,0 +1,150 @@
+"""dense (time, lat, lon) data cubes built from the column store"""
+import os
+import json
+import numpy as np
+from helpers.column_store import store_dtypes, HEADER_DTYPES
+from helpers.hf import load_column_store, load_column_store_meta
+
+CUBE_COORDS_FILENAME = "coords.json"
+
+
+def grid_shape(resolution):
+    """
+    number of latitude rows and longitude columns of a global grid with the given box size
+    """
+    return int(np.ceil(180.0 / resolution)) + 1, int(np.ceil(360.0 / resolution))
+
+
+def cube_indices(year, month, latitude, longitude, first_year, resolution):
+    """
+    vectorized (time, lat, lon) cube index of every row
+    time counts months since January of first_year, longitudes are wrapped to [0, 360)
+    """
+    n_lat, n_lon = grid_shape(resolution)
+    time_index = (np.asarray(year, dtype=np.int64) - first_year) * 12 + (np.asarray(month, dtype=np.int64) - 1)
+    lat_index = np.floor((np.asarray(latitude, dtype=np.float64) + 90.0) / resolution).astype(np.int64)
+    lon_index = np.floor(np.mod(np.asarray(longitude, dtype=np.float64), 360.0) / resolution).astype(np.int64) % n_lon
+    return time_index, np.clip(lat_index, 0, n_lat - 1), lon_index
+
+
+def build_group_cubes(store_path, split, cube_path, variables=None, resolution=None, chunk_rows=2_000_000):
+    """
+    scatters the statistics of a column store split into dense NaN-filled float32 cubes (time, lat, lon)
+    Args:
+        store_path (str): path to the column store
+        split (str): group split (e.g., "3")
+        cube_path (str): output folder, cubes go to cube_path/{split}/{variable}.npy
+        variables (list): statistic columns (e.g. "sea_surface_temp_mean"), if None all statistics of the group
+        resolution (float): box size in degrees, if None the most common box_size_degrees of the split;
+                            boxes of other sizes are skipped
+        chunk_rows (int): rows scattered at once
+    Returns:
+        dict: coordinate metadata of the written cubes
+    """
+    meta = load_column_store_meta(store_path, split)
+    if variables is None:
+        variables = [column for column in store_dtypes(int(split)) if column not in HEADER_DTYPES]
+
+    store = load_column_store(store_path, split, ['year', 'month', 'latitude', 'longitude', 'box_size_degrees'] + list(variables))
+
+    if resolution is None:
+        sizes, counts = np.unique(store['box_size_degrees'], return_counts=True)
+        resolution = float(sizes[np.argmax(counts)])
+    if resolution <= 0:
+        raise ValueError(f"Invalid resolution: {resolution}")
+
+    first_year, last_year = int(store['year'].min()), int(store['year'].max())
+    n_time = (last_year - first_year + 1) * 12
+    n_lat, n_lon = grid_shape(resolution)
+
+    output_dir = os.path.join(cube_path, split)
+    os.makedirs(output_dir, exist_ok=True)
+    cubes = {
+        variable: np.lib.format.open_memmap(os.path.join(output_dir, f"{variable}.npy"), mode='w+',
+                                            dtype=np.float32, shape=(n_time, n_lat, n_lon))
+        for variable in variables
+    }
+    for cube in cubes.values():
+        cube[:] = np.nan
+
+    skipped = 0
+    for start in range(0, meta['num_rows'], chunk_rows):
+        stop = min(start + chunk_rows, meta['num_rows'])
+        keep = store['box_size_degrees'][start:stop] == np.float32(resolution)
+        skipped += int((~keep).sum())
+
+        t, i, j = cube_indices(store['year'][start:stop][keep], store['month'][start:stop][keep],
+                               store['latitude'][start:stop][keep], store['longitude'][start:stop][keep],
+                               first_year, resolution)
+        for variable, cube in cubes.items():
+            cube[t, i, j] = store[variable][start:stop][keep]
+
+    for cube in cubes.values():
+        cube.flush()
+
+    coords = {
+        'split': split,
+        'variables': list(variables),
+        'first_year': first_year,
+        'n_time': n_time,
+        'resolution': resolution,
+        'lat0': -90.0,
+        'lon0': 0.0,
+        'n_lat': n_lat,
+        'n_lon': n_lon,
+    }
+    with open(os.path.join(output_dir, CUBE_COORDS_FILENAME), 'w', encoding='utf-8') as f:
+        json.dump(coords, f, indent=2)
+
+    print(f"Built {len(variables)} cubes for split {split}: shape {(n_time, n_lat, n_lon)}, "
+          f"{resolution} degree boxes, {skipped:,} rows with other box sizes skipped")
+    return coords
+
+
+def load_cube(cube_path, split, variable):
+    """
+    memory-maps one cube and returns (cube, coords) where coords holds the year, month, lat and lon axes
+    """
+    with open(os.path.join(cube_path, split, CUBE_COORDS_FILENAME), 'r', encoding='utf-8') as f:
+        coords = json.load(f)
+
+    cube = np.load(os.path.join(cube_path, split, f"{variable}.npy"), mmap_mode='r')
+    time_index = np.arange(coords['n_time'])
+    coords['year'] = coords['first_year'] + time_index // 12
+    coords['month'] = time_index % 12 + 1
+    coords['lat'] = coords['lat0'] + np.arange(coords['n_lat']) * coords['resolution']
+    coords['lon'] = coords['lon0'] + np.arange(coords['n_lon']) * coords['resolution']
+    return cube, coords
+
+
+def time_index(coords, year, month):
+    """
+    position of (year, month) on the time axis of a cube
+    """
+    return (year - coords['first_year']) * 12 + (month - 1)
+
+
+def area_average(cube, coords, lat_range=None, lon_range=None):
+    """
+    cos(latitude) weighted mean over a lat/lon box for every time step, ignoring empty cells
+    lon_range wraps around if min > max
+    """
+    lat_mask = np.ones(coords['n_lat'], dtype=bool)
+    if lat_range is not None:
+        lat_mask = (coords['lat'] >= lat_range[0]) & (coords['lat'] <= lat_range[1])
+    lon_mask = np.ones(coords['n_lon'], dtype=bool)
+    if lon_range is not None:
+        if lon_range[0] <= lon_range[1]:
+            lon_mask = (coords['lon'] >= lon_range[0]) & (coords['lon'] <= lon_range[1])
+        else:
+            lon_mask = (coords['lon'] >= lon_range[0]) | (coords['lon'] <= lon_range[1])
+
+    # box centres are half a box north of the stored south edge
+    lat_centre = coords['lat'][lat_mask] + coords['resolution'] / 2.0
+    weights = np.cos(np.deg2rad(np.clip(lat_centre, -90.0, 90.0)))[None, :, None]
+
+    values = np.asarray(cube[:, lat_mask][:, :, lon_mask], dtype=np.float64)
+    valid = ~np.isnan(values)
+    weight_sum = np.sum(weights * valid, axis=(1, 2))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.nansum(values * weights, axis=(1, 2)) / weight_sum
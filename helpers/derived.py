@@ -0,0 +1,129 @@
+"""chunked evaluation of derived variables over column store splits, streamed to new columns"""
+import os
+import json
+import numpy as np
+from helpers.column_store import STORE_META_FILENAME
+from helpers.hf import load_column_store, load_column_store_meta
+
+# rows per chunk, 64k float32 values are 256 KB per buffer, so inputs, output and temporaries stay in cache
+DEFAULT_CHUNK_ROWS = 65536
+
+
+def saturation_humidity(out, tmp, sst, pressure=1013.25):
+    """
+    saturation specific humidity in g/kg at the sea surface temperature (deg C), Tetens formula:
+    es = 6.112 * exp(17.67 * T / (T + 243.5)) hPa and qs = 622 * es / (p - 0.378 * es)
+    """
+    np.add(sst, 243.5, out=tmp)
+    np.multiply(sst, 17.67, out=out)
+    np.divide(out, tmp, out=out)
+    np.exp(out, out=out)
+    np.multiply(out, 6.112, out=out)
+    np.multiply(out, -0.378, out=tmp)
+    np.add(tmp, pressure, out=tmp)
+    np.multiply(out, 622.0, out=out)
+    np.divide(out, tmp, out=out)
+
+
+def humidity_deficit(out, tmp, sst, q, pressure=1013.25):
+    """
+    QS - Q in g/kg, QS from saturation_humidity
+    """
+    saturation_humidity(out, tmp, sst, pressure)
+    np.subtract(out, q, out=out)
+
+
+def wind_product(out, tmp, w, component):
+    """
+    W * U or W * V, the wind stress proxy of group 5
+    """
+    np.multiply(w, component, out=out)
+
+
+def wind_cubed(out, tmp, w):
+    """
+    W^3
+    """
+    np.multiply(w, w, out=out)
+    np.multiply(out, w, out=out)
+
+
+# name -> (function, default input columns)
+DERIVED_VARIABLES = {
+    'saturation_humidity': (saturation_humidity, ['sea_surface_temp_mean']),
+    'humidity_deficit': (humidity_deficit, ['sea_surface_temp_mean', 'specific_humidity_mean']),
+    'wind_stress_u': (wind_product, ['wind_speed_mean', 'wind_u_component_mean']),
+    'wind_stress_v': (wind_product, ['wind_speed_mean', 'wind_v_component_mean']),
+    'wind_cubed': (wind_cubed, ['wind_speed_mean']),
+}
+
+
+def derive_column(store_path, split, output_column, function, inputs, chunk_rows=DEFAULT_CHUNK_ROWS, dtype='float32', **params):
+    """
+    evaluates function chunk by chunk over input columns of a split and streams the result to a new column
+    function(out, tmp, *input_chunks, **params) has to write its result into out and may use tmp as scratch;
+    both buffers are allocated once and reused for every chunk, the inputs are read straight from the memory
+    mapped columns, so peak memory does not depend on the split size
+    missing values are NaN in the column store and propagate through the arithmetic, so a derived value is NaN
+    wherever one of its inputs is missing
+    Args:
+        store_path (str): path to the column store
+        split (str): group split (e.g., "3")
+        output_column (str): name of the new column, an existing column of that name is replaced
+        function (callable): vectorized kernel, see above
+        inputs (list): input column names
+        chunk_rows (int): rows per chunk
+        dtype (str): dtype of the buffers and the stored column
+    Returns:
+        int: number of rows written
+    """
+    meta = load_column_store_meta(store_path, split)
+    store = load_column_store(store_path, split, inputs)
+    num_rows = meta['num_rows']
+
+    out = np.empty(chunk_rows, dtype=dtype)
+    tmp = np.empty(chunk_rows, dtype=dtype)
+    chunk_inputs = [np.empty(chunk_rows, dtype=dtype) for _ in inputs]
+
+    path = os.path.join(store_path, split, f"{output_column}.bin")
+    with open(path + ".tmp", 'wb') as f:
+        for start in range(0, num_rows, chunk_rows):
+            stop = min(start + chunk_rows, num_rows)
+            n = stop - start
+            for buffer, column in zip(chunk_inputs, inputs):
+                buffer[:n] = store[column][start:stop]
+            function(out[:n], tmp[:n], *(buffer[:n] for buffer in chunk_inputs), **params)
+            out[:n].tofile(f)
+    os.replace(path + ".tmp", path)
+
+    # re-read so a concurrent writer of another derived column is not overwritten
+    meta = load_column_store_meta(store_path, split)
+    meta['dtypes'][output_column] = np.dtype(dtype).newbyteorder('<').str
+    meta.setdefault('derived', {})[output_column] = {
+        'function': function.__name__,
+        'inputs': list(inputs),
+        'params': params,
+    }
+    with open(os.path.join(store_path, split, STORE_META_FILENAME), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+
+    print(f"Derived column {output_column} of split {split}: {num_rows:,} rows from {inputs}")
+    return num_rows
+
+
+def derive_variable(store_path, split, name, output_column=None, inputs=None, chunk_rows=DEFAULT_CHUNK_ROWS, **params):
+    """
+    derives one of DERIVED_VARIABLES (e.g. "humidity_deficit") into a new column of a split
+    Args:
+        name (str): derived variable
+        output_column (str): column name, defaults to "derived_{name}"
+        inputs (list): input columns, defaults to the *_mean statistics (e.g. pass the *_median columns instead)
+        params: keyword parameters of the formula (e.g. pressure=1010.0 for the humidity variables)
+    Returns:
+        int: number of rows written
+    """
+    if name not in DERIVED_VARIABLES:
+        raise ValueError(f"Unknown derived variable: {name}. Available: {list(DERIVED_VARIABLES)}")
+    function, default_inputs = DERIVED_VARIABLES[name]
+    return derive_column(store_path, split, output_column or f"derived_{name}", function,
+                         inputs or default_inputs, chunk_rows=chunk_rows, **params)
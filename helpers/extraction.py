@@ -3,9 +3,13 @@ import tarfile
 import os
 import tempfile
 import gzip
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
-from datasets import Dataset, DatasetDict, concatenate_datasets
+import pyarrow as pa
+from datasets import Dataset, DatasetDict, Features, concatenate_datasets
+from helpers.metrics import QUIET
 
 base_dir = r"enter/base/dir/here"
 
@@ -63,6 +67,12 @@ filelist_g9 = [
     'MSG1_R3.0.0_ENH_G9_2010-2019.tar',
 ]
 
+# missing value marker used by the FORTRAN routines (coded value 0)
+FMISS = -9999.0
+
+# key of the packed 64 byte records in a decoded table (decode_msg1_buffer(..., keep_raw=True))
+RAW_RECORD_COLUMN = 'raw_record'
+
 # group variable definitions based on FORTRAN FORMAT strings
 GROUP_DEFINITIONS = {
     3: {
@@ -416,27 +426,144 @@ def create_record_columns(ftrue, group, source_file):
     
     return record
 
-def parse_tar_file(tar_path):
+def msg1_record_view(data):
+    """
+    views a decompressed MSG.1 buffer as an (N, 64) uint8 array without copying
+    trailing bytes that do not form a complete 64 byte record are ignored (same as the scalar loop)
+    """
+    n_records = len(data) // 64
+    return np.frombuffer(data, dtype=np.uint8, count=n_records * 64).reshape(n_records, 64)
+
+def unpack_msg1_records(records):
+    """
+    vectorized version of unpack_msg1_record for an (N, 64) uint8 array of records
+    returns an (N, 50) int32 array of coded values, column 0 is unused to keep the FORTRAN indexing
+    """
+    n_records = records.shape[0]
+    chars = records.astype(np.int32)
+    coded = np.zeros((n_records, 50), dtype=np.int32)
+    
+    # packed header bit fields - positions 1-9
+    coded[:, 1] = chars[:, 2]
+    coded[:, 2] = chars[:, 3] // 16
+    coded[:, 3] = (chars[:, 3] % 16) // 2
+    coded[:, 4] = ((chars[:, 3] % 2) * 256 + chars[:, 4]) * 2 + chars[:, 5] // 128
+    coded[:, 5] = (chars[:, 5] % 128) * 4 + chars[:, 6] // 64
+    coded[:, 6] = (chars[:, 6] % 64) // 8
+    coded[:, 7] = chars[:, 6] % 8
+    coded[:, 8] = chars[:, 7] // 16
+    coded[:, 9] = chars[:, 7] % 16
+    
+    # 16-bit big endian values - positions 10-33
+    coded[:, 10:34] = np.ascontiguousarray(records[:, 8:56]).view('>u2')
+    
+    # 4-bit nibbles - positions 34-49 (high nibble first)
+    nibbles = records[:, 56:64]
+    coded[:, 34:50:2] = nibbles // 16
+    coded[:, 35:50:2] = nibbles % 16
+    
+    return coded
+
+def convert_to_true_values_batch(coded, group):
+    """
+    vectorized version of convert_to_true_values for an (N, 50) array of coded values of a single group
+    """
+    fbase, funits = get_scaling_factors(group)
+    fbase = np.asarray(fbase, dtype=np.float64)
+    funits = np.asarray(funits, dtype=np.float64)
+    
+    ftrue = (coded + fbase) * funits
+    
+    # checksum is passed through unscaled
+    ftrue[:, 0] = 0
+    ftrue[:, 9] = coded[:, 9]
+    
+    # data values (positions 10-49), coded 0 means missing
+    data = ftrue[:, 10:50]
+    data[coded[:, 10:50] == 0] = FMISS
+    
+    return ftrue
+
+def create_record_columns_batch(ftrue, group, source_file):
+    """
+    creates a columnar table (dict of numpy arrays) with the same columns and values as create_record_columns
+    """
+    group_def = GROUP_DEFINITIONS.get(group, GROUP_DEFINITIONS[3])
+    var_names = group_def['variables']
+    
+    columns = {
+        'year': ftrue[:, 1].astype(np.int64),
+        'month': ftrue[:, 2].astype(np.int64),
+        'longitude': ftrue[:, 4].copy(),
+        'latitude': ftrue[:, 5].copy(),
+        'box_size_degrees': ftrue[:, 3].copy(),
+        'platform_id1': ftrue[:, 6].copy(),
+        'platform_id2': ftrue[:, 7].copy(),
+        'data_group': ftrue[:, 8].astype(np.int64),
+        'checksum': ftrue[:, 9].astype(np.int64),
+        'source_file': np.full(len(ftrue), source_file, dtype=object),
+    }
+    
+    for i, (var_key, var_name) in enumerate(var_names.items(), 1):
+        columns[f'{var_name}_tercile1'] = ftrue[:, 9 + i].copy()     # S1 (positions 10-13)
+        columns[f'{var_name}_median'] = ftrue[:, 13 + i].copy()      # S3 (positions 14-17)
+        columns[f'{var_name}_tercile3'] = ftrue[:, 17 + i].copy()    # S5 (positions 18-21)
+        columns[f'{var_name}_mean'] = ftrue[:, 21 + i].copy()        # M  (positions 22-25)
+    
+    return columns
+
+def decode_msg1_buffer(data, source_file, keep_raw=False):
+    """
+    decodes a whole decompressed MSG.1 file at once
+    returns a dict {group: columns} with one columnar table per data group found in the buffer,
+    rows keep their original file order within each group
+    keep_raw=True adds the packed (n, 64) uint8 records of each group under RAW_RECORD_COLUMN
+    """
+    records = msg1_record_view(data)
+    
+    # same record filter as the scalar path
+    records = records[(records[:, 1] % 16) == 1]
+    
+    coded = unpack_msg1_records(records)
+    groups = coded[:, 8]
+    
+    tables = {}
+    for group in pd.unique(groups):
+        group = int(group)
+        group_coded = coded[groups == group]
+        ftrue = convert_to_true_values_batch(group_coded, group)
+        tables[group] = create_record_columns_batch(ftrue, group, source_file)
+        if keep_raw:
+            tables[group][RAW_RECORD_COLUMN] = records[groups == group]
+    
+    return tables
+
+def concatenate_columns(tables):
+    """
+    concatenates a list of columnar tables with identical columns
+    """
+    if len(tables) == 1:
+        return tables[0]
+    return {col: np.concatenate([table[col] for table in tables]) for col in tables[0]}
+
+def get_group_from_filename(tar_path):
+    """
+    group number extraction from a MSG1_R3.0.0_ENH_G*_*.tar filename
+    """
+    for group in GROUP_DEFINITIONS:
+        if f'_G{group}_' in tar_path:
+            return group
+    raise ValueError(f"Unknown group in filename: {tar_path}")
+
+def parse_tar_file(tar_path, metrics=None):
     """
     Parse a single tar file and return list of records
+    per member progress goes to metrics (see helpers.metrics), nothing is printed per member in quiet mode
     """
+    metrics = metrics or QUIET
     print(f"Processing: {os.path.basename(tar_path)}")
     
-    # group number extraction form filename
-    if '_G3_' in tar_path:
-        expected_group = 3
-    elif '_G4_' in tar_path:
-        expected_group = 4
-    elif '_G5_' in tar_path:
-        expected_group = 5
-    elif '_G6_' in tar_path:
-        expected_group = 6
-    elif '_G7_' in tar_path:
-        expected_group = 7
-    elif '_G9_' in tar_path:
-        expected_group = 9
-    else:
-        raise ValueError(f"Unknown group in filename: {tar_path}")
+    expected_group = get_group_from_filename(tar_path)
     
     print(f"Expected group: {expected_group} - {GROUP_DEFINITIONS[expected_group]['name']}")
     
@@ -452,39 +579,251 @@ def parse_tar_file(tar_path):
                     if file.endswith('.gz'):
                         gz_files.append(os.path.join(root, file))
             
+            # os.walk order depends on the filesystem, sorting keeps the record order reproducible
+            gz_files.sort()
+            
             print(f"Found {len(gz_files)} monthly files")
             
             for gz_file in gz_files:
                 try:
-                    with gzip.open(gz_file, 'rb') as f:
-                        data = f.read()
+                    with metrics.stage('gunzip', nbytes=os.path.getsize(gz_file)):
+                        with gzip.open(gz_file, 'rb') as f:
+                            data = f.read()
+                    metrics.count('bytes_read', os.path.getsize(gz_file))
                     
                     file_records = 0
-                    for offset in range(0, len(data), 64):
-                        if offset + 64 > len(data):
-                            break
-                            
-                        record_bytes = data[offset:offset+64]
-                        
-                        if len(record_bytes) == 64 and (record_bytes[1] % 16) == 1:
-                            coded = unpack_msg1_record(record_bytes)
-                            if coded:
-                                actual_group = coded[8]
-                                
-                                ftrue = convert_to_true_values(coded, actual_group)
+                    with metrics.stage('decode', nbytes=len(data)) as stage:
+                        for offset in range(0, len(data), 64):
+                            if offset + 64 > len(data):
+                                break
                                 
-                                record = create_record_columns(ftrue, actual_group, os.path.basename(gz_file))
-                                
-                                records.append(record)
-                                file_records += 1
+                            record_bytes = data[offset:offset+64]
+                            
+                            if len(record_bytes) == 64 and (record_bytes[1] % 16) == 1:
+                                coded = unpack_msg1_record(record_bytes)
+                                if coded:
+                                    actual_group = coded[8]
+                                    
+                                    ftrue = convert_to_true_values(coded, actual_group)
+                                    
+                                    record = create_record_columns(ftrue, actual_group, os.path.basename(gz_file))
+                                    
+                                    records.append(record)
+                                    file_records += 1
+                        stage['records'] = file_records
                     
-                    print(f"{os.path.basename(gz_file)}: {file_records} records")
+                    metrics.count('records_decoded', file_records)
+                    metrics.count('records_rejected', len(data) // 64 - file_records)
+                    metrics.event('member', member=os.path.basename(gz_file), records=file_records)
                     
                 except Exception as e:
                     print(f"Error processing {os.path.basename(gz_file)}: {e}")
     
     return records
 
+def iter_tar_record_batches(tar_path, block_size=64 * 65536):
+    """
+    streams a MSG.1 tar file member by member without extracting it to disk
+    each monthly .gz member is decompressed incrementally in blocks of block_size bytes (rounded down to whole
+    64 byte records) and decoded with decode_msg1_buffer, so peak memory is bounded by the block size
+    yields (member_name, tables, error) tuples where tables is a dict {group: columns} and error is None;
+    a truncated or corrupt member (gzip raises at the bad block or at the CRC/length check at its end) is
+    reported by a final (member_name, None, error) tuple after its good blocks, so callers must drop every
+    batch already received for that member to skip it as a whole like parse_tar_file does
+    (see parse_tar_file_columnar)
+    """
+    block_size = max(64, block_size - block_size % 64)
+    
+    # 'r|*' reads the archive strictly sequentially, no seeking or scratch files
+    with tarfile.open(tar_path, 'r|*') as tar:
+        for member in tar:
+            if not member.isfile() or not member.name.endswith('.gz'):
+                continue
+            
+            member_name = os.path.basename(member.name)
+            try:
+                with gzip.GzipFile(fileobj=tar.extractfile(member), mode='rb') as f:
+                    remainder = b''
+                    while True:
+                        block = f.read(block_size)
+                        if not block:
+                            break
+                        
+                        data = remainder + block if remainder else block
+                        usable = len(data) - len(data) % 64
+                        remainder = data[usable:]
+                        
+                        if usable:
+                            yield member_name, decode_msg1_buffer(memoryview(data)[:usable], member_name), None
+                    
+            except Exception as e:
+                yield member_name, None, f"{type(e).__name__}: {e}"
+
+def parse_tar_file_columnar(tar_path, block_size=64 * 65536):
+    """
+    Parse a single tar file with the vectorized streaming decoder and return a dict {group: columns}
+    the batches of a member are only kept once the member decoded completely, a corrupt member is skipped
+    as a whole (same as parse_tar_file), so at most one member is buffered
+    """
+    print(f"Processing: {os.path.basename(tar_path)}")
+    
+    expected_group = get_group_from_filename(tar_path)
+    
+    print(f"Expected group: {expected_group} - {GROUP_DEFINITIONS[expected_group]['name']}")
+    
+    group_tables = {}
+    member_records = {}
+    pending_member = None
+    pending = []
+    
+    def commit():
+        for tables in pending:
+            for group, columns in tables.items():
+                group_tables.setdefault(group, []).append(columns)
+                member_records[pending_member] += len(columns['year'])
+    
+    for member_name, tables, error in iter_tar_record_batches(tar_path, block_size):
+        if member_name != pending_member:
+            commit()
+            pending_member, pending = member_name, []
+            member_records[member_name] = 0
+        if error is not None:
+            print(f"Error processing {member_name}: {error}")
+            del member_records[member_name]
+            pending_member, pending = None, []
+            continue
+        pending.append(tables)
+    commit()
+    
+    print(f"Found {len(member_records)} monthly files")
+    for member_name, file_records in member_records.items():
+        print(f"{member_name}: {file_records} records")
+    
+    return {group: concatenate_columns(tables) for group, tables in group_tables.items()}
+
+def list_tar_members(tar_path):
+    """
+    lists the monthly .gz members of a MSG.1 tar file sorted by member path (same order as parse_tar_file)
+    returns (tar_path, member_name, offset, size) work units, offset points at the member data in the (uncompressed) tar
+    """
+    with tarfile.open(tar_path, 'r') as tar:
+        members = [member for member in tar.getmembers() if member.isfile() and member.name.endswith('.gz')]
+    
+    members.sort(key=lambda member: member.name)
+    return [(tar_path, os.path.basename(member.name), member.offset_data, member.size) for member in members]
+
+def decode_tar_member(unit, keep_raw=False):
+    """
+    worker function: reads one monthly member straight from its offset in the tar file and decodes it
+    returns (unit, tables, error) and never raises, so one bad member cannot kill a process pool
+    """
+    tar_path, member_name, offset, size = unit
+    try:
+        with open(tar_path, 'rb') as f:
+            f.seek(offset)
+            raw = f.read(size)
+        return unit, decode_msg1_buffer(gzip.decompress(raw), member_name, keep_raw), None
+    except Exception as e:
+        return unit, None, f"{type(e).__name__}: {e}"
+
+def iter_tar_members_parallel(tar_paths, workers=None, keep_raw=False):
+    """
+    decodes all monthly members of the given tar files on a process pool
+    results are yielded as (unit, tables, error) in the same order as a serial run (tar file order, then member path order)
+    """
+    units = []
+    for tar_path in tar_paths:
+        units.extend(list_tar_members(tar_path))
+    
+    return iter_units_parallel(units, workers, keep_raw)
+
+def iter_units_parallel(units, workers=None, keep_raw=False):
+    """
+    decodes the given (tar_path, member_name, offset, size) work units on a process pool and yields
+    (unit, tables, error) in input order, at most 2 * workers members are in flight so memory stays bounded;
+    workers=1 decodes in-process
+    """
+    workers = workers or os.cpu_count() or 1
+    
+    if workers == 1:
+        for unit in units:
+            yield decode_tar_member(unit, keep_raw)
+        return
+    
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        window = 2 * workers
+        pending = deque(executor.submit(decode_tar_member, unit, keep_raw) for unit in units[:window])
+        
+        for unit in units[window:]:
+            yield pending.popleft().result()
+            pending.append(executor.submit(decode_tar_member, unit, keep_raw))
+        
+        while pending:
+            yield pending.popleft().result()
+
+def parse_all_groups_parallel_hf(base_directory, file_list, output_path=None, chunk_size=50000, workers=None):
+    """
+    parallel version of parse_all_groups_optimized_hf
+    fans the monthly members of all tar files out over a process pool and merges the decoded columns per group
+    in serial order, so the saved datasets have the same row order as a single process run
+    """
+    print("="*80)
+    print("ICOADS MSG.1 MULTI-GROUP PARSER (HUGGINGFACE PARALLEL)")
+    print("="*80)
+    
+    if output_path is None:
+        print("ERROR: No output path given")
+        return None, None
+    
+    try:
+        output_path = validate_and_create_path(output_path)
+    except OSError as e:
+        print(f"ERROR: {e}")
+        return None, None
+    
+    tar_paths = []
+    for filename in file_list:
+        tar_path = os.path.join(base_directory, filename)
+        if not os.path.exists(tar_path):
+            print(f"ERROR: File not found: {tar_path}")
+            return None, None
+        tar_paths.append(tar_path)
+    
+    total_records = 0
+    failed_members = []
+    group_buffers = {}
+    group_datasets = {}
+    
+    def flush_group(group):
+        chunk_df = process_chunk_hf(concatenate_columns(group_buffers.pop(group)))
+        if not chunk_df.empty:
+            group_datasets.setdefault(group, []).append(Dataset.from_pandas(chunk_df, preserve_index=False))
+    
+    for (tar_path, member_name, offset, size), tables, error in iter_tar_members_parallel(tar_paths, workers):
+        if error is not None:
+            print(f"Error processing {os.path.basename(tar_path)}/{member_name}: {error}")
+            failed_members.append((tar_path, member_name))
+            continue
+        
+        for group, columns in tables.items():
+            group_buffers.setdefault(group, []).append(columns)
+            total_records += len(columns['year'])
+            
+            if sum(len(table['year']) for table in group_buffers[group]) >= chunk_size:
+                flush_group(group)
+    
+    for group in list(group_buffers):
+        flush_group(group)
+    
+    print(f"\n{'='*60}")
+    print(f"PROCESSING COMPLETE")
+    print(f"Total records processed: {total_records:,}")
+    if failed_members:
+        print(f"Failed members: {len(failed_members)}")
+    print(f"{'='*60}")
+    
+    return combine_and_save_group_datasets(group_datasets, output_path)
+
 def validate_and_create_path(path):
     path = os.path.normpath(path)
     
@@ -512,8 +851,14 @@ def validate_and_create_path(path):
     return path
 
 
-def parse_all_groups_optimized_hf(base_directory, file_list, output_path=None, chunk_size=50000, separate_groups=True):
-    """Parse all group files with extensive debugging"""
+def parse_all_groups_optimized_hf(base_directory, file_list, output_path=None, chunk_size=50000, separate_groups=True,
+                                  metrics=None):
+    """
+    Parse all group files
+    per member and per chunk progress, stage timings and the RSS high-water mark per group go to metrics
+    (a helpers.metrics.PipelineMetrics), the default quiet mode only prints per tar file
+    """
+    metrics = metrics or QUIET
     print("="*80)
     print("ICOADS MSG.1 MULTI-GROUP PARSER (HUGGINGFACE OPTIMIZED)")
     print("="*80)
@@ -548,7 +893,7 @@ def parse_all_groups_optimized_hf(base_directory, file_list, output_path=None, c
         print(f"{'='*60}")
         
         try:
-            records = parse_tar_file(tar_path)
+            records = parse_tar_file(tar_path, metrics)
             print(f"✓ Extracted {len(records)} records from {filename}")
             
             if not records:
@@ -562,44 +907,42 @@ def parse_all_groups_optimized_hf(base_directory, file_list, output_path=None, c
         chunk_buffer.extend(records)
         total_records += len(records)
         
-        print(f"Records from this file: {len(records):,}")
-        print(f"Total records so far: {total_records:,}")
-        print(f"Buffer size: {len(chunk_buffer):,}")
+        metrics.event('tar_file', tar=filename, records=len(records), total_records=total_records,
+                      buffered=len(chunk_buffer))
         
         while len(chunk_buffer) >= chunk_size:
             chunk_records = chunk_buffer[:chunk_size]
             chunk_buffer = chunk_buffer[chunk_size:]
             
-            print(f"\n--- Processing chunk of {len(chunk_records)} records ---")
-            
             try:
-                chunk_df = process_chunk_hf(chunk_records)
-                
-                if chunk_df.empty:
-                    print("ERROR: Chunk DataFrame is empty after processing!")
-                    continue
-                
-                print("Converting DataFrame to HuggingFace Dataset...")
-                chunk_dataset = Dataset.from_pandas(chunk_df, preserve_index=False)
-                print(f"✓ Created HF Dataset with {len(chunk_dataset)} records")
-                
-                if separate_groups:
-                    unique_groups = chunk_df['data_group'].unique()
-                    print(f"Found groups in chunk: {unique_groups}")
+                with metrics.stage('chunk', records=len(chunk_records)):
+                    with metrics.stage('process_chunk_hf', records=len(chunk_records)):
+                        chunk_df = process_chunk_hf(chunk_records, metrics)
                     
-                    for group in unique_groups:
-                        group_data = chunk_df[chunk_df['data_group'] == group]
-                        print(f"Group {group}: {len(group_data)} records")
+                    if chunk_df.empty:
+                        print("ERROR: Chunk DataFrame is empty after processing!")
+                        continue
+                    
+                    with metrics.stage('Dataset.from_pandas', records=len(chunk_df)):
+                        chunk_dataset = Dataset.from_pandas(chunk_df, preserve_index=False)
+                    
+                    if separate_groups:
+                        unique_groups = chunk_df['data_group'].unique()
                         
-                        if len(group_data) > 0:
-                            group_dataset = Dataset.from_pandas(group_data, preserve_index=False)
+                        for group in unique_groups:
+                            group_data = chunk_df[chunk_df['data_group'] == group]
                             
-                            if group not in group_datasets:
-                                group_datasets[group] = []
-                            group_datasets[group].append(group_dataset)
-                            print(f"✓ Added to Group {group} datasets (now {len(group_datasets[group])} chunks)")
-                
-                print(f"✓ Processed chunk of {len(chunk_dataset):,} records")
+                            if len(group_data) > 0:
+                                with metrics.stage('group_from_pandas', group=int(group), records=len(group_data)):
+                                    group_dataset = Dataset.from_pandas(group_data, preserve_index=False)
+                                
+                                if group not in group_datasets:
+                                    group_datasets[group] = []
+                                group_datasets[group].append(group_dataset)
+                                metrics.count('records', len(group_data), group=int(group))
+                                metrics.sample_rss(int(group))
+                    
+                    metrics.event('chunk', records=len(chunk_dataset))
                 del chunk_df, chunk_dataset, chunk_records
                 
             except Exception as e:
@@ -609,9 +952,9 @@ def parse_all_groups_optimized_hf(base_directory, file_list, output_path=None, c
                 continue
     
     if chunk_buffer:
-        print(f"\n--- Processing final chunk of {len(chunk_buffer)} records ---")
         try:
-            chunk_df = process_chunk_hf(chunk_buffer)
+            with metrics.stage('process_chunk_hf', records=len(chunk_buffer)):
+                chunk_df = process_chunk_hf(chunk_buffer, metrics)
             
             if not chunk_df.empty:
                 final_dataset = Dataset.from_pandas(chunk_df, preserve_index=False)
@@ -621,11 +964,14 @@ def parse_all_groups_optimized_hf(base_directory, file_list, output_path=None, c
                     for group in unique_groups:
                         group_data = chunk_df[chunk_df['data_group'] == group]
                         if len(group_data) > 0:
-                            group_dataset = Dataset.from_pandas(group_data, preserve_index=False)
+                            with metrics.stage('group_from_pandas', group=int(group), records=len(group_data)):
+                                group_dataset = Dataset.from_pandas(group_data, preserve_index=False)
                             
                             if group not in group_datasets:
                                 group_datasets[group] = []
                             group_datasets[group].append(group_dataset)
+                            metrics.count('records', len(group_data), group=int(group))
+                            metrics.sample_rss(int(group))
                 
                 print(f"✓ Processed final chunk of {len(final_dataset):,} records")
                 del chunk_df, final_dataset
@@ -637,6 +983,16 @@ def parse_all_groups_optimized_hf(base_directory, file_list, output_path=None, c
     print(f"Total records processed: {total_records:,}")
     print(f"{'='*60}")
     
+    with metrics.stage('save'):
+        result = combine_and_save_group_datasets(group_datasets, output_path, separate_groups)
+    metrics.summary()
+    return result
+
+
+def combine_and_save_group_datasets(group_datasets, output_path, separate_groups=True):
+    """
+    concatenates the per-group dataset chunks and saves them as a DatasetDict keyed by group
+    """
     if separate_groups and group_datasets:
         print("\nCombining datasets by groups...")
         combined_datasets = {}
@@ -701,14 +1057,13 @@ def parse_all_groups_optimized_hf(base_directory, file_list, output_path=None, c
         return None, None
 
 
-def process_chunk_hf(records):    
+def process_chunk_hf(records, metrics=None):    
+    metrics = metrics or QUIET
     if not records:
         print("WARNING: Empty records passed to process_chunk_hf")
         return pd.DataFrame()
         
     df = pd.DataFrame(records)
-    print(f"DataFrame created with shape: {df.shape}")
-    print(f"Columns: {list(df.columns)}")
     
     if df.empty:
         print("ERROR: DataFrame is empty after creation!")
@@ -718,10 +1073,7 @@ def process_chunk_hf(records):
     
     essential_cols = ['year', 'month', 'data_group']
     for col in essential_cols:
-        if col in df.columns:
-            none_count = df[col].isna().sum()
-            print(f"Column {col}: {none_count} None values out of {len(df)}")
-        else:
+        if col not in df.columns:
             print(f"ERROR: Essential column {col} missing!")
     
     original_len = len(df)
@@ -729,7 +1081,7 @@ def process_chunk_hf(records):
         if col in df.columns:
             df = df.dropna(subset=[col])
     
-    print(f"After removing invalid rows: {len(df)} (removed {original_len - len(df)})")
+    metrics.count('rows_invalid', original_len - len(df))
     
     if len(df) == 0:
         print("ERROR: All rows removed due to missing essential data!")
@@ -740,7 +1092,6 @@ def process_chunk_hf(records):
     for col in ['year', 'month', 'data_group', 'checksum']:
         if col in df.columns:
             df[col] = df[col].astype(int)
-            print(f"Converted {col} to int, dtype: {df[col].dtype}")
     
     float_cols = df.select_dtypes(include=['float64', 'float32']).columns
     for col in float_cols:
@@ -750,49 +1101,53 @@ def process_chunk_hf(records):
         if col in df.columns:
             df[col] = df[col].astype(str)
     
-    print(f"Final DataFrame shape: {df.shape}")
-    print(f"=== CHUNK PROCESSING COMPLETE ===\n")
     return df
 
 
+def json_serializable_schema(schema):
+    """
+    schema with every integer column widened to int64 and every floating point column to float64,
+    the arrow types python int and float values round trip through
+    """
+    fields = []
+    for field in schema:
+        if pa.types.is_integer(field.type):
+            field = field.with_type(pa.int64())
+        elif pa.types.is_floating(field.type):
+            field = field.with_type(pa.float64())
+        fields.append(field)
+    return pa.schema(fields, metadata=schema.metadata)
+
 def ensure_json_serializable_types(dataset):
-    data_dict = {}
-    
-    df = dataset.to_pandas()
-    columns = df.columns.tolist()
-    
-    for col in columns:
-        data_dict[col] = []
-    
-    for i in range(len(dataset)):
-        row = dataset[i]
-        for col in columns:
-            value = row[col]            
-            if value is None:
-                native_value = None
-            elif isinstance(value, (np.int8, np.int16, np.int32, np.int64)):
-                native_value = int(value)
-            elif isinstance(value, (np.float16, np.float32, np.float64)):
-                native_value = float(value)
-            else:
-                native_value = value
-            
-            data_dict[col].append(native_value)
-    
-    return Dataset.from_dict(data_dict)
+    """
+    casts all integer columns to int64 and all floating point columns to float64, so every value reads back as a
+    native python int or float; the cast is a per column arrow cast, columns that already have the target type
+    are not touched and the dataset is returned as is if nothing has to change
+    """
+    schema = dataset.features.arrow_schema
+    target = json_serializable_schema(schema)
+    if target.equals(schema):
+        return dataset
+    return dataset.cast(Features.from_arrow_schema(target))
 
-def debug_dataset_types(dataset):
-    df = dataset.to_pandas()
+def debug_dataset_types(dataset, sample_rows=3):
+    """
+    prints the arrow and pandas type of every column and the python types of a few sampled values,
+    only the first sample_rows rows are materialized
+    """
+    sample = dataset.with_format("pandas")[:sample_rows]
     print("Dataset dtypes:")
-    for col, dtype in df.dtypes.items():
-        print(f"  {col}: {dtype}")
+    for field in dataset.features.arrow_schema:
+        print(f"  {field.name}: {field.type}")
         
-        if hasattr(dtype, 'type'):
-            print(f"    numpy type: {dtype.type}")
-        
-        sample_vals = df[col].dropna().head(3)
-        for val in sample_vals:
-            print(f"    sample value type: {type(val)}")
+        if field.name in sample.columns:
+            dtype = sample[field.name].dtype
+            print(f"    pandas dtype: {dtype}")
+            if hasattr(dtype, 'type'):
+                print(f"    numpy type: {dtype.type}")
+            
+            for val in sample[field.name].dropna():
+                print(f"    sample value type: {type(val)}")
         print()
 
 if __name__ == "__main__":
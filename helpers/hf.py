@@ -1,19 +1,58 @@
 """huggingface helper functions"""
-from datasets import load_from_disk, load_dataset as load_dataset_hf
+from datasets import Dataset, DatasetDict, load_from_disk, load_dataset as load_dataset_hf
+from datasets.table import ConcatenationTable, InMemoryTable
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as pads
 import os
+from collections import OrderedDict
+import json
+import numpy as np
+from helpers.column_store import STORE_INDEX_FILENAME, tile_grid
 
-def load_dataset(dataset_path="./hf_dataset", split=None):
+def load_dataset(dataset_path="./hf_dataset", split=None, columns=None, years=None, months=None,
+                 lat_range=None, lon_range=None, not_missing=None):
     """
     Load HuggingFace dataset
     Args:
-        dataset_path (str): path to saved HF dataset
+        dataset_path (str): path to saved HF dataset (save_to_disk layout or per-group parquet directories)
         split (str): specific split to load (e.g., "3", "4"), if None loads all splits
+        columns (list): columns to load, if None loads all columns
+        years, months, lat_range, lon_range, not_missing: row filters, see build_filter_expression
     Returns:
         Dataset/DatasetDict: HuggingFace dataset
+    
+    Column selection and filters are pushed down to arrow: unselected columns are never decoded and for
+    parquet splits row groups whose statistics fall outside the filter are skipped.
     """
+    filter_expr = build_filter_expression(years, months, lat_range, lon_range, not_missing)
+    pushdown = columns is not None or filter_expr is not None
+    
     if os.path.exists(dataset_path):
         print("Loading HuggingFace dataset...")
-        dataset = load_from_disk(dataset_path)
+        parquet_files = find_parquet_splits(dataset_path)
+        if parquet_files:
+            # each group has its own schema, so every split is loaded as a separate parquet dataset
+            if split is not None and split in parquet_files:
+                parquet_files = {split: parquet_files[split]}
+            if pushdown:
+                dataset = DatasetDict({
+                    name: scan_parquet_split(os.path.dirname(files), columns, filter_expr)
+                    for name, files in parquet_files.items()
+                })
+            else:
+                dataset = DatasetDict({
+                    name: load_dataset_hf("parquet", data_files={name: files}, split=name)
+                    for name, files in parquet_files.items()
+                })
+        else:
+            dataset = load_from_disk(dataset_path)
+            if pushdown:
+                if isinstance(dataset, dict):
+                    names = [split] if split is not None and split in dataset else list(dataset)
+                    dataset = DatasetDict({name: scan_arrow_split(dataset[name], columns, filter_expr) for name in names})
+                else:
+                    dataset = scan_arrow_split(dataset, columns, filter_expr)
         
         if split is not None:
             if isinstance(dataset, dict) and split in dataset:
@@ -29,28 +68,369 @@ def load_dataset(dataset_path="./hf_dataset", split=None):
         return None
 
 
-# cache dictionary to store loaded datasets
-_icoads_cache = {}
+def build_filter_expression(years=None, months=None, lat_range=None, lon_range=None, not_missing=None):
+    """
+    Build an arrow filter expression from simple row filters
+    Args:
+        years (tuple): (first, last) year, inclusive
+        months (list): months 1-12 to keep
+        lat_range (tuple): (min, max) latitude, inclusive
+        lon_range (tuple): (min, max) longitude in degrees east, inclusive, wraps around if min > max
+        not_missing (list): columns that must not be missing (FMISS / null)
+    Returns:
+        pyarrow.dataset.Expression or None if no filter is given
+    """
+    conditions = []
+    if years is not None:
+        conditions.append((pads.field("year") >= years[0]) & (pads.field("year") <= years[1]))
+    if months is not None:
+        conditions.append(pads.field("month").isin(list(months)))
+    if lat_range is not None:
+        conditions.append((pads.field("latitude") >= lat_range[0]) & (pads.field("latitude") <= lat_range[1]))
+    if lon_range is not None:
+        east = pads.field("longitude") >= lon_range[0]
+        west = pads.field("longitude") <= lon_range[1]
+        conditions.append((east & west) if lon_range[0] <= lon_range[1] else (east | west))
+    for column in not_missing or []:
+        conditions.append(pads.field(column).is_valid())
+    
+    if not conditions:
+        return None
+    expression = conditions[0]
+    for condition in conditions[1:]:
+        expression = expression & condition
+    return expression
+
+
+def scan_parquet_split(split_dir, columns=None, filter_expr=None):
+    """
+    reads a parquet split with column projection and row group skipping
+    """
+    table = pads.dataset(split_dir, format="parquet").to_table(columns=columns, filter=filter_expr)
+    return Dataset(table)
+
+
+def scan_arrow_split(dataset, columns=None, filter_expr=None):
+    """
+    projects and filters a memory-mapped (load_from_disk) split
+    without a filter the result is a zero-copy view of the selected columns that stays memory-mapped; with a filter
+    the referenced columns are paged in and the matching rows are copied into an in-memory table
+    """
+    if filter_expr is None:
+        return dataset if columns is None else dataset.select_columns(list(columns))
+    table = pads.dataset(dataset.data.table).to_table(columns=columns, filter=filter_expr)
+    return Dataset(table)
+
+
+def add_date_string(dataset):
+    """
+    Add the "YYYY-MM" date_string column to a split written with the compact schema (which does not store it)
+    """
+    if "date_string" in dataset.column_names:
+        return dataset
+    table = dataset.with_format("arrow")[:]
+    year = pc.cast(pc.cast(table["year"], pa.int64()), pa.string())
+    month = pc.utf8_lpad(pc.cast(pc.cast(table["month"], pa.int64()), pa.string()), 2, "0")
+    date_string = pc.binary_join_element_wise(year, month, "-")
+    return Dataset(table.append_column("date_string", date_string))
+
+
+def find_parquet_splits(dataset_path):
+    """
+    finds per-group parquet files as written by GroupArrowWriter(file_format="parquet")
+    Returns:
+        dict: {split: parquet glob} or an empty dict if the path uses the save_to_disk layout
+    """
+    if os.path.exists(os.path.join(dataset_path, "dataset_dict.json")):
+        return {}
+    
+    data_files = {}
+    for split in sorted(os.listdir(dataset_path)):
+        split_dir = os.path.join(dataset_path, split)
+        if os.path.isdir(split_dir) and any(f.endswith(".parquet") for f in os.listdir(split_dir)):
+            data_files[split] = os.path.join(split_dir, "*.parquet")
+    return data_files
+
+
+def load_column_store(store_path="./icoads_store", split=None, columns=None):
+    """
+    Load the memory-mapped column store written by ColumnStoreWriter
+    Args:
+        store_path (str): path to the column store
+        split (str): specific split to load (e.g., "3", "4"), if None loads all splits
+        columns (list): columns to map, if None maps all columns of the split
+    Returns:
+        dict: {column: read-only numpy memmap} for a split, or {split: {column: memmap}} for all splits;
+              nothing is copied into memory until the arrays are actually read
+    """
+    if not os.path.exists(store_path):
+        print("Column store not found.")
+        return None
+    
+    splits = sorted(name for name in os.listdir(store_path)
+                    if os.path.exists(os.path.join(store_path, name, "meta.json")))
+    
+    if split is not None:
+        if split not in splits:
+            print(f"Split '{split}' not found. Available splits: {splits}")
+            return None
+        splits = [split]
+    
+    store = {}
+    for name in splits:
+        with open(os.path.join(store_path, name, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        
+        selected = meta["dtypes"] if columns is None else columns
+        group_columns = {}
+        for column in selected:
+            if column not in meta["dtypes"]:
+                raise KeyError(f"Column '{column}' not in split '{name}'. Available columns: {list(meta['dtypes'])}")
+            path = os.path.join(store_path, name, f"{column}.bin")
+            if meta["num_rows"] == 0:
+                group_columns[column] = np.empty(0, dtype=meta["dtypes"][column])
+            else:
+                group_columns[column] = np.memmap(path, dtype=meta["dtypes"][column], mode="r", shape=(meta["num_rows"],))
+        store[name] = group_columns
+    
+    return store[split] if split is not None else store
+
+
+def load_column_store_meta(store_path, split):
+    """
+    Load the metadata of a column store split (row count, dtypes and the source file dictionary)
+    """
+    with open(os.path.join(store_path, split, "meta.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def query_column_store(store_path, split, columns, lat_range=None, lon_range=None, years=None, months=None):
+    """
+    Read only the rows of a column store split that fall into a lat/lon box and time range
+    Args:
+        store_path (str): path to the column store
+        split (str): group split (e.g., "3")
+        columns (list): columns to return
+        lat_range (tuple): (min, max) latitude in degrees, inclusive, None for all
+        lon_range (tuple): (min, max) longitude in degrees east [0, 360), inclusive, wraps around if min > max
+        years (tuple): (first, last) year, inclusive, None for all
+        months (list): months 1-12 to keep, None for all
+    Returns:
+        dict: {column: numpy array} with the matching rows in (year, month, tile) order
+    """
+    meta = load_column_store_meta(store_path, split)
+    if "index_tile_degrees" not in meta:
+        raise ValueError(f"Split '{split}' has no spatio-temporal index, run build_time_tile_index first.")
+    
+    index = np.load(os.path.join(store_path, split, STORE_INDEX_FILENAME))
+    tile_degrees = float(index["tile_degrees"])
+    n_lat, n_lon = tile_grid(tile_degrees)
+    
+    # decoding the index keys is cheap, the data columns are only touched for the selected ranges
+    keys = index["keys"]
+    lon_tile = keys % n_lon
+    lat_tile = (keys // n_lon) % n_lat
+    time_index = keys // (n_lon * n_lat)
+    year, month = time_index // 12, time_index % 12 + 1
+    
+    selected = np.ones(len(keys), dtype=bool)
+    if years is not None:
+        selected &= (year >= years[0]) & (year <= years[1])
+    if months is not None:
+        selected &= np.isin(month, months)
+    if lat_range is not None:
+        tile_south = lat_tile * tile_degrees - 90.0
+        selected &= (tile_south + tile_degrees > lat_range[0]) & (tile_south <= lat_range[1])
+    if lon_range is not None:
+        tile_west = lon_tile * tile_degrees
+        in_east = (tile_west + tile_degrees > lon_range[0]) & (tile_west <= 360.0)
+        in_west = (tile_west >= 0.0) & (tile_west <= lon_range[1])
+        selected &= (in_east & in_west) if lon_range[0] <= lon_range[1] else (in_east | in_west)
+    
+    starts, stops = index["starts"][selected], index["stops"][selected]
+    
+    # merging adjacent ranges keeps the number of memmap slices small
+    if len(starts):
+        breaks = np.flatnonzero(starts[1:] != stops[:-1]) + 1
+        starts, stops = starts[np.r_[0, breaks]], stops[np.r_[breaks - 1, len(stops) - 1]]
+    
+    filter_columns = ["latitude", "longitude"] if (lat_range is not None or lon_range is not None) else []
+    store = load_column_store(store_path, split, list(dict.fromkeys(list(columns) + filter_columns)))
+    result = {
+        column: np.concatenate([store[column][start:stop] for start, stop in zip(starts, stops)])
+        if len(starts) else np.empty(0, dtype=store[column].dtype)
+        for column in store
+    }
+    
+    # tiles only bound the box, the exact test is done on the (few) rows that were read
+    mask = np.ones(len(result[columns[0]]), dtype=bool)
+    if lat_range is not None:
+        mask &= (result["latitude"] >= lat_range[0]) & (result["latitude"] <= lat_range[1])
+    if lon_range is not None:
+        lon = np.mod(result["longitude"], 360.0)
+        if lon_range[0] <= lon_range[1]:
+            mask &= (lon >= lon_range[0]) & (lon <= lon_range[1])
+        else:
+            mask &= (lon >= lon_range[0]) | (lon <= lon_range[1])
+    
+    return {column: result[column][mask] for column in columns}
+
+
+class ICOADSCache:
+    """
+    bounded LRU cache for loaded ICOADS subsets
+    entries are evicted least recently used first once max_entries or max_bytes (in-memory arrow bytes of the
+    cached datasets, see dataset_nbytes) is exceeded; None disables the respective limit
+    """
+
+    def __init__(self, max_entries=2, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def nbytes(self):
+        return sum(self.sizes.values())
+
+    def get(self, key):
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        self.sizes[key] = dataset_nbytes(value)
+        self._evict()
+
+    def _evict(self):
+        # the newest entry is always kept, even if it alone exceeds the byte budget
+        while len(self.entries) > 1 and (
+            (self.max_entries is not None and len(self.entries) > self.max_entries)
+            or (self.max_bytes is not None and self.nbytes > self.max_bytes)
+        ):
+            key, _ = self.entries.popitem(last=False)
+            del self.sizes[key]
+            self.evictions += 1
+            print(f"Evicted ICOADS subset '{key}' from cache")
+
+    def invalidate(self, split=None):
+        """
+        drops every entry of a split, i.e. the full subset key and all (split, columns, filter) keys,
+        or all entries if split is None
+        """
+        if split is None:
+            self.entries.clear()
+            self.sizes.clear()
+            return
+        for key in [k for k in self.entries if k == split or (isinstance(k, tuple) and k[0] == split)]:
+            del self.entries[key]
+            del self.sizes[key]
+
+    def info(self):
+        return {
+            "entries": list(self.entries),
+            "nbytes": self.nbytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+def dataset_nbytes(dataset):
+    """
+    in-memory arrow bytes behind a Dataset or DatasetDict; memory-mapped tables (load_from_disk, hub downloads)
+    count as 0, their pages belong to the OS page cache and not to the cache budget
+    """
+    if isinstance(dataset, dict):
+        return sum(dataset_nbytes(split) for split in dataset.values())
+    return table_nbytes(dataset.data) if hasattr(dataset, "data") else 0
+
+
+def table_nbytes(table):
+    if isinstance(table, ConcatenationTable):
+        return sum(table_nbytes(block) for row in table.blocks for block in row)
+    return table.nbytes if isinstance(table, InMemoryTable) else 0
 
-def load_icoads_subset(split: str, token: str = None):
+
+# cache of loaded subsets, bounded and least recently used first
+_icoads_cache = ICOADSCache()
+
+def configure_icoads_cache(max_entries=2, max_bytes=None):
+    """
+    Set the budget of the subset cache, entries over the new budget are evicted immediately
+    max_bytes only counts in-memory arrow data, memory-mapped subsets do not use the byte budget
+    """
+    _icoads_cache.max_entries = max_entries
+    _icoads_cache.max_bytes = max_bytes
+    _icoads_cache._evict()
+
+def invalidate_icoads_cache(split: str = None):
+    """
+    Drop all cached subsets of a split (full and column/filter subsets), or all subsets if split is None
+    """
+    _icoads_cache.invalidate(split)
+
+def icoads_cache_info():
+    """
+    Returns:
+        dict: cached splits, cached in-memory arrow bytes, budget and hit/miss/eviction counters
+    """
+    return _icoads_cache.info()
+
+def load_icoads_subset(split: str, token: str = None, columns: list = None, years: tuple = None,
+                       months: list = None, lat_range: tuple = None, lon_range: tuple = None,
+                       not_missing: list = None):
     """
     Load the specified ICOADS subset (Group 3–7 or 9).
-    Downloads and caches all subsets upon first use.
+    Only the requested group is downloaded and prepared; loaded groups are kept in a bounded LRU cache
+    (see configure_icoads_cache).
 
     Parameters:
         split (str): One of "3", "4", "5", "6", "7", or "9"
+        columns (list): columns to load, if None loads all columns
+        years, months, lat_range, lon_range, not_missing: row filters, see build_filter_expression
 
     Returns:
         DatasetDict: Hugging Face dataset for the given group
+    
+    Columns and filters are passed to the parquet reader, so unselected columns are never decoded and
+    row groups outside the filter are skipped; every combination is cached separately.
     """
     valid_splits = ["3", "4", "5", "6", "7", "9"]
     if split not in valid_splits:
         raise ValueError(f"Invalid split: {split}. Choose from {valid_splits}.")
 
-    if not _icoads_cache:
-        print("Downloading and caching all ICOADS subsets (Groups 3–7, 9)...")
-        for group in valid_splits:
-            dataset_name = f"leonhard-behr/msg1-enh-icoads-subset-{group}"
-            _icoads_cache[group] = load_dataset_hf(dataset_name, token=token)
+    filter_expr = build_filter_expression(years, months, lat_range, lon_range, not_missing)
+    cache_key = split
+    if columns is not None or filter_expr is not None:
+        cache_key = (split, tuple(columns) if columns is not None else None, str(filter_expr))
+
+    dataset = _icoads_cache.get(cache_key)
+    if dataset is None:
+        print(f"Downloading and caching ICOADS subset (Group {split})...")
+        dataset_name = f"leonhard-behr/msg1-enh-icoads-subset-{split}"
+        pushdown_kwargs = {}
+        if columns is not None:
+            pushdown_kwargs["columns"] = list(columns)
+        if filter_expr is not None:
+            pushdown_kwargs["filters"] = filter_expr
+        dataset = load_dataset_hf(dataset_name, token=token, **pushdown_kwargs)
+        _icoads_cache.put(cache_key, dataset)
     
-    return _icoads_cache[split]
+    return dataset
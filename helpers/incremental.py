@@ -0,0 +1,223 @@
+"""incremental, resumable ingestion of MSG.1 tar files into per-group arrow shards"""
+import os
+import json
+import tarfile
+from helpers.arrow_writer import (
+    write_arrow_shard,
+    write_dataset_dict_metadata,
+    write_split_metadata,
+)
+from helpers.extraction import iter_units_parallel, validate_and_create_path
+from helpers.metrics import QUIET
+
+MANIFEST_FILENAME = "manifest.jsonl"
+
+
+def load_manifest(output_path):
+    """
+    reads the append-only manifest of processed members
+    Returns:
+        dict: {"tar_name/member_name": entry}, later lines override earlier ones
+    """
+    manifest = {}
+    manifest_path = os.path.join(output_path, MANIFEST_FILENAME)
+    if not os.path.exists(manifest_path):
+        return manifest
+
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # a crash while appending can only truncate the last line
+                print(f"Warning: Skipping corrupt manifest line in {manifest_path}")
+                continue
+            manifest[member_key(entry["tar"], entry["member"])] = entry
+    return manifest
+
+
+def append_manifest_entry(output_path, entry):
+    """
+    durably appends one processed member to the manifest
+    """
+    with open(os.path.join(output_path, MANIFEST_FILENAME), "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, sort_keys=True) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def member_key(tar_name, member_name):
+    return f"{tar_name}/{member_name}"
+
+
+def shard_filename(tar_name, member_name):
+    tar_stem = os.path.splitext(tar_name)[0]
+    member_stem = member_name[:-len(".gz")] if member_name.endswith(".gz") else member_name
+    return f"{tar_stem}__{member_stem}.arrow"
+
+
+def list_member_entries(tar_path):
+    """
+    lists the monthly .gz members of a tar file with the metadata used for change detection
+    """
+    with tarfile.open(tar_path, "r") as tar:
+        members = [member for member in tar.getmembers() if member.isfile() and member.name.endswith(".gz")]
+
+    members.sort(key=lambda member: member.name)
+    return [
+        {
+            "tar": os.path.basename(tar_path),
+            "member": os.path.basename(member.name),
+            "offset": member.offset_data,
+            "size": member.size,
+            "mtime": member.mtime,
+            "chksum": member.chksum,
+        }
+        for member in members
+    ]
+
+
+def is_member_changed(entry, manifest):
+    """
+    a member has to be (re)processed if it is not in the manifest or its size, mtime or header checksum changed
+    """
+    previous = manifest.get(member_key(entry["tar"], entry["member"]))
+    if previous is None:
+        return True
+    return any(previous[field] != entry[field] for field in ("size", "mtime", "chksum"))
+
+
+def update_split_metadata(output_path, manifest):
+    """
+    points every group split at its shards, ordered by tar file and member name
+    data files that are not managed by the manifest (e.g. an existing save_to_disk split) are kept in front,
+    so an existing DatasetDict is extended by appending shards instead of being rebuilt
+    """
+    group_shards = {}
+    for key in sorted(manifest):
+        for group, shard in manifest[key]["shards"].items():
+            group_shards.setdefault(group, []).append(shard["filename"])
+
+    splits = []
+    for group, shard_files in group_shards.items():
+        split_path = os.path.join(output_path, group)
+
+        existing_files = []
+        state_path = os.path.join(split_path, "state.json")
+        if os.path.exists(state_path):
+            with open(state_path, "r", encoding="utf-8") as f:
+                existing_files = [data_file["filename"] for data_file in json.load(f)["_data_files"]]
+
+        managed = set(shard_files)
+        unmanaged = [
+            filename for filename in existing_files
+            if filename not in managed and os.path.exists(os.path.join(split_path, filename))
+        ]
+        write_split_metadata(split_path, unmanaged + shard_files)
+        splits.append(group)
+
+    if os.path.exists(os.path.join(output_path, "dataset_dict.json")):
+        with open(os.path.join(output_path, "dataset_dict.json"), "r", encoding="utf-8") as f:
+            splits = list(dict.fromkeys(json.load(f)["splits"] + splits))
+    write_dataset_dict_metadata(output_path, splits)
+
+
+def parse_all_groups_incremental(base_directory, file_list, output_path, workers=None, metrics=None):
+    """
+    resumable version of parse_all_groups_arrow
+    every monthly member is written as its own durable shard per group and recorded in a manifest, so a crashed run
+    or a newly published decade tarball only processes members that are new or changed since the last run
+    per member progress goes to metrics as 'member' and 'member_error' events (see helpers.metrics), nothing is
+    printed per member in quiet mode; the failed members are listed at the end
+    Args:
+        metrics: helpers.metrics.PipelineMetrics receiving the per member events and counters
+    Returns:
+        tuple: (output_path, {group: number of rows}) or (None, None) on failure
+    """
+    metrics = metrics or QUIET
+    print("="*80)
+    print("ICOADS MSG.1 MULTI-GROUP PARSER (INCREMENTAL)")
+    print("="*80)
+
+    try:
+        output_path = validate_and_create_path(output_path)
+    except OSError as e:
+        print(f"ERROR: {e}")
+        return None, None
+    os.makedirs(output_path, exist_ok=True)
+
+    entries = []
+    for filename in file_list:
+        tar_path = os.path.join(base_directory, filename)
+        if not os.path.exists(tar_path):
+            print(f"ERROR: File not found: {tar_path}")
+            return None, None
+        entries.extend((tar_path, entry) for entry in list_member_entries(tar_path))
+
+    manifest = load_manifest(output_path)
+    pending = [(tar_path, entry) for tar_path, entry in entries if is_member_changed(entry, manifest)]
+    print(f"Members: {len(entries)} total, {len(entries) - len(pending)} up to date, {len(pending)} to process")
+
+    units = [(tar_path, entry["member"], entry["offset"], entry["size"]) for tar_path, entry in pending]
+    failed_members = []
+
+    for (unit, tables, error), (tar_path, entry) in zip(iter_units_parallel(units, workers), pending):
+        if error is not None:
+            # not recorded in the manifest, so the member is retried on the next run
+            metrics.count('members_failed')
+            metrics.event('member_error', tar=entry["tar"], member=entry["member"], error=error)
+            failed_members.append((tar_path, entry["member"], error))
+            continue
+
+        filename = shard_filename(entry["tar"], entry["member"])
+        shards = {}
+        for group, columns in tables.items():
+            split_path = os.path.join(output_path, str(group))
+            os.makedirs(split_path, exist_ok=True)
+            write_arrow_shard(os.path.join(split_path, filename), group, columns)
+            shards[str(group)] = {"filename": filename, "rows": int(len(columns["year"]))}
+            metrics.count('records', shards[str(group)]["rows"], group=int(group))
+
+        # a changed member may no longer contain a group it had before
+        previous = manifest.get(member_key(entry["tar"], entry["member"]))
+        if previous is not None:
+            for group in set(previous["shards"]) - set(shards):
+                stale_path = os.path.join(output_path, group, previous["shards"][group]["filename"])
+                if os.path.exists(stale_path):
+                    os.remove(stale_path)
+
+        entry = {field: value for field, value in entry.items() if field != "offset"}
+        entry["shards"] = shards
+        append_manifest_entry(output_path, entry)
+        manifest[member_key(entry["tar"], entry["member"])] = entry
+        metrics.count('members_processed')
+        metrics.event('member', tar=entry["tar"], member=entry["member"],
+                      records=sum(shard["rows"] for shard in shards.values()),
+                      groups={group: shard["rows"] for group, shard in shards.items()})
+
+    if not any(entry["shards"] for entry in manifest.values()):
+        print("ERROR: No group datasets were created!")
+        return None, None
+
+    update_split_metadata(output_path, manifest)
+
+    group_rows = {}
+    for entry in manifest.values():
+        for group, shard in entry["shards"].items():
+            group_rows[int(group)] = group_rows.get(int(group), 0) + shard["rows"]
+
+    print(f"\n{'='*60}")
+    print(f"PROCESSING COMPLETE")
+    print(f"Processed members: {len(pending) - len(failed_members)}")
+    if failed_members:
+        print(f"Failed members: {len(failed_members)} (will be retried on the next run)")
+        for tar_path, member_name, error in failed_members:
+            print(f"  {os.path.basename(tar_path)}/{member_name}: {error}")
+    for group, rows in sorted(group_rows.items()):
+        print(f"  Group {group}: {rows:,} shard records")
+    print(f"{'='*60}")
+
+    return output_path, group_rows
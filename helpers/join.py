@@ -0,0 +1,119 @@
+"""cross-group joins of column store splits on the (year, month, lat, lon, box size) box key"""
+import numpy as np
+from helpers.column_store import BOX_KEY_BITS, BOX_KEY_COLUMN, decode_box_keys, tile_grid
+from helpers.hf import load_column_store, load_column_store_meta
+
+
+def split_tile_degrees(store_path, splits):
+    """
+    index tile size shared by all splits, box keys of splits indexed with different tile sizes are not comparable
+    """
+    tile_degrees = set()
+    for split in splits:
+        meta = load_column_store_meta(store_path, split)
+        if BOX_KEY_COLUMN not in meta['dtypes']:
+            raise ValueError(f"Split '{split}' has no box keys, run build_time_tile_index first.")
+        tile_degrees.add(float(meta['index_tile_degrees']))
+    if len(tile_degrees) != 1:
+        raise ValueError(f"Splits {list(splits)} are indexed with different tile sizes: {sorted(tile_degrees)}")
+    return tile_degrees.pop()
+
+
+def year_key_range(keys, years, tile_degrees):
+    """
+    row range (start, stop) of the sorted box keys that fall into the (first, last) year range, inclusive
+    """
+    if years is None:
+        return 0, len(keys)
+    n_lat, n_lon = tile_grid(tile_degrees)
+    first = (years[0] * 12 * n_lat * n_lon) << BOX_KEY_BITS
+    stop = ((years[1] + 1) * 12 * n_lat * n_lon) << BOX_KEY_BITS
+    return int(np.searchsorted(keys, first, side='left')), int(np.searchsorted(keys, stop, side='left'))
+
+
+def match_keys(sorted_keys, query_keys):
+    """
+    row of every query key in a sorted key column, -1 where the key is missing
+    duplicated keys resolve to their first row
+    """
+    rows = np.searchsorted(sorted_keys, query_keys, side='left')
+    found = rows < len(sorted_keys)
+    found[found] = sorted_keys[rows[found]] == query_keys[found]
+    return np.where(found, rows, -1)
+
+
+def take_rows(column, rows):
+    """
+    gathers rows of a memory-mapped column, -1 rows become NaN (integer columns are promoted to float64)
+    """
+    missing = rows < 0
+    if not missing.any():
+        return np.asarray(column[rows])
+    dtype = column.dtype if column.dtype.kind == 'f' else np.float64
+    values = np.full(len(rows), np.nan, dtype=dtype)
+    values[~missing] = column[rows[~missing]]
+    return values
+
+
+def lookup_boxes(store_path, split, keys, columns):
+    """
+    direct lookup of arbitrary box keys in one split
+    Returns:
+        dict: {column: array aligned with keys}, NaN where a box is not in the split
+    """
+    store = load_column_store(store_path, split, [BOX_KEY_COLUMN] + list(columns))
+    rows = match_keys(store[BOX_KEY_COLUMN], np.asarray(keys, dtype=np.int64))
+    return {column: take_rows(store[column], rows) for column in columns}
+
+
+def join_groups(store_path, columns, how='inner', years=None, coordinates=True):
+    """
+    joins column store splits on the box key without building a merged DataFrame
+    every split is sorted by box key, so each join is a binary search of the driving keys in the other splits
+    Args:
+        store_path (str): path to the indexed column store
+        columns (dict): {split: [columns]}, e.g. {"3": ["sea_surface_temp_mean"], "4": ["wind_speed_mean"]};
+                        the first split drives the join
+        how (str): "inner" keeps boxes present in every split, "left" keeps every box of the first split and
+                   fills the columns of the other splits with NaN where the box is missing
+        years (tuple): optional (first, last) year range, inclusive
+        coordinates (bool): also return year, month, latitude, longitude and box_size_degrees decoded from the keys
+    Returns:
+        tuple: (keys, {split: {column: array}}), all arrays aligned with keys; with coordinates=True the
+               decoded coordinates are returned under the key "box"
+    """
+    if how not in ('inner', 'left'):
+        raise ValueError(f"Unsupported join type: {how}")
+    splits = list(columns)
+    tile_degrees = split_tile_degrees(store_path, splits)
+
+    stores = {split: load_column_store(store_path, split, [BOX_KEY_COLUMN] + list(columns[split])) for split in splits}
+    ranges = {split: year_key_range(stores[split][BOX_KEY_COLUMN], years, tile_degrees) for split in splits}
+    split_keys = {split: np.asarray(stores[split][BOX_KEY_COLUMN][slice(*ranges[split])]) for split in splits}
+
+    driver = splits[0]
+    keys = split_keys[driver]
+    # duplicated boxes of the driving split would duplicate output rows, keep the first one
+    first = np.ones(len(keys), dtype=bool)
+    first[1:] = keys[1:] != keys[:-1]
+    rows = {driver: np.flatnonzero(first)}
+    keys = keys[first]
+
+    for split in splits[1:]:
+        rows[split] = match_keys(split_keys[split], keys)
+        if how == 'inner':
+            found = rows[split] >= 0
+            keys = keys[found]
+            for previous in rows:
+                rows[previous] = rows[previous][found]
+
+    result = {}
+    for split in splits:
+        start = ranges[split][0]
+        split_rows = np.where(rows[split] >= 0, rows[split] + start, -1)
+        result[split] = {column: take_rows(stores[split][column], split_rows) for column in columns[split]}
+    if coordinates:
+        result['box'] = decode_box_keys(keys, tile_degrees)
+
+    print(f"Joined splits {splits} ({how}): {len(keys):,} boxes")
+    return keys, result
@@ -0,0 +1,226 @@
+"""per-stage counters, timers and profiling hooks for the extraction pipeline"""
+import sys
+import json
+import time
+import logging
+import cProfile
+import pstats
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def rss_high_water_bytes():
+    """
+    peak resident set size of the process in bytes, None where the platform does not report it
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class JSONLinesSink:
+    """
+    appends every event as one JSON line to a file
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def emit(self, event):
+        self.file.write(json.dumps(event, default=str) + "\n")
+
+    def close(self):
+        self.file.close()
+
+
+class CallbackSink:
+    """
+    passes every event dict to a callback, e.g. a progress bar or a monitoring client
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def emit(self, event):
+        self.callback(event)
+
+    def close(self):
+        pass
+
+
+class LoggingSink:
+    """
+    logs events with the logging module, stage timings at stage_level and all other events at level
+    """
+
+    def __init__(self, logger=None, level=logging.INFO, stage_level=logging.DEBUG):
+        self.logger = logger or logging.getLogger("icoads")
+        self.level = level
+        self.stage_level = stage_level
+
+    def emit(self, event):
+        level = self.stage_level if event['event'] == 'stage' else self.level
+        if self.logger.isEnabledFor(level):
+            fields = " ".join(f"{key}={value}" for key, value in event.items() if key not in ('event', 'time'))
+            self.logger.log(level, f"{event['event']}: {fields}")
+
+    def close(self):
+        pass
+
+
+class PipelineMetrics:
+    """
+    collects counters and stage timers per group and forwards events to the sinks
+    Args:
+        sinks (list): JSONLinesSink, CallbackSink, LoggingSink or any object with emit(event) and close()
+        profile_stages (set): stage names run under cProfile, the stats accumulate per stage
+        trace_memory_stages (set): stage names whose peak traced (python + numpy) allocation is recorded
+        stage_events (bool): emit one event per timed stage; with False only explicit events and the summary
+                             are emitted, the timers are still collected
+    """
+
+    def __init__(self, sinks=None, profile_stages=(), trace_memory_stages=(), stage_events=True):
+        self.sinks = list(sinks or [])
+        self.profile_stages = set(profile_stages)
+        self.trace_memory_stages = set(trace_memory_stages)
+        self.stage_events = stage_events
+        self.counters = {}
+        self.timers = {}
+        self.rss_high_water = {}
+        self.memory_peaks = {}
+        self.profiles = {}
+        self.started = time.perf_counter()
+
+    def count(self, name, value=1, group=None):
+        key = (name, group)
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    @contextmanager
+    def stage(self, name, group=None, records=None, nbytes=None):
+        """
+        times a block; records and nbytes are added to the stage totals for records/s and MB/s
+        yields a dict, so counts that are only known at the end of the block can be set inside it:
+            with metrics.stage('decode') as stage:
+                stage['records'] = len(decode(...))
+        """
+        info = {'records': records, 'nbytes': nbytes}
+        profiler = None
+        if name in self.profile_stages:
+            profiler = self.profiles.setdefault(name, cProfile.Profile())
+            profiler.enable()
+        tracing = name in self.trace_memory_stages and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+
+        start = time.perf_counter()
+        try:
+            yield info
+        finally:
+            seconds = time.perf_counter() - start
+            if profiler is not None:
+                profiler.disable()
+            if tracing:
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                self.memory_peaks[name] = max(self.memory_peaks.get(name, 0), peak)
+
+            timer = self.timers.setdefault((name, group), {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+                                                           'records': 0, 'bytes': 0})
+            timer['calls'] += 1
+            timer['seconds'] += seconds
+            timer['max_seconds'] = max(timer['max_seconds'], seconds)
+            timer['records'] += info['records'] or 0
+            timer['bytes'] += info['nbytes'] or 0
+
+            if self.stage_events and self.sinks:
+                self.event('stage', stage=name, group=group, seconds=seconds, records=info['records'],
+                           bytes=info['nbytes'])
+
+    def sample_rss(self, group=None):
+        """
+        records the process RSS high-water mark seen so far for a group
+        """
+        peak = rss_high_water_bytes()
+        if peak is not None:
+            self.rss_high_water[group] = max(self.rss_high_water.get(group, 0), peak)
+
+    def event(self, event, **fields):
+        if not self.sinks:
+            return
+        record = {'event': event, 'time': time.time(), **fields}
+        for sink in self.sinks:
+            sink.emit(record)
+
+    def summary(self, emit=True):
+        """
+        totals of all counters and stages, emitted as a 'summary' event unless emit is False
+        """
+        stages = []
+        for (name, group), timer in self.timers.items():
+            seconds = timer['seconds']
+            stages.append({
+                'stage': name,
+                'group': group,
+                **timer,
+                'records_per_s': timer['records'] / seconds if seconds > 0 else None,
+                'mb_per_s': timer['bytes'] / 1e6 / seconds if seconds > 0 else None,
+            })
+        summary = {
+            'elapsed_seconds': time.perf_counter() - self.started,
+            'counters': [{'name': name, 'group': group, 'value': value}
+                         for (name, group), value in self.counters.items()],
+            'stages': stages,
+            'rss_high_water_bytes': {str(group): peak for group, peak in self.rss_high_water.items()},
+            'traced_memory_peak_bytes': dict(self.memory_peaks),
+        }
+        if emit:
+            self.event('summary', **summary)
+        return summary
+
+    def profile_stats(self, name, sort='cumulative', limit=20):
+        """
+        prints the accumulated cProfile stats of a profiled stage
+        """
+        stats = pstats.Stats(self.profiles[name]).sort_stats(sort)
+        stats.print_stats(limit)
+        return stats
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+class QuietMetrics:
+    """
+    default no-op metrics, every hook returns immediately
+    """
+    # the yielded dict is shared and never read
+    _stage = nullcontext({})
+
+    def count(self, name, value=1, group=None):
+        pass
+
+    def stage(self, name, group=None, records=None, nbytes=None):
+        return self._stage
+
+    def sample_rss(self, group=None):
+        pass
+
+    def event(self, event, **fields):
+        pass
+
+    def summary(self, emit=True):
+        return {}
+
+    def close(self):
+        pass
+
+
+QUIET = QuietMetrics()
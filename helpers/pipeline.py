@@ -0,0 +1,308 @@
+"""threaded reader -> decompressor -> decoder -> writer ingestion pipeline with bounded queues"""
+import os
+import gzip
+import time
+import queue
+import threading
+from contextlib import ExitStack
+from helpers.arrow_writer import GroupArrowWriter
+from helpers.column_store import ColumnStoreWriter
+from helpers.extraction import decode_msg1_buffer, list_tar_members, validate_and_create_path
+from helpers.metrics import QUIET
+from helpers.raw_sidecar import RawRecordWriter
+from helpers.regions import attach_region_columns
+
+# marks the end of the stream in a queue
+_END = object()
+
+
+class StageStats:
+    """
+    time a stage spent working, waiting for input (starved) and waiting for room downstream (backpressure)
+    """
+
+    def __init__(self, name, threads):
+        self.name = name
+        self.threads = threads
+        self.items = 0
+        self.busy_seconds = 0.0
+        self.starved_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, busy=0.0, starved=0.0, blocked=0.0, items=0):
+        with self.lock:
+            self.busy_seconds += busy
+            self.starved_seconds += starved
+            self.blocked_seconds += blocked
+            self.items += items
+
+    def as_dict(self, elapsed):
+        capacity = self.threads * elapsed if elapsed > 0 else 1.0
+        return {
+            'stage': self.name,
+            'threads': self.threads,
+            'items': self.items,
+            'busy_seconds': self.busy_seconds,
+            'utilization': self.busy_seconds / capacity,
+            'starved': self.starved_seconds / capacity,
+            'blocked': self.blocked_seconds / capacity,
+        }
+
+
+def put_until_stopped(outbox, item, stop):
+    """
+    blocking put that gives up once the pipeline is stopped, so a failed consumer cannot deadlock its producers
+    """
+    while not stop.is_set():
+        try:
+            outbox.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def start_stage(name, function, inbox, outbox, threads, stop):
+    """
+    runs function(payload) on every (seq, unit, payload, error) item of inbox in the given number of threads
+    items that already carry an error and items whose function raises are passed on with the error set;
+    the last thread to see the end of the stream forwards it downstream
+    """
+    stats = StageStats(name, threads)
+    remaining = [threads]
+    lock = threading.Lock()
+
+    def run():
+        while not stop.is_set():
+            start = time.perf_counter()
+            try:
+                item = inbox.get(timeout=0.1)
+            except queue.Empty:
+                stats.add(starved=time.perf_counter() - start)
+                continue
+            got = time.perf_counter()
+            stats.add(starved=got - start)
+
+            if item is _END:
+                inbox.put(_END)
+                with lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last:
+                    put_until_stopped(outbox, _END, stop)
+                return
+
+            seq, unit, payload, error = item
+            if error is None:
+                try:
+                    payload = function(unit, payload)
+                except Exception as e:
+                    payload, error = None, f"{type(e).__name__}: {e}"
+            done = time.perf_counter()
+
+            put_until_stopped(outbox, (seq, unit, payload, error), stop)
+            stats.add(busy=done - got, blocked=time.perf_counter() - done, items=1)
+
+    workers = [threading.Thread(target=run, name=f"icoads-{name}-{i}", daemon=True) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    return stats, workers
+
+
+def start_reader(units, outbox, stop, in_flight):
+    """
+    reads the compressed bytes of every member sequentially, tar file by tar file
+    a member is only read once the in_flight semaphore admits it, the writer releases it after writing
+    """
+    stats = StageStats('read', 1)
+
+    def run():
+        handles = {}
+        try:
+            for seq, unit in enumerate(units):
+                tar_path, member_name, offset, size = unit
+                start = time.perf_counter()
+                while not in_flight.acquire(timeout=0.1):
+                    if stop.is_set():
+                        return
+                stats.add(blocked=time.perf_counter() - start)
+                start = time.perf_counter()
+                error = None
+                raw = None
+                try:
+                    if tar_path not in handles:
+                        for handle in handles.values():
+                            handle.close()
+                        handles = {tar_path: open(tar_path, 'rb')}
+                    handles[tar_path].seek(offset)
+                    raw = handles[tar_path].read(size)
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+                done = time.perf_counter()
+                if not put_until_stopped(outbox, (seq, unit, raw, error), stop):
+                    return
+                stats.add(busy=done - start, blocked=time.perf_counter() - done, items=1)
+            put_until_stopped(outbox, _END, stop)
+        finally:
+            for handle in handles.values():
+                handle.close()
+
+    worker = threading.Thread(target=run, name="icoads-read", daemon=True)
+    worker.start()
+    return stats, [worker]
+
+
+def run_ingestion_pipeline(units, write, queue_depth=4, decompress_threads=1, decode_threads=1, keep_raw=False,
+                           metrics=None):
+    """
+    streams (tar_path, member_name, offset, size) work units through reader, decompressor and decoder threads
+    into write(unit, tables, error), which runs in the calling thread and receives the members in input order
+    zlib and most of the numpy decoding release the GIL, so reading, decompressing, decoding and writing overlap;
+    every queue holds at most queue_depth members, a slow stage therefore blocks its upstream (backpressure)
+    instead of buffering the whole input; members that finish ahead of a slow one wait in the reorder buffer,
+    so at most queue_depth + decompress_threads + decode_threads members are read but not yet written
+    Returns:
+        list: per stage stats (items, busy seconds, utilization, starved and blocked fractions)
+    """
+    metrics = metrics or QUIET
+    stop = threading.Event()
+    raw_queue = queue.Queue(maxsize=queue_depth)
+    data_queue = queue.Queue(maxsize=queue_depth)
+    table_queue = queue.Queue(maxsize=queue_depth)
+    in_flight = threading.Semaphore(queue_depth + decompress_threads + decode_threads)
+
+    started = time.perf_counter()
+    stages = [
+        start_reader(units, raw_queue, stop, in_flight),
+        start_stage('decompress', lambda unit, raw: gzip.decompress(raw), raw_queue, data_queue,
+                    decompress_threads, stop),
+        start_stage('decode', lambda unit, data: decode_msg1_buffer(data, unit[1], keep_raw), data_queue,
+                    table_queue, decode_threads, stop),
+    ]
+    write_stats = StageStats('write', 1)
+
+    # several decompress/decode threads finish members out of order, the reorder buffer restores input order
+    pending = {}
+    next_seq = 0
+    try:
+        while True:
+            start = time.perf_counter()
+            item = table_queue.get()
+            got = time.perf_counter()
+            write_stats.add(starved=got - start)
+            if item is _END:
+                break
+
+            pending[item[0]] = item
+            while next_seq in pending:
+                seq, unit, tables, error = pending.pop(next_seq)
+                start = time.perf_counter()
+                write(unit, tables, error)
+                in_flight.release()
+                write_stats.add(busy=time.perf_counter() - start, items=1)
+                next_seq += 1
+    finally:
+        stop.set()
+        for stats, workers in stages:
+            for worker in workers:
+                worker.join()
+
+    elapsed = time.perf_counter() - started
+    results = [stats.as_dict(elapsed) for stats, workers in stages] + [write_stats.as_dict(elapsed)]
+    for result in results:
+        metrics.event('pipeline_stage', **result)
+    return results
+
+
+def print_stage_stats(results):
+    print(f"{'stage':>12} {'threads':>8} {'items':>8} {'busy s':>9} {'util':>6} {'starved':>8} {'blocked':>8}")
+    for result in results:
+        print(f"{result['stage']:>12} {result['threads']:>8} {result['items']:>8} {result['busy_seconds']:>9.2f} "
+              f"{result['utilization']:>6.0%} {result['starved']:>8.0%} {result['blocked']:>8.0%}")
+
+
+def parse_all_groups_pipelined(base_directory, file_list, output_path, queue_depth=4, decompress_threads=1,
+                               decode_threads=1, file_format="arrow", compact=False, column_store_path=None,
+                               raw_sidecar_path=None, region_cache_dir=None, metrics=None):
+    """
+    single process version of parse_all_groups_arrow where reading, decompressing, decoding and writing run
+    concurrently in threads connected by bounded queues; output is identical to a serial run
+    Args:
+        queue_depth (int): members buffered between two stages
+        decompress_threads (int): gzip threads
+        decode_threads (int): decode threads
+        file_format, compact, column_store_path, raw_sidecar_path, region_cache_dir: see parse_all_groups_arrow
+        metrics: helpers.metrics.PipelineMetrics receiving the per stage stats
+    Returns:
+        tuple: (output_path, {group: number of rows}) or (None, None) on failure
+    """
+    print("="*80)
+    print("ICOADS MSG.1 MULTI-GROUP PARSER (PIPELINED)")
+    print("="*80)
+
+    try:
+        output_path = validate_and_create_path(output_path)
+    except OSError as e:
+        print(f"ERROR: {e}")
+        return None, None
+
+    units = []
+    for filename in file_list:
+        tar_path = os.path.join(base_directory, filename)
+        if not os.path.exists(tar_path):
+            print(f"ERROR: File not found: {tar_path}")
+            return None, None
+        units.extend(list_tar_members(tar_path))
+
+    failed_members = []
+    # all writers close together, on an exception none of them publishes its metadata
+    with ExitStack() as stack:
+        writer = stack.enter_context(GroupArrowWriter(output_path, file_format, compact))
+        store_writer = None
+        if column_store_path is not None:
+            store_writer = stack.enter_context(ColumnStoreWriter(column_store_path))
+        raw_writer = None
+        if raw_sidecar_path is not None:
+            raw_writer = stack.enter_context(RawRecordWriter(raw_sidecar_path))
+
+        def write(unit, tables, error):
+            if error is not None:
+                print(f"Error processing {os.path.basename(unit[0])}/{unit[1]}: {error}")
+                failed_members.append(unit)
+                return
+            for group, columns in tables.items():
+                writer.write(group, columns)
+                if store_writer is not None:
+                    store_writer.write(group, columns)
+                if raw_writer is not None:
+                    raw_writer.write(group, columns)
+
+        stage_stats = run_ingestion_pipeline(units, write, queue_depth, decompress_threads, decode_threads,
+                                             keep_raw=raw_writer is not None, metrics=metrics)
+
+    if store_writer is not None:
+        print(f"Column store written to: {column_store_path}")
+        if region_cache_dir is not None:
+            for group in store_writer.meta:
+                attach_region_columns(column_store_path, str(group), region_cache_dir)
+    if raw_writer is not None:
+        print(f"Raw record sidecar written to: {raw_sidecar_path}")
+
+    group_rows = writer.num_rows
+
+    print(f"\n{'='*60}")
+    print(f"PROCESSING COMPLETE")
+    print(f"Total records processed: {sum(group_rows.values()):,}")
+    if failed_members:
+        print(f"Failed members: {len(failed_members)}")
+    for group, rows in group_rows.items():
+        print(f"  Group {group}: {rows:,} records")
+    print(f"{'='*60}")
+    print_stage_stats(stage_stats)
+
+    if not group_rows:
+        print("ERROR: No group datasets were created!")
+        return None, None
+
+    return output_path, group_rows
@@ -0,0 +1,164 @@
+"""sidecar store of the packed 64 byte MSG.1 records, aligned row for row with the group splits"""
+import os
+import json
+import numpy as np
+from helpers.extraction import (
+    GROUP_DEFINITIONS,
+    RAW_RECORD_COLUMN,
+    convert_to_true_values_batch,
+    unpack_msg1_records,
+)
+
+SIDECAR_RECORDS_FILENAME = "records.bin"
+SIDECAR_META_FILENAME = "meta.json"
+
+HEADER_POSITIONS = {
+    'year': 1,
+    'month': 2,
+    'box_size_degrees': 3,
+    'longitude': 4,
+    'latitude': 5,
+    'platform_id1': 6,
+    'platform_id2': 7,
+    'data_group': 8,
+    'checksum': 9,
+}
+
+# per variable statistics in coded position blocks of 4 (see get_scaling_factors)
+STAT_BLOCKS = {
+    'tercile1': 10,    # S1
+    'median': 14,      # S3
+    'tercile3': 18,    # S5
+    'mean': 22,        # M
+    'count': 26,       # N - number of observations
+    'std': 30,         # S - standard deviation
+    'midday': 34,      # D - mid-day
+    'h': 38,           # H
+    'x': 42,           # X
+    'y': 46,           # Y
+}
+
+
+def coded_field_positions(group):
+    """
+    field name -> coded position (1-49) of a group, e.g. 'sea_surface_temp_count' -> 26
+    """
+    positions = dict(HEADER_POSITIONS)
+    for i, var_name in enumerate(GROUP_DEFINITIONS[group]['variables'].values()):
+        for stat, block_start in STAT_BLOCKS.items():
+            positions[f'{var_name}_{stat}'] = block_start + i
+    return positions
+
+
+class RawRecordWriter:
+    """
+    appends the packed records of decoded tables to store_path/{group}/records.bin
+    feed it the same tables in the same order as the split writer and row i of the sidecar is row i of the split
+    leaving the with block by an exception only closes the files (see abort)
+    """
+
+    def __init__(self, store_path):
+        self.store_path = store_path
+        self.files = {}
+        self.num_rows = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, group, columns):
+        records = columns[RAW_RECORD_COLUMN]
+        if len(records) == 0:
+            return
+        if group not in self.files:
+            group_path = os.path.join(self.store_path, str(group))
+            os.makedirs(group_path, exist_ok=True)
+            self.files[group] = open(os.path.join(group_path, SIDECAR_RECORDS_FILENAME), 'wb')
+            self.num_rows[group] = 0
+
+        self.files[group].write(np.ascontiguousarray(records, dtype=np.uint8).tobytes())
+        self.num_rows[group] += len(records)
+
+    def close(self):
+        for group, f in self.files.items():
+            f.close()
+            with open(os.path.join(self.store_path, str(group), SIDECAR_META_FILENAME), 'w', encoding='utf-8') as f:
+                json.dump({'group': group, 'num_rows': self.num_rows[group], 'record_bytes': 64}, f, indent=2)
+        self.files = {}
+        return dict(self.num_rows)
+
+    def abort(self):
+        """
+        closes the record files after a failed ingest without writing meta.json, a stale one of an earlier run
+        is removed so load_raw_records refuses a sidecar out of step with the splits
+        """
+        for group, f in self.files.items():
+            f.close()
+            path = os.path.join(self.store_path, str(group), SIDECAR_META_FILENAME)
+            if os.path.exists(path):
+                os.remove(path)
+        self.files = {}
+
+
+def load_raw_records(store_path, split):
+    """
+    memory-maps the packed records of a split as a read-only (N, 64) uint8 array
+    """
+    with open(os.path.join(store_path, split, SIDECAR_META_FILENAME), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    if meta['num_rows'] == 0:
+        return np.empty((0, 64), dtype=np.uint8)
+    return np.memmap(os.path.join(store_path, split, SIDECAR_RECORDS_FILENAME), dtype=np.uint8, mode='r',
+                     shape=(meta['num_rows'], 64))
+
+
+def decode_raw_fields(store_path, split, fields, rows=None, chunk_rows=1_000_000):
+    """
+    decodes any subset of the 49 coded MSG.1 fields for selected rows of a split, straight from the sidecar
+    Args:
+        store_path (str): path to the sidecar store
+        split (str): group split (e.g., "3")
+        fields (list): field names (see coded_field_positions) or coded positions 1-49
+        rows: None for all rows, a slice, a boolean mask or an integer index array into the split
+        chunk_rows (int): rows decoded at once, bounds the temporary memory
+    Returns:
+        dict: {field: float64 array}, missing values (coded 0) are NaN
+    """
+    group = int(split)
+    positions = coded_field_positions(group)
+    field_positions = {field: positions[field] if isinstance(field, str) else int(field) for field in fields}
+    for field, position in field_positions.items():
+        if not 1 <= position <= 49:
+            raise ValueError(f"Unknown field: {field}")
+
+    records = load_raw_records(store_path, split)
+    # the selection stays an index array (or a slice), only one chunk of records is copied at a time
+    if rows is None:
+        rows = slice(0, len(records))
+    if isinstance(rows, slice):
+        rows = range(*rows.indices(len(records)))
+    else:
+        rows = np.asarray(rows)
+        rows = np.flatnonzero(rows) if rows.dtype == bool else rows
+
+    result = {field: np.empty(len(rows), dtype=np.float64) for field in field_positions}
+    for start in range(0, len(rows), chunk_rows):
+        chunk_index = rows[start:start + chunk_rows]
+        if isinstance(chunk_index, range):
+            chunk = np.asarray(records[chunk_index.start:chunk_index.stop:chunk_index.step])
+        else:
+            chunk = records[chunk_index]
+        coded = unpack_msg1_records(chunk)
+        ftrue = convert_to_true_values_batch(coded, group)
+        for field, position in field_positions.items():
+            values = ftrue[:, position]
+            if position >= 10:
+                values = np.where(coded[:, position] == 0, np.nan, values)
+            result[field][start:start + len(chunk)] = values
+
+    return result
@@ -0,0 +1,225 @@
+"""rasterized ocean basin, region and land lookup tables for the fixed MSG.1 box grids"""
+import os
+import json
+import zipfile
+import numpy as np
+from helpers.column_store import STORE_META_FILENAME
+from helpers.hf import load_column_store, load_column_store_meta
+
+REGION_CACHE_DIR = "./icoads_regions"
+# tables whose land lookup failed are only kept for the running process, the next process retries the lookup
+_UNPERSISTED_TABLES = {}
+
+# exclusive basin ids, 0 means unclassified (e.g. inland boxes outside every basin polygon)
+BASINS = {
+    1: 'north_atlantic',
+    2: 'south_atlantic',
+    3: 'north_pacific',
+    4: 'south_pacific',
+    5: 'indian',
+    6: 'southern',
+    7: 'arctic',
+    8: 'mediterranean',
+}
+BASIN_IDS = {name: basin_id for basin_id, name in BASINS.items()}
+
+# approximate basin outlines as (lon, lat) vertices with longitudes in [-180, 180); the boundaries between the
+# oceans run over land wherever possible, so only the open ocean edges (20E, 147E, Drake passage) matter
+ATLANTIC_OUTLINE = [(-70, -50), (-70, -20), (-78, 0), (-78, 8), (-84, 10), (-90, 15), (-95, 17), (-98, 20),
+                    (-98, 66), (20, 66), (20, -50)]
+INDIAN_OUTLINE = [(20, -50), (20, -30), (32, 30), (100, 30), (100, 5), (105, -6), (115, -9), (127, -9),
+                  (132, -12), (147, -40), (147, -50)]
+MEDITERRANEAN_OUTLINE = [(-6, 30), (-6, 46), (42, 46), (42, 30)]
+
+# overlapping regions of interest as bit flags of the region_bits column, (lon, lat) outlines as above
+REGIONS = {
+    'gulf_stream': (1 << 0, [(-82, 25), (-82, 45), (-45, 45), (-45, 25)]),
+    'nino34': (1 << 1, [(-170, -5), (-170, 5), (-120, 5), (-120, -5)]),
+    'nino3': (1 << 2, [(-150, -5), (-150, 5), (-90, 5), (-90, -5)]),
+    'kuroshio': (1 << 3, [(125, 25), (125, 45), (160, 45), (160, 25)]),
+    'north_atlantic_subpolar': (1 << 4, [(-65, 45), (-65, 65), (-5, 65), (-5, 45)]),
+    'tropics': (1 << 5, [(-180, -23.5), (-180, 23.5), (180, 23.5), (180, -23.5)]),
+}
+
+
+def points_in_polygon(lon, lat, outline):
+    """
+    vectorized even-odd ray casting test of points against a (lon, lat) polygon
+    """
+    inside = np.zeros(lon.shape, dtype=bool)
+    vertices = np.asarray(outline, dtype=np.float64)
+    for (x1, y1), (x2, y2) in zip(vertices, np.roll(vertices, -1, axis=0)):
+        crosses = (y1 > lat) != (y2 > lat)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            x_cross = x1 + (lat - y1) * (x2 - x1) / (y2 - y1)
+        inside ^= crosses & (lon < x_cross)
+    return inside
+
+
+def box_centres(resolution):
+    """
+    (lat, lon) centres of the global grid of a box size, longitudes in [-180, 180), rows and columns in the
+    order of helpers.cubes.grid_shape (south edge -90, west edge 0)
+    """
+    n_lat, n_lon = int(np.ceil(180.0 / resolution)) + 1, int(np.ceil(360.0 / resolution))
+    lat = np.minimum(-90.0 + (np.arange(n_lat) + 0.5) * resolution, 90.0)
+    lon = (np.arange(n_lon) + 0.5) * resolution
+    lon = np.where(lon >= 180.0, lon - 360.0, lon)
+    return np.meshgrid(lat, lon, indexing='ij')
+
+
+def classify_basins(lat, lon):
+    basin = np.zeros(lat.shape, dtype=np.int8)
+    atlantic = points_in_polygon(lon, lat, ATLANTIC_OUTLINE)
+    indian = points_in_polygon(lon, lat, INDIAN_OUTLINE)
+    # between Africa and Southeast Asia everything outside the Atlantic and Indian outlines is land (Eurasia, Sahara)
+    pacific = ~atlantic & ~indian & ((lon >= 100) | (lon <= -70)) & (lat > -50) & (lat < 66)
+
+    # later assignments take precedence
+    basin[atlantic & (lat >= 0)] = BASIN_IDS['north_atlantic']
+    basin[atlantic & (lat < 0)] = BASIN_IDS['south_atlantic']
+    basin[pacific & (lat >= 0)] = BASIN_IDS['north_pacific']
+    basin[pacific & (lat < 0)] = BASIN_IDS['south_pacific']
+    basin[indian] = BASIN_IDS['indian']
+    basin[points_in_polygon(lon, lat, MEDITERRANEAN_OUTLINE)] = BASIN_IDS['mediterranean']
+    basin[lat <= -50] = BASIN_IDS['southern']
+    basin[lat >= 66] = BASIN_IDS['arctic']
+    return basin
+
+
+def land_percent_grid(resolution, samples=4):
+    """
+    percentage of land in every box, estimated from samples x samples points per box against the Natural Earth
+    110m land polygons (needs cartopy and shapely, the shapefile is downloaded by cartopy on first use)
+    """
+    import shapely
+    from shapely.ops import unary_union
+    from cartopy.io import shapereader
+
+    land = unary_union(list(shapereader.Reader(shapereader.natural_earth('110m', 'physical', 'land')).geometries()))
+    n_lat, n_lon = int(np.ceil(180.0 / resolution)) + 1, int(np.ceil(360.0 / resolution))
+    offsets = (np.arange(samples) + 0.5) / samples * resolution
+
+    inside = np.zeros((n_lat, n_lon), dtype=np.int32)
+    south = -90.0 + np.arange(n_lat) * resolution
+    west = np.arange(n_lon) * resolution
+    for d_lat in offsets:
+        for d_lon in offsets:
+            lat, lon = np.meshgrid(np.minimum(south + d_lat, 90.0), west + d_lon, indexing='ij')
+            lon = np.where(lon >= 180.0, lon - 360.0, lon)
+            inside += shapely.contains_xy(land, lon, lat)
+    return np.rint(100.0 * inside / samples ** 2).astype(np.uint8)
+
+
+def build_region_table(resolution, cache_dir=REGION_CACHE_DIR, include_land=True):
+    """
+    rasterizes basins, region flags and the land percentage for the box centres of one box size and caches
+    the table as cache_dir/regions_{resolution}.npz
+    without cartopy/shapely, or if the Natural Earth download fails (e.g. offline), the land percentage is
+    255 (unknown) so an ingest never fails on the land lookup; such a table is not written to the cache
+    """
+    lat, lon = box_centres(resolution)
+    table = {
+        'basin_id': classify_basins(lat, lon),
+        'region_bits': np.zeros(lat.shape, dtype=np.int32),
+        'resolution': np.float64(resolution),
+    }
+    for name, (bit, outline) in REGIONS.items():
+        table['region_bits'][points_in_polygon(lon, lat, outline)] |= bit
+
+    table['land_percent'] = np.full(lat.shape, 255, dtype=np.uint8)
+    land_failed = False
+    if include_land:
+        try:
+            table['land_percent'] = land_percent_grid(resolution)
+        except ImportError as e:
+            print(f"WARNING: Land percentage not computed ({e}), install cartopy and shapely")
+            land_failed = True
+        except (OSError, zipfile.BadZipFile) as e:
+            # network / HTTP errors (URLError is an OSError) or a truncated Natural Earth download
+            print(f"WARNING: Land percentage not computed ({type(e).__name__}: {e})")
+            land_failed = True
+
+    print(f"Built region table for {resolution} degree boxes: {lat.shape[0]} x {lat.shape[1]}")
+    if land_failed:
+        _UNPERSISTED_TABLES[region_table_path(resolution, cache_dir)] = table
+        return table
+    os.makedirs(cache_dir, exist_ok=True)
+    np.savez(region_table_path(resolution, cache_dir), **table)
+    return table
+
+
+def region_table_path(resolution, cache_dir=REGION_CACHE_DIR):
+    return os.path.join(cache_dir, f"regions_{resolution:g}.npz")
+
+
+def load_region_table(resolution, cache_dir=REGION_CACHE_DIR):
+    """
+    cached region table of a box size, built on first use
+    """
+    path = region_table_path(resolution, cache_dir)
+    if path in _UNPERSISTED_TABLES:
+        return _UNPERSISTED_TABLES[path]
+    if not os.path.exists(path):
+        return build_region_table(resolution, cache_dir)
+    with np.load(path) as table:
+        return {key: table[key] for key in table.files}
+
+
+def lookup_regions(latitude, longitude, box_size_degrees, cache_dir=REGION_CACHE_DIR):
+    """
+    basin_id, region_bits and land_percent of every row from its box (south/west edge and size)
+    rows with a box size without a table (e.g. 0) get basin 0, no region bits and land 255
+    """
+    latitude = np.asarray(latitude, dtype=np.float64)
+    longitude = np.asarray(longitude, dtype=np.float64)
+    box_size_degrees = np.asarray(box_size_degrees)
+    result = {
+        'basin_id': np.zeros(len(latitude), dtype=np.int8),
+        'region_bits': np.zeros(len(latitude), dtype=np.int32),
+        'land_percent': np.full(len(latitude), 255, dtype=np.uint8),
+    }
+    for resolution in np.unique(box_size_degrees):
+        if resolution <= 0:
+            continue
+        table = load_region_table(float(resolution), cache_dir)
+        n_lat, n_lon = table['basin_id'].shape
+        rows = box_size_degrees == resolution
+        i = np.clip(np.floor((latitude[rows] + 90.0) / resolution).astype(np.int64), 0, n_lat - 1)
+        j = np.floor(np.mod(longitude[rows], 360.0) / resolution).astype(np.int64) % n_lon
+        for column in result:
+            result[column][rows] = table[column][i, j]
+    return result
+
+
+def attach_region_columns(store_path, split, cache_dir=REGION_CACHE_DIR, chunk_rows=2_000_000):
+    """
+    writes basin_id, region_bits and land_percent columns into a column store split, so region filters are
+    integer comparisons, e.g. store['basin_id'] == BASIN_IDS['north_atlantic'] or
+    (store['region_bits'] & REGIONS['gulf_stream'][0]) != 0
+    """
+    meta = load_column_store_meta(store_path, split)
+    store = load_column_store(store_path, split, ['latitude', 'longitude', 'box_size_degrees'])
+    dtypes = {'basin_id': np.int8, 'region_bits': np.int32, 'land_percent': np.uint8}
+
+    files = {column: open(os.path.join(store_path, split, f"{column}.bin.tmp"), 'wb') for column in dtypes}
+    try:
+        for start in range(0, meta['num_rows'], chunk_rows):
+            stop = min(start + chunk_rows, meta['num_rows'])
+            regions = lookup_regions(store['latitude'][start:stop], store['longitude'][start:stop],
+                                     store['box_size_degrees'][start:stop], cache_dir)
+            for column, f in files.items():
+                regions[column].tofile(f)
+    finally:
+        for f in files.values():
+            f.close()
+    for column in dtypes:
+        path = os.path.join(store_path, split, f"{column}.bin")
+        os.replace(path + ".tmp", path)
+
+    meta = load_column_store_meta(store_path, split)
+    for column, dtype in dtypes.items():
+        meta['dtypes'][column] = np.dtype(dtype).newbyteorder('<').str
+    with open(os.path.join(store_path, split, STORE_META_FILENAME), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+    print(f"Attached region columns to split {split}: {meta['num_rows']:,} rows")
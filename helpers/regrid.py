@@ -0,0 +1,235 @@
+"""area-weighted regridding of the box grids to coarser grids, zonal bands, basins and regions with cached sparse matrices"""
+import os
+import numpy as np
+from scipy import sparse
+from helpers.cubes import cube_indices, grid_shape, load_cube
+from helpers.hf import load_column_store, load_column_store_meta
+from helpers.regions import BASINS, REGIONS, box_centres, classify_basins, points_in_polygon
+
+REGRID_CACHE_DIR = "./icoads_regrid"
+
+
+def parse_target(target):
+    """
+    target specification as (kind, degrees): "grid:5" / "grid:10" (coarser boxes), "zonal:10" (latitude bands),
+    "basins" (exclusive basins of helpers.regions) or "regions" (overlapping regions of helpers.regions)
+    """
+    kind, _, degrees = str(target).partition(':')
+    if kind in ('grid', 'zonal') and degrees:
+        return kind, float(degrees)
+    if kind in ('basins', 'regions') and not degrees:
+        return kind, None
+    raise ValueError(f"Invalid regrid target: {target!r}")
+
+
+def target_assignment(resolution, target):
+    """
+    (source cell, target cell) pairs of the source box grid and the target cells with their axes or names
+    source cells are numbered row major in the (lat, lon) order of helpers.cubes.grid_shape
+    """
+    kind, degrees = parse_target(target)
+    lat, lon = box_centres(resolution)
+    lat, lon = lat.ravel(), lon.ravel()
+    source = np.arange(lat.size)
+
+    if kind == 'grid':
+        if degrees < resolution:
+            raise ValueError(f"Target grid of {degrees} degrees is finer than the {resolution} degree source grid")
+        n_lat, n_lon = grid_shape(degrees)
+        i = np.clip(np.floor((lat + 90.0) / degrees).astype(np.int64), 0, n_lat - 1)
+        j = np.floor(np.mod(lon, 360.0) / degrees).astype(np.int64) % n_lon
+        axes = {'lat': -90.0 + np.arange(n_lat) * degrees, 'lon': np.arange(n_lon) * degrees}
+        return source, i * n_lon + j, (n_lat, n_lon), axes
+
+    if kind == 'zonal':
+        n_bands = int(np.ceil(180.0 / degrees))
+        band = np.clip(np.floor((lat + 90.0) / degrees).astype(np.int64), 0, n_bands - 1)
+        return source, band, (n_bands,), {'lat': -90.0 + np.arange(n_bands) * degrees}
+
+    if kind == 'basins':
+        basin = classify_basins(lat, lon).astype(np.int64)
+        ids = np.asarray(sorted(BASINS))
+        keep = basin > 0
+        return source[keep], np.searchsorted(ids, basin[keep]), (len(ids),), {'names': [BASINS[i] for i in ids]}
+
+    # regions overlap, a source cell contributes to every region containing its centre
+    sources, targets = [], []
+    for k, (bit, outline) in enumerate(REGIONS.values()):
+        inside = np.flatnonzero(points_in_polygon(lon, lat, outline))
+        sources.append(inside)
+        targets.append(np.full(len(inside), k))
+    return np.concatenate(sources), np.concatenate(targets), (len(REGIONS),), {'names': list(REGIONS)}
+
+
+def build_aggregation_matrix(resolution, target, cache_dir=REGRID_CACHE_DIR):
+    """
+    sparse (target cells, source cells) matrix of cos(latitude) area weights of a box grid and caches it as
+    cache_dir/{target}_from_{resolution}.npz; weights are not normalized, apply_aggregation divides by the
+    weights of the values actually present
+    """
+    source, target_cell, shape, axes = target_assignment(resolution, target)
+    lat, _ = box_centres(resolution)
+    area = np.maximum(np.cos(np.deg2rad(lat.ravel())), 0.0)
+    matrix = sparse.csr_matrix((area[source], (target_cell, source)), shape=(int(np.prod(shape)), lat.size))
+    matrix.eliminate_zeros()
+
+    os.makedirs(cache_dir, exist_ok=True)
+    np.savez(aggregation_matrix_path(resolution, target, cache_dir), data=matrix.data, indices=matrix.indices,
+             indptr=matrix.indptr, matrix_shape=np.asarray(matrix.shape), target_shape=np.asarray(shape),
+             **{key: np.asarray(value) for key, value in axes.items()})
+    print(f"Built aggregation matrix {resolution:g} degree boxes -> {target}: {matrix.shape[0]:,} x "
+          f"{matrix.shape[1]:,}, {matrix.nnz:,} weights")
+    return matrix, shape, axes
+
+
+def aggregation_matrix_path(resolution, target, cache_dir=REGRID_CACHE_DIR):
+    kind, degrees = parse_target(target)
+    name = kind if degrees is None else f"{kind}{degrees:g}"
+    return os.path.join(cache_dir, f"{name}_from_{resolution:g}.npz")
+
+
+def load_aggregation_matrix(resolution, target, cache_dir=REGRID_CACHE_DIR):
+    """
+    cached (matrix, target shape, axes) of a source box size and target, built on first use
+    """
+    path = aggregation_matrix_path(resolution, target, cache_dir)
+    if not os.path.exists(path):
+        return build_aggregation_matrix(resolution, target, cache_dir)
+    with np.load(path) as cached:
+        matrix = sparse.csr_matrix((cached['data'], cached['indices'], cached['indptr']),
+                                   shape=tuple(cached['matrix_shape']))
+        axes = {key: cached[key] for key in ('lat', 'lon', 'names') if key in cached.files}
+        if 'names' in axes:
+            axes['names'] = [str(name) for name in axes['names']]
+        return matrix, tuple(int(n) for n in cached['target_shape']), axes
+
+
+def apply_aggregation(matrix, values, weights=None):
+    """
+    weighted means of a (time, source cells) block for every target cell with one sparse product each for the
+    sums and the weights; missing (NaN) values drop out and the weights of the present values are renormalized
+    Args:
+        matrix: aggregation matrix of build_aggregation_matrix
+        values (np.ndarray): (time, source cells), NaN where missing
+        weights (np.ndarray): optional extra (time, source cells) weights, e.g. observation counts
+    Returns:
+        tuple: (means, coverage) as (time, target cells), coverage is the present share of the area weights
+    """
+    valid = ~np.isnan(values)
+    present = valid.astype(np.float64) if weights is None else np.where(valid, weights, 0.0)
+    weighted = np.where(valid, values, 0.0) * present
+
+    # (target, source) @ (source, time) -> (target, time)
+    total = np.asarray(matrix @ weighted.T).T
+    weight_sum = np.asarray(matrix @ present.T).T
+    area_present = weight_sum if weights is None else np.asarray(matrix @ valid.T.astype(np.float64)).T
+    area_total = np.asarray(matrix.sum(axis=1)).ravel()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(weight_sum > 0, total / weight_sum, np.nan)
+        coverage = np.where(area_total > 0, area_present / area_total, 0.0)
+    return means, coverage
+
+
+def finish_regrid(means, coverage, shape, axes, min_coverage, year, month):
+    means = np.where(coverage >= min_coverage, means, np.nan) if min_coverage > 0 else means
+    result = {
+        'values': means.astype(np.float32).reshape((len(means),) + shape),
+        'coverage': coverage.astype(np.float32).reshape((len(coverage),) + shape),
+        'year': year,
+        'month': month,
+    }
+    result.update(axes)
+    return result
+
+
+def regrid_cube(cube_path, split, variable, target, weights=None, min_coverage=0.0, time_block=120,
+                cache_dir=REGRID_CACHE_DIR):
+    """
+    regrids every month of a (time, lat, lon) cube to a coarser grid, zonal bands, basins or regions
+    Args:
+        cube_path (str): folder of the cubes written by build_group_cubes
+        split (str): group split (e.g., "3")
+        variable (str): cube variable (e.g., "sea_surface_temp_mean")
+        target (str): see parse_target, e.g. "grid:5", "zonal:10", "basins"
+        weights (np.ndarray): optional (time, lat, lon) weights on top of the area weights, e.g. observation counts
+        min_coverage (float): target cells with a smaller present share of their area weights get NaN
+        time_block (int): months multiplied at once, bounds the temporary memory
+        cache_dir (str): folder of the cached aggregation matrices
+    Returns:
+        dict: values and coverage as (time, *target shape), year and month axes, lat/lon axes or names
+    """
+    cube, coords = load_cube(cube_path, split, variable)
+    matrix, shape, axes = load_aggregation_matrix(float(coords['resolution']), target, cache_dir)
+
+    n_time = coords['n_time']
+    means = np.empty((n_time, matrix.shape[0]), dtype=np.float64)
+    coverage = np.empty((n_time, matrix.shape[0]), dtype=np.float64)
+    for start in range(0, n_time, time_block):
+        stop = min(start + time_block, n_time)
+        block = np.asarray(cube[start:stop], dtype=np.float64).reshape(stop - start, -1)
+        block_weights = None if weights is None else np.asarray(weights[start:stop], dtype=np.float64).reshape(stop - start, -1)
+        means[start:stop], coverage[start:stop] = apply_aggregation(matrix, block, block_weights)
+
+    return finish_regrid(means, coverage, shape, axes, min_coverage, coords['year'], coords['month'])
+
+
+def regrid_store(store_path, split, variable, target, resolution=None, weight_column=None, min_coverage=0.0,
+                 cache_dir=REGRID_CACHE_DIR):
+    """
+    regrids a statistic column of a column store split for all months at once without building a cube:
+    the rows become sparse (month, source cell) matrices that are multiplied with the aggregation matrix
+    Args:
+        store_path (str): path to the column store
+        split (str): group split (e.g., "3")
+        variable (str): statistic column (e.g., "sea_surface_temp_mean")
+        target (str): see parse_target
+        resolution (float): source box size, if None the most common box_size_degrees of the split;
+                            boxes of other sizes are skipped
+        weight_column (str): optional column of extra per row weights, e.g. observation counts
+        min_coverage (float): see regrid_cube
+        cache_dir (str): folder of the cached aggregation matrices
+    Returns:
+        dict: see regrid_cube, the time axis runs from January of the first to December of the last year
+    """
+    meta = load_column_store_meta(store_path, split)
+    columns = ['year', 'month', 'latitude', 'longitude', 'box_size_degrees', variable]
+    store = load_column_store(store_path, split, columns + ([weight_column] if weight_column else []))
+
+    if resolution is None:
+        sizes, counts = np.unique(store['box_size_degrees'], return_counts=True)
+        resolution = float(sizes[np.argmax(counts)])
+    matrix, shape, axes = load_aggregation_matrix(resolution, target, cache_dir)
+
+    keep = store['box_size_degrees'] == np.float32(resolution)
+    values = np.asarray(store[variable][keep], dtype=np.float64)
+    weights = np.ones(len(values)) if weight_column is None else np.asarray(store[weight_column][keep], dtype=np.float64)
+    first_year, last_year = int(store['year'].min()), int(store['year'].max())
+    n_time = (last_year - first_year + 1) * 12
+    n_lat, n_lon = grid_shape(resolution)
+    t, i, j = cube_indices(store['year'][keep], store['month'][keep], store['latitude'][keep],
+                           store['longitude'][keep], first_year, resolution)
+
+    valid = ~np.isnan(values) & (weights > 0)
+    t, cell = t[valid], (i * n_lon + j)[valid]
+    weights = weights[valid]
+
+    # one (3 * time, source) matrix with row blocks for the weighted sums, the weights and the present boxes
+    # (every box appears once per month, as in build_group_cubes); rows are grouped by month with a stable
+    # argsort, so the CSR arrays are built directly without sorting the column indices
+    order = np.argsort(t, kind='stable')
+    per_month = np.bincount(t, minlength=n_time)
+    indptr = np.concatenate([[0], np.cumsum(np.tile(per_month, 3))])
+    data = np.concatenate([(values[valid] * weights)[order], weights[order], np.ones(len(t))])
+    stacked = sparse.csr_matrix((data, np.tile(cell[order], 3), indptr), shape=(3 * n_time, n_lat * n_lon))
+
+    # (3 * time, source) @ (source, target) -> (3 * time, target)
+    total, weight_sum, area_present = np.split((stacked @ matrix.T).toarray(), 3)
+    area_total = np.asarray(matrix.sum(axis=1)).ravel()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.where(weight_sum > 0, total / weight_sum, np.nan)
+        coverage = np.where(area_total > 0, area_present / area_total, 0.0)
+
+    print(f"Regridded {variable} of split {split} ({meta['num_rows']:,} rows) to {target}: "
+          f"{n_time} months x {matrix.shape[0]:,} cells")
+    time_axis = np.arange(n_time)
+    return finish_regrid(means, coverage, shape, axes, min_coverage, first_year + time_axis // 12, time_axis % 12 + 1)
@@ -0,0 +1,210 @@
+"""seekable block-compressed repack of MSG.1 tar files with a (group, year, month) frame index"""
+import os
+import gzip
+import zlib
+import tarfile
+import numpy as np
+from helpers.extraction import decode_msg1_buffer, msg1_record_view
+
+ARCHIVE_SUFFIX = ".msg1z"
+INDEX_SUFFIX = ".index.npz"
+
+
+def record_month_keys(records):
+    """
+    (group, year, month) of every packed record read straight from its header bytes (see unpack_msg1_record)
+    """
+    group = (records[:, 7] // 16).astype(np.int64)
+    year = records[:, 2].astype(np.int64) + 1799
+    month = (records[:, 3] // 16).astype(np.int64)
+    return group, year, month
+
+
+def repack_tar(tar_path, output_dir, frame_records=16384, level=6, block_size=64 * 65536):
+    """
+    repacks a MSG1_R3.0.0_ENH_G*_*.tar into {tar stem}.msg1z, a sequence of independent zlib frames of at most
+    frame_records 64 byte records, and {tar stem}.msg1z.index.npz with the offset of every frame
+    a frame never spans two (group, year, month) keys, so one month is read by decompressing only its frames
+    all complete 64 byte records are kept unchanged and in their original order, trailing partial bytes are dropped
+    members are decompressed block by block (see iter_tar_record_batches) and frames are written as they fill,
+    so peak memory is bounded by block_size and one frame; archive and index are written to temporary files
+    and only replace existing ones once both are complete, the index records the size and CRC-32 of its archive
+    so load_repack_index refuses an index left next to another archive by an interrupted replace
+    Args:
+        tar_path (str): MSG.1 tar file
+        output_dir (str): folder of the archive and its index
+        frame_records (int): records per frame, 16384 records are 1 MiB uncompressed
+        level (int): zlib compression level
+        block_size (int): decompressed bytes read at once, rounded down to whole records
+    Returns:
+        str: path of the archive
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(tar_path))[0]
+    archive_path = os.path.join(output_dir, stem + ARCHIVE_SUFFIX)
+    block_size = max(64, block_size - block_size % 64)
+
+    members = []
+    index = {name: [] for name in ('group', 'year', 'month', 'offset', 'size', 'records', 'member')}
+    offset = 0
+    crc = 0
+    n_records = 0
+
+    with open(archive_path + ".tmp", 'wb') as out, tarfile.open(tar_path, 'r|*') as tar:
+        # records of the frame being filled, all of the same key
+        pending = []
+        pending_key = None
+        pending_records = 0
+
+        def flush():
+            nonlocal offset, crc, pending, pending_records
+            if not pending_records:
+                return
+            frame = zlib.compress(b''.join(pending), level)
+            out.write(frame)
+            crc = zlib.crc32(frame, crc)
+            for name, value in zip(('group', 'year', 'month'), pending_key):
+                index[name].append(value)
+            index['offset'].append(offset)
+            index['size'].append(len(frame))
+            index['records'].append(pending_records)
+            index['member'].append(len(members) - 1)
+            offset += len(frame)
+            pending, pending_records = [], 0
+
+        for member in tar:
+            if not member.isfile() or not member.name.endswith('.gz'):
+                continue
+            members.append(os.path.basename(member.name))
+
+            with gzip.GzipFile(fileobj=tar.extractfile(member), mode='rb') as f:
+                remainder = b''
+                while True:
+                    block = f.read(block_size)
+                    if not block:
+                        break
+                    data = remainder + block if remainder else block
+                    usable = len(data) - len(data) % 64
+                    remainder = data[usable:]
+                    records = msg1_record_view(data[:usable])
+                    if len(records) == 0:
+                        continue
+
+                    group, year, month = record_month_keys(records)
+                    keys = (group * 10000 + year) * 16 + month
+                    # runs of equal keys within the block, a run may continue the pending frame
+                    changes = np.flatnonzero(np.diff(keys)) + 1
+                    for start, stop in zip(np.concatenate([[0], changes]), np.concatenate([changes, [len(records)]])):
+                        key = (group[start], year[start], month[start])
+                        if key != pending_key:
+                            flush()
+                            pending_key = key
+                        while start < stop:
+                            take = min(stop - start, frame_records - pending_records)
+                            pending.append(records[start:start + take].tobytes())
+                            pending_records += take
+                            start += take
+                            if pending_records == frame_records:
+                                flush()
+                    n_records += len(records)
+            # frames never span members
+            flush()
+            pending_key = None
+
+    np.savez(archive_path + ".tmp" + INDEX_SUFFIX,
+             group=np.asarray(index['group'], dtype=np.int16),
+             year=np.asarray(index['year'], dtype=np.int16),
+             month=np.asarray(index['month'], dtype=np.int8),
+             offset=np.asarray(index['offset'], dtype=np.int64),
+             size=np.asarray(index['size'], dtype=np.int64),
+             records=np.asarray(index['records'], dtype=np.int64),
+             member=np.asarray(index['member'], dtype=np.int32),
+             members=np.asarray(members, dtype=str),
+             archive_size=np.int64(offset),
+             archive_crc32=np.uint32(crc))
+    os.replace(archive_path + ".tmp", archive_path)
+    os.replace(archive_path + ".tmp" + INDEX_SUFFIX, archive_path + INDEX_SUFFIX)
+
+    print(f"Repacked {os.path.basename(tar_path)}: {len(members)} members, {n_records:,} records, "
+          f"{len(index['offset'])} frames, {os.path.getsize(tar_path) / 1e6:.1f} MB -> {offset / 1e6:.1f} MB")
+    return archive_path
+
+
+def repack_all(base_directory, file_list, output_dir, frame_records=16384, level=6):
+    """
+    repacks every tar file of file_list, returns the archive paths
+    """
+    archive_paths = []
+    for filename in file_list:
+        tar_path = os.path.join(base_directory, filename)
+        if not os.path.exists(tar_path):
+            print(f"ERROR: File not found: {tar_path}")
+            continue
+        archive_paths.append(repack_tar(tar_path, output_dir, frame_records, level))
+    return archive_paths
+
+
+def load_repack_index(archive_path, verify=False):
+    """
+    frame index of a repacked archive as a dict of arrays (group, year, month, offset, size, records, member)
+    the archive size is always checked against the index, verify also checks the CRC-32 of the whole archive
+    """
+    with np.load(archive_path + INDEX_SUFFIX) as index:
+        index = {key: index[key] for key in index.files}
+    if 'archive_size' not in index:
+        raise ValueError(f"Index of {archive_path} has no archive size, repack the tar file again")
+    if os.path.getsize(archive_path) != int(index['archive_size']):
+        raise ValueError(f"Index of {archive_path} does not match the archive (size {os.path.getsize(archive_path)}, "
+                         f"index expects {int(index['archive_size'])}), repack the tar file again")
+    if verify:
+        crc = 0
+        with open(archive_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 24), b''):
+                crc = zlib.crc32(block, crc)
+        if crc != int(index['archive_crc32']):
+            raise ValueError(f"Index of {archive_path} does not match the archive (CRC-32), repack the tar file again")
+    return index
+
+
+def list_archive_months(archive_path):
+    """
+    sorted (group, year, month) keys with their record counts
+    """
+    index = load_repack_index(archive_path)
+    counts = {}
+    for group, year, month, records in zip(index['group'], index['year'], index['month'], index['records']):
+        key = (int(group), int(year), int(month))
+        counts[key] = counts.get(key, 0) + int(records)
+    return dict(sorted(counts.items()))
+
+
+def read_month_records(archive_path, group, year, month, index=None):
+    """
+    packed (N, 64) uint8 records of one (group, year, month), only the frames of that month are read and
+    decompressed; pass a preloaded index when reading many months of the same archive
+    """
+    index = load_repack_index(archive_path) if index is None else index
+    frames = np.flatnonzero((index['group'] == group) & (index['year'] == year) & (index['month'] == month))
+
+    buffers = []
+    with open(archive_path, 'rb') as f:
+        for frame in frames:
+            f.seek(int(index['offset'][frame]))
+            buffers.append(zlib.decompress(f.read(int(index['size'][frame]))))
+    if not buffers:
+        return np.empty((0, 64), dtype=np.uint8)
+    return msg1_record_view(b''.join(buffers))
+
+
+def read_month(archive_path, group, year, month, index=None):
+    """
+    decoded columns (see create_record_columns_batch) of one (group, year, month) of a repacked archive,
+    None if the archive has no valid records for it
+    """
+    index = load_repack_index(archive_path) if index is None else index
+    frames = np.flatnonzero((index['group'] == group) & (index['year'] == year) & (index['month'] == month))
+    if len(frames) == 0:
+        return None
+    source_file = str(index['members'][index['member'][frames[0]]])
+    records = read_month_records(archive_path, group, year, month, index)
+    return decode_msg1_buffer(records.tobytes(), source_file).get(group)
@@ -0,0 +1,270 @@
+"""materialized climatologies, anomalies and annual/decadal means with incremental refresh"""
+import os
+import json
+import hashlib
+import numpy as np
+from helpers.column_store import STORE_INDEX_FILENAME, store_dtypes, tile_grid
+from helpers.cubes import cube_indices, grid_shape
+from helpers.hf import load_column_store, load_column_store_meta
+
+ROLLUP_STATE_FILENAME = "state.json"
+
+
+def store_version(store_path, split):
+    """
+    version of a column store split, changes whenever rows or source files are added or replaced or any column
+    file is rewritten
+    """
+    meta = load_column_store_meta(store_path, split)
+    stats = [os.stat(os.path.join(store_path, split, f"{column}.bin")) for column in sorted(meta['dtypes'])]
+    version = json.dumps([meta['num_rows'], meta['source_files'], [[stat.st_size, stat.st_mtime_ns] for stat in stats]])
+    return hashlib.sha1(version.encode()).hexdigest()[:16]
+
+
+def month_row_ranges(store_path, split):
+    """
+    row range of every (year, month) in a sorted column store split, read from its spatio-temporal index
+    Returns:
+        dict: {(year, month): (start, stop)}
+    """
+    meta = load_column_store_meta(store_path, split)
+    if 'index_tile_degrees' not in meta:
+        raise ValueError(f"Split '{split}' has no spatio-temporal index, run build_time_tile_index first.")
+
+    index = np.load(os.path.join(store_path, split, STORE_INDEX_FILENAME))
+    n_lat, n_lon = tile_grid(float(index['tile_degrees']))
+    time_keys = index['keys'] // (n_lat * n_lon)
+
+    # keys are sorted, so every month is one contiguous block of index entries
+    times, first = np.unique(time_keys, return_index=True)
+    last = np.append(first[1:], len(time_keys)) - 1
+    return {
+        (int(t // 12), int(t % 12 + 1)): (int(index['starts'][a]), int(index['stops'][b]))
+        for t, a, b in zip(times, first, last)
+    }
+
+
+def month_checksum(store, start, stop):
+    """
+    content checksum of the rows of one month over all loaded columns, catches rows rewritten in place
+    (same row count and source files, e.g. a corrected re-release with unchanged member names)
+    """
+    digest = hashlib.sha1()
+    for column in sorted(store):
+        digest.update(column.encode())
+        digest.update(np.ascontiguousarray(store[column][start:stop]).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def load_rollup_state(rollup_dir):
+    path = os.path.join(rollup_dir, ROLLUP_STATE_FILENAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def is_rollup_stale(rollup_path, store_path, split):
+    """
+    True if the rollups of a split were not built from the current version of the column store
+    """
+    state = load_rollup_state(os.path.join(rollup_path, split))
+    return state is None or state['store_version'] != store_version(store_path, split)
+
+
+def accumulate_month(store, start, stop, variable, resolution):
+    """
+    count / sum / sum of squares per grid box of one month of rows
+    """
+    n_lat, n_lon = grid_shape(resolution)
+    n_cells = n_lat * n_lon
+
+    keep = store['box_size_degrees'][start:stop] == np.float32(resolution)
+    values = np.asarray(store[variable][start:stop][keep], dtype=np.float64)
+    _, i, j = cube_indices(store['year'][start:stop][keep], store['month'][start:stop][keep],
+                           store['latitude'][start:stop][keep], store['longitude'][start:stop][keep],
+                           0, resolution)
+    valid = ~np.isnan(values)
+    cell = (i * n_lon + j)[valid]
+    values = values[valid]
+
+    count = np.bincount(cell, minlength=n_cells).reshape(n_lat, n_lon).astype(np.int32)
+    total = np.bincount(cell, weights=values, minlength=n_cells).reshape(n_lat, n_lon)
+    total_sq = np.bincount(cell, weights=values * values, minlength=n_cells).reshape(n_lat, n_lon)
+    return count, total, total_sq
+
+
+def empty_accumulator(shape):
+    return {
+        'count': np.zeros((12,) + shape, dtype=np.int32),
+        'sum': np.zeros((12,) + shape, dtype=np.float64),
+        'sum_sq': np.zeros((12,) + shape, dtype=np.float64),
+    }
+
+
+def load_year_accumulator(variable_dir, year, shape):
+    path = os.path.join(variable_dir, f"{year}.npz")
+    if os.path.exists(path):
+        with np.load(path) as acc:
+            return {key: acc[key].copy() for key in ('count', 'sum', 'sum_sq')}
+    return empty_accumulator(shape)
+
+
+def mean_and_std(count, total, total_sq):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = total / count
+        variance = np.maximum(total_sq / count - mean * mean, 0.0)
+    return mean.astype(np.float32), np.sqrt(variance).astype(np.float32)
+
+
+def refresh_rollups(store_path, split, rollup_path, variables=None, resolution=2.0, baseline=(1961, 1990), force=False):
+    """
+    computes or incrementally updates the rollups of a column store split
+    per variable and year, mergeable (count, sum, sum of squares) accumulators per month and grid box are kept on
+    disk; only months whose rows, source files or content changed since the last refresh are re-accumulated, the
+    climatology, annual/decadal means and anomalies are then derived from the accumulators
+    Args:
+        store_path (str): path to the (indexed) column store
+        split (str): group split (e.g., "3")
+        rollup_path (str): output folder, rollups go to rollup_path/{split}
+        variables (list): statistic columns, if None the *_mean columns of the group
+        resolution (float): box size in degrees, boxes of other sizes are skipped
+        baseline (tuple): (first, last) year of the climatology baseline, inclusive
+        force (bool): rebuild everything
+    Returns:
+        dict: rollup state (store version, parameters and month signatures)
+    """
+    if variables is None:
+        variables = [column for column in store_dtypes(int(split)) if column.endswith('_mean')]
+    variables = list(variables)
+
+    rollup_dir = os.path.join(rollup_path, split)
+    os.makedirs(rollup_dir, exist_ok=True)
+
+    version = store_version(store_path, split)
+    state = load_rollup_state(rollup_dir)
+    params = {'variables': variables, 'resolution': resolution, 'baseline': list(baseline)}
+    if state is not None and any(state[key] != value for key, value in params.items()):
+        print("Rollup parameters changed, rebuilding")
+        force = True
+    if state is not None and not force and state['store_version'] == version:
+        print(f"Rollups of split {split} are up to date (store version {version})")
+        return state
+
+    meta = load_column_store_meta(store_path, split)
+    ranges = month_row_ranges(store_path, split)
+    store = load_column_store(store_path, split,
+                              ['year', 'month', 'latitude', 'longitude', 'box_size_degrees', 'source_file_id'] + variables)
+
+    # a month is re-accumulated if its row count, contributing source files or content changed
+    signatures = {}
+    for (year, month), (start, stop) in ranges.items():
+        file_ids = np.unique(store['source_file_id'][start:stop])
+        signatures[f"{year}-{month:02d}"] = [stop - start, sorted(meta['source_files'][i] for i in file_ids),
+                                             month_checksum(store, start, stop)]
+
+    previous = {} if state is None or force else state['months']
+    changed = {key for key, signature in signatures.items() if previous.get(key) != signature}
+    removed = set(previous) - set(signatures)
+    changed_years = sorted({int(key[:4]) for key in changed | removed})
+    print(f"Refreshing split {split}: {len(changed)} changed and {len(removed)} removed months "
+          f"in {len(changed_years)} years")
+
+    shape = grid_shape(resolution)
+    years = sorted({year for year, month in ranges})
+    for variable in variables:
+        variable_dir = os.path.join(rollup_dir, variable)
+        os.makedirs(variable_dir, exist_ok=True)
+
+        for year in changed_years:
+            acc = empty_accumulator(shape) if force else load_year_accumulator(variable_dir, year, shape)
+            for month in range(1, 13):
+                key = f"{year}-{month:02d}"
+                if key not in changed and key not in removed:
+                    continue
+                if (year, month) in ranges:
+                    acc['count'][month - 1], acc['sum'][month - 1], acc['sum_sq'][month - 1] = \
+                        accumulate_month(store, *ranges[(year, month)], variable, resolution)
+                else:
+                    acc['count'][month - 1], acc['sum'][month - 1], acc['sum_sq'][month - 1] = 0, 0.0, 0.0
+            np.savez(os.path.join(variable_dir, f"{year}.npz"), **acc)
+
+        write_derived_rollups(variable_dir, years, shape, baseline, changed_years)
+
+    state = {
+        'store_version': version,
+        'months': signatures,
+        **params,
+        'years': years,
+    }
+    with open(os.path.join(rollup_dir, ROLLUP_STATE_FILENAME), 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    return state
+
+
+def write_derived_rollups(variable_dir, years, shape, baseline, changed_years):
+    """
+    derives climatology, annual and decadal means and monthly anomalies from the yearly accumulators
+    """
+    clim = {key: np.zeros((12,) + shape, dtype=dtype) for key, dtype in
+            (('count', np.int64), ('sum', np.float64), ('sum_sq', np.float64))}
+    annual_count = np.zeros((len(years),) + shape, dtype=np.int64)
+    annual_sum = np.zeros((len(years),) + shape, dtype=np.float64)
+    annual_sum_sq = np.zeros((len(years),) + shape, dtype=np.float64)
+
+    for n, year in enumerate(years):
+        acc = load_year_accumulator(variable_dir, year, shape)
+        annual_count[n] = acc['count'].sum(axis=0)
+        annual_sum[n] = acc['sum'].sum(axis=0)
+        annual_sum_sq[n] = acc['sum_sq'].sum(axis=0)
+        if baseline[0] <= year <= baseline[1]:
+            for key in clim:
+                clim[key] += acc[key]
+
+    clim_mean, clim_std = mean_and_std(clim['count'], clim['sum'], clim['sum_sq'])
+    clim_path = os.path.join(variable_dir, "climatology.npz")
+    clim_changed = True
+    if os.path.exists(clim_path):
+        with np.load(clim_path) as old:
+            clim_changed = not np.array_equal(old['mean'], clim_mean, equal_nan=True)
+    np.savez(clim_path, mean=clim_mean, std=clim_std, count=clim['count'].astype(np.int32))
+
+    annual_mean, annual_std = mean_and_std(annual_count, annual_sum, annual_sum_sq)
+    np.savez(os.path.join(variable_dir, "annual.npz"), years=np.asarray(years), mean=annual_mean,
+             std=annual_std, count=annual_count.astype(np.int32))
+
+    decades = sorted({year // 10 * 10 for year in years})
+    decade_index = np.searchsorted(decades, np.asarray(years) // 10 * 10)
+    decadal_count = np.zeros((len(decades),) + shape, dtype=np.int64)
+    decadal_sum = np.zeros((len(decades),) + shape, dtype=np.float64)
+    decadal_sum_sq = np.zeros((len(decades),) + shape, dtype=np.float64)
+    np.add.at(decadal_count, decade_index, annual_count)
+    np.add.at(decadal_sum, decade_index, annual_sum)
+    np.add.at(decadal_sum_sq, decade_index, annual_sum_sq)
+    decadal_mean, decadal_std = mean_and_std(decadal_count, decadal_sum, decadal_sum_sq)
+    np.savez(os.path.join(variable_dir, "decadal.npz"), decades=np.asarray(decades), mean=decadal_mean,
+             std=decadal_std, count=decadal_count.astype(np.int32))
+
+    # anomalies of unchanged years only need an update if the climatology moved
+    anomaly_dir = os.path.join(variable_dir, "anomalies")
+    os.makedirs(anomaly_dir, exist_ok=True)
+    for year in (years if clim_changed else changed_years):
+        acc = load_year_accumulator(variable_dir, year, shape)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            monthly_mean = acc['sum'] / acc['count']
+        np.save(os.path.join(anomaly_dir, f"{year}.npy"), (monthly_mean - clim_mean).astype(np.float32))
+
+
+def load_rollup(rollup_path, split, variable, kind):
+    """
+    loads one materialized rollup
+    Args:
+        kind (str): "climatology", "annual", "decadal" or an anomaly year (int)
+    Returns:
+        dict of arrays (mean, std, count, ...) or the (12, lat, lon) anomaly array of the year
+    """
+    variable_dir = os.path.join(rollup_path, split, variable)
+    if isinstance(kind, int):
+        return np.load(os.path.join(variable_dir, "anomalies", f"{kind}.npy"), mmap_mode='r')
+    with np.load(os.path.join(variable_dir, f"{kind}.npz")) as rollup:
+        return {key: rollup[key] for key in rollup.files}
@@ -0,0 +1,140 @@
+"""synthetic MSG.1 tar files for benchmarks and tests without the NOAA archives"""
+import io
+import os
+import gzip
+import tarfile
+import numpy as np
+from helpers.extraction import FMISS, get_scaling_factors
+
+# bit width of every coded position (see unpack_msg1_record)
+CODED_BITS = [0, 8, 4, 3, 10, 9, 3, 3, 4, 4] + [16] * 24 + [4] * 16
+
+
+def pack_msg1_records(coded):
+    """
+    inverse of unpack_msg1_records, packs an (N, 50) array of coded values into (N, 64) uint8 records
+    byte 1 is set to the record type 1 that the extraction filter expects
+    """
+    coded = np.asarray(coded, dtype=np.int64)
+    for position in range(1, 50):
+        if np.any((coded[:, position] < 0) | (coded[:, position] >= 1 << CODED_BITS[position])):
+            raise ValueError(f"Coded value out of range at position {position}")
+
+    records = np.zeros((len(coded), 64), dtype=np.uint8)
+    records[:, 1] = 1
+    records[:, 2] = coded[:, 1]
+    records[:, 3] = coded[:, 2] * 16 + coded[:, 3] * 2 + coded[:, 4] // 512
+    records[:, 4] = (coded[:, 4] // 2) % 256
+    records[:, 5] = (coded[:, 4] % 2) * 128 + coded[:, 5] // 4
+    records[:, 6] = (coded[:, 5] % 4) * 64 + coded[:, 6] * 8 + coded[:, 7]
+    records[:, 7] = coded[:, 8] * 16 + coded[:, 9]
+    records[:, 8:56] = coded[:, 10:34].astype('>u2').view(np.uint8).reshape(len(coded), 48)
+    records[:, 56:64] = coded[:, 34:50:2] * 16 + coded[:, 35:50:2]
+    return records
+
+
+def encode_true_values(ftrue, group):
+    """
+    inverse of convert_to_true_values_batch, coded = round(true / units - base)
+    FMISS data values (positions 10-49) are coded as 0, the checksum is passed through
+    """
+    fbase, funits = get_scaling_factors(group)
+    fbase = np.asarray(fbase, dtype=np.float64)
+    funits = np.asarray(funits, dtype=np.float64)
+    ftrue = np.asarray(ftrue, dtype=np.float64)
+
+    coded = np.zeros(ftrue.shape, dtype=np.int64)
+    coded[:, 1:] = np.rint(ftrue[:, 1:] / funits[1:] - fbase[1:])
+    coded[:, 9] = ftrue[:, 9]
+    coded[:, 10:50][ftrue[:, 10:50] == FMISS] = 0
+    return coded
+
+
+def representable_range(group, position):
+    """
+    (min, max) true value of a coded position, coded 0 is reserved for missing data values
+    """
+    fbase, funits = get_scaling_factors(group)
+    lowest = 1 if position >= 10 else 0
+    highest = (1 << CODED_BITS[position]) - 1
+    return (lowest + fbase[position]) * funits[position], (highest + fbase[position]) * funits[position]
+
+
+def generate_msg1_records(group, year, month, n_records, missing_ratio=0.2, box_size_degrees=2.0,
+                          value_ranges=None, rng=None):
+    """
+    generates packed MSG.1 records of one group and month
+    boxes are drawn without replacement from the global grid of the box size (with replacement if n_records is
+    larger than the grid), data values uniformly from value_ranges and set missing with probability missing_ratio
+    Args:
+        group (int): data group (3, 4, 5, 6, 7, 9)
+        year (int): 1800-2054
+        month (int): 1-12
+        n_records (int): records to generate
+        missing_ratio (float): fraction of missing data values
+        box_size_degrees (float): 1.0 or 2.0 in the ICOADS products
+        value_ranges (dict): {coded position 10-49: (min, max) true value}, defaults to the representable range
+        rng (np.random.Generator): random source
+    Returns:
+        np.ndarray: (n_records, 64) uint8 records
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    value_ranges = value_ranges or {}
+
+    n_lat, n_lon = int(round(180 / box_size_degrees)), int(round(360 / box_size_degrees))
+    cells = rng.choice(n_lat * n_lon, size=n_records, replace=n_records > n_lat * n_lon)
+
+    ftrue = np.zeros((n_records, 50), dtype=np.float64)
+    ftrue[:, 1] = year
+    ftrue[:, 2] = month
+    ftrue[:, 3] = box_size_degrees
+    ftrue[:, 4] = (cells % n_lon) * box_size_degrees
+    ftrue[:, 5] = (cells // n_lon) * box_size_degrees - 90.0
+    ftrue[:, 6] = rng.integers(0, 7, n_records)
+    ftrue[:, 7] = rng.integers(0, 7, n_records)
+    ftrue[:, 8] = group
+    ftrue[:, 9] = rng.integers(0, 16, n_records)
+
+    for position in range(10, 50):
+        low, high = value_ranges.get(position, representable_range(group, position))
+        ftrue[:, position] = rng.uniform(low, high, n_records)
+    ftrue[:, 10:50][rng.random((n_records, 40)) < missing_ratio] = FMISS
+
+    return pack_msg1_records(encode_true_values(ftrue, group))
+
+
+def synthetic_tar_filename(group, first_year, last_year):
+    return f"MSG1_R3.0.0_ENH_G{group}_{first_year}-{last_year}.tar"
+
+
+def write_synthetic_tar(output_dir, group, years, records_per_month, missing_ratio=0.2, box_size_degrees=2.0,
+                        value_ranges=None, seed=0):
+    """
+    writes a synthetic MSG1_R3.0.0_ENH_G{group}_{first}-{last}.tar with one gzipped member of packed records per month
+    Args:
+        output_dir (str): folder of the tar file
+        group (int): data group
+        years (list): years to generate, all 12 months each
+        records_per_month (int): records per monthly member
+        missing_ratio, box_size_degrees, value_ranges: see generate_msg1_records
+        seed (int): random seed, the same arguments give byte identical members
+    Returns:
+        str: path of the tar file
+    """
+    years = list(years)
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    tar_path = os.path.join(output_dir, synthetic_tar_filename(group, years[0], years[-1]))
+
+    with tarfile.open(tar_path, 'w') as tar:
+        for year in years:
+            for month in range(1, 13):
+                records = generate_msg1_records(group, year, month, records_per_month, missing_ratio,
+                                                box_size_degrees, value_ranges, rng)
+                data = gzip.compress(records.tobytes(), mtime=0)
+                info = tarfile.TarInfo(f"G{group}/{year}/MSG1.{year}{month:02d}.gz")
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+
+    print(f"Wrote {tar_path}: {len(years) * 12} members, {len(years) * 12 * records_per_month:,} records")
+    return tar_path
@@ -0,0 +1,332 @@
+"""multi-resolution tile pyramid of monthly mean/count/min/max per variable, stored as its non-empty tiles, with a viewport lookup"""
+import os
+import json
+import numpy as np
+import pandas as pd
+from helpers.column_store import store_dtypes, HEADER_DTYPES
+from helpers.cubes import cube_indices, grid_shape
+from helpers.hf import load_column_store, load_column_store_meta
+
+PYRAMID_META_FILENAME = "pyramid.json"
+# count is stored with the smallest unsigned type of its level, see pyramid_levels
+TILE_STATS = {'mean': np.float32, 'count': None, 'min': np.float32, 'max': np.float32}
+
+
+def coarsen(count, total, low, high):
+    """
+    merges 2 x 2 blocks of cells of (time, lat, lon) aggregates, odd edges are padded with empty cells
+    """
+    n_time, n_lat, n_lon = count.shape
+    pad = ((0, 0), (0, n_lat % 2), (0, n_lon % 2))
+    shape = (n_time, (n_lat + n_lat % 2) // 2, 2, (n_lon + n_lon % 2) // 2, 2)
+
+    def blocks(array, fill):
+        return np.pad(array, pad, constant_values=fill).reshape(shape)
+
+    count = blocks(count, 0).sum(axis=(2, 4), dtype=np.int64)
+    total = blocks(total, 0.0).sum(axis=(2, 4))
+    # fmin / fmax skip NaN and only give NaN for blocks without any value
+    low = np.fmin.reduce(np.fmin.reduce(blocks(low, np.nan), axis=4), axis=2)
+    high = np.fmax.reduce(np.fmax.reduce(blocks(high, np.nan), axis=4), axis=2)
+    return count, total, low, high
+
+
+def pyramid_levels(resolution, tile_cells):
+    """
+    zoom levels from zoom 0 (the whole globe in one tile) to the native box size, cells double in size per level up
+    the native level only stores the mean (its count is 0/1 and min = max = mean), the count dtype of a level is
+    the smallest unsigned type holding the number of native boxes per cell
+    """
+    n_lat, n_lon = grid_shape(resolution)
+    shapes = [(n_lat, n_lon)]
+    while shapes[-1][0] > tile_cells or shapes[-1][1] > tile_cells:
+        shapes.append(((shapes[-1][0] + 1) // 2, (shapes[-1][1] + 1) // 2))
+
+    levels = []
+    for zoom, (n_lat, n_lon) in enumerate(reversed(shapes)):
+        levels_up = len(shapes) - 1 - zoom
+        levels.append({
+            'zoom': zoom,
+            'cell_degrees': resolution * 2 ** levels_up,
+            'n_lat': n_lat,
+            'n_lon': n_lon,
+            'n_tile_lat': -(-n_lat // tile_cells),
+            'n_tile_lon': -(-n_lon // tile_cells),
+            'stats': list(TILE_STATS) if levels_up else ['mean'],
+            'count_dtype': np.min_scalar_type(4 ** levels_up).name,
+        })
+    return levels
+
+
+def stat_dtype(level, stat):
+    return np.dtype(level['count_dtype']) if stat == 'count' else np.dtype(TILE_STATS[stat])
+
+
+def tile_path(pyramid_path, split, variable, zoom, stat):
+    return os.path.join(pyramid_path, split, variable, f"z{zoom}_{stat}.npy")
+
+
+def occupied_tiles(occupied, level, tile_cells):
+    """
+    (tile rows, tile columns) positions of the non-empty tiles of a level, -1 for empty ones
+    """
+    tiles = to_tiles(occupied[np.newaxis], level, tile_cells).any(axis=(2, 3, 4))
+    index = np.full(tiles.shape, -1, dtype=np.int32)
+    index[tiles] = np.arange(int(tiles.sum()), dtype=np.int32)
+    return index
+
+
+def to_tiles(array, level, tile_cells):
+    """
+    (time, lat, lon) level array as (tile row, tile column, time, cell row, cell column), padded with empty cells
+    """
+    n_time = array.shape[0]
+    fill = {'b': False, 'i': 0, 'u': 0}.get(array.dtype.kind, np.nan)
+    padded = np.full((n_time, level['n_tile_lat'] * tile_cells, level['n_tile_lon'] * tile_cells), fill,
+                     dtype=array.dtype)
+    padded[:, :level['n_lat'], :level['n_lon']] = array
+    tiles = padded.reshape(n_time, level['n_tile_lat'], tile_cells, level['n_tile_lon'], tile_cells)
+    return tiles.transpose(1, 3, 0, 2, 4)
+
+
+def build_tile_pyramid(store_path, split, pyramid_path, variables=None, resolution=None, tile_cells=16,
+                       time_block=120, chunk_rows=2_000_000):
+    """
+    precomputes mean, count, min and max of every variable per cell, month and zoom level of a column store split
+    layout: pyramid_path/{split}/{variable}/z{zoom}_{stat}.npy with shape (non-empty tiles, time, tile_cells,
+    tile_cells), so all months of one tile are a single contiguous read, z{zoom}_tiles.npy with the position of
+    every (tile row, tile column) in them (-1 for tiles without data in any month), plus pyramid.json
+    count is the number of native boxes with data in a cell, mean is their unweighted mean; the native level only
+    stores the mean, read_viewport derives its other stats
+    Args:
+        store_path (str): path to the column store
+        split (str): group split (e.g., "3")
+        pyramid_path (str): output folder
+        variables (list): statistic columns (e.g. "sea_surface_temp_mean"), if None all statistics of the group
+        resolution (float): native box size, if None the most common box_size_degrees of the split;
+                            boxes of other sizes are skipped
+        tile_cells (int): cells per tile side
+        time_block (int): months aggregated at once, bounds the memory
+        chunk_rows (int): rows scattered at once
+    Returns:
+        dict: pyramid metadata (levels, time axis, variables)
+    """
+    meta = load_column_store_meta(store_path, split)
+    if variables is None:
+        variables = [column for column in store_dtypes(int(split)) if column not in HEADER_DTYPES]
+    store = load_column_store(store_path, split, ['year', 'month', 'latitude', 'longitude', 'box_size_degrees'] + list(variables))
+
+    if resolution is None:
+        sizes, counts = np.unique(store['box_size_degrees'], return_counts=True)
+        resolution = float(sizes[np.argmax(counts)])
+    first_year, last_year = int(store['year'].min()), int(store['year'].max())
+    n_time = (last_year - first_year + 1) * 12
+    n_lat, n_lon = grid_shape(resolution)
+    levels = pyramid_levels(resolution, tile_cells)
+
+    output_dir = os.path.join(pyramid_path, split)
+    for variable in variables:
+        # the native level is a dense cube, every box holds at most one value per month (see build_group_cubes)
+        native = np.full((n_time, n_lat, n_lon), np.nan, dtype=np.float32)
+        for start in range(0, meta['num_rows'], chunk_rows):
+            stop = min(start + chunk_rows, meta['num_rows'])
+            keep = store['box_size_degrees'][start:stop] == np.float32(resolution)
+            t, i, j = cube_indices(store['year'][start:stop][keep], store['month'][start:stop][keep],
+                                   store['latitude'][start:stop][keep], store['longitude'][start:stop][keep],
+                                   first_year, resolution)
+            native[t, i, j] = store[variable][start:stop][keep]
+
+        # a cell of a coarser level is occupied when any of its native boxes ever has data
+        os.makedirs(os.path.join(output_dir, variable), exist_ok=True)
+        occupied = ~np.isnan(native).all(axis=0)
+        index = {}
+        for level in reversed(levels):
+            if level['n_lat'] != occupied.shape[0] or level['n_lon'] != occupied.shape[1]:
+                n_lat_fine, n_lon_fine = occupied.shape
+                occupied = np.pad(occupied, ((0, n_lat_fine % 2), (0, n_lon_fine % 2))).reshape(
+                    level['n_lat'], 2, level['n_lon'], 2).any(axis=(1, 3))
+            index[level['zoom']] = occupied_tiles(occupied, level, tile_cells)
+            np.save(tile_path(pyramid_path, split, variable, level['zoom'], 'tiles'), index[level['zoom']])
+        files = {
+            (level['zoom'], stat): np.lib.format.open_memmap(
+                tile_path(pyramid_path, split, variable, level['zoom'], stat), mode='w+',
+                dtype=stat_dtype(level, stat),
+                shape=(int((index[level['zoom']] >= 0).sum()), n_time, tile_cells, tile_cells))
+            for level in levels for stat in level['stats']
+        }
+
+        for start in range(0, n_time, time_block):
+            stop = min(start + time_block, n_time)
+            block = native[start:stop]
+            valid = ~np.isnan(block)
+            aggregates = (valid.astype(np.int64), np.where(valid, block, 0.0), block, block)
+            for level in reversed(levels):
+                if level['n_lat'] != aggregates[0].shape[1] or level['n_lon'] != aggregates[0].shape[2]:
+                    aggregates = coarsen(*aggregates)
+                count, total, low, high = aggregates
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    mean = np.where(count > 0, total / count, np.nan)
+                keep = index[level['zoom']] >= 0
+                for stat, array in zip(TILE_STATS, (mean, count, low, high)):
+                    if stat in level['stats']:
+                        tiles = to_tiles(array.astype(stat_dtype(level, stat)), level, tile_cells)
+                        files[level['zoom'], stat][:, start:stop] = tiles[keep]
+        for array in files.values():
+            array.flush()
+
+    pyramid_meta = {
+        'split': split,
+        'variables': list(variables),
+        'resolution': resolution,
+        'tile_cells': tile_cells,
+        'first_year': first_year,
+        'n_time': n_time,
+        'levels': levels,
+    }
+    with open(os.path.join(output_dir, PYRAMID_META_FILENAME), 'w', encoding='utf-8') as f:
+        json.dump(pyramid_meta, f, indent=2)
+
+    size = sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(output_dir) for name in names)
+    print(f"Built tile pyramid for split {split}: {len(variables)} variables, zoom 0-{len(levels) - 1}, "
+          f"{n_time} months, {size / 1e6:.1f} MB")
+    return pyramid_meta
+
+
+def load_pyramid_meta(pyramid_path, split):
+    with open(os.path.join(pyramid_path, split, PYRAMID_META_FILENAME), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def zoom_for_viewport(pyramid_meta, lat_range, lon_range, max_cells=20000):
+    """
+    finest zoom level at which the viewport holds at most max_cells cells
+    """
+    lat_span = lat_range[1] - lat_range[0]
+    lon_span = (lon_range[1] - lon_range[0]) % 360.0 or 360.0
+    zoom = 0
+    for level in pyramid_meta['levels']:
+        if (lat_span / level['cell_degrees']) * (lon_span / level['cell_degrees']) <= max_cells:
+            zoom = level['zoom']
+    return zoom
+
+
+def viewport_tiles(pyramid_meta, zoom, lat_range=(-90.0, 90.0), lon_range=(0.0, 360.0)):
+    """
+    tile rows (south to north) and tile columns (west to east) covering a viewport at a zoom level
+    longitudes may be given in [-180, 180) or [0, 360), a viewport with lon_range[0] > lon_range[1] (after
+    wrapping to [0, 360)) crosses the 0 meridian and its columns wrap around
+    """
+    level = pyramid_meta['levels'][zoom]
+    tile_degrees = pyramid_meta['tile_cells'] * level['cell_degrees']
+
+    first = int(np.clip(np.floor((lat_range[0] + 90.0) / tile_degrees), 0, level['n_tile_lat'] - 1))
+    last = int(np.clip(np.floor((lat_range[1] + 90.0) / tile_degrees), 0, level['n_tile_lat'] - 1))
+    rows = list(range(first, last + 1))
+
+    if lon_range[1] - lon_range[0] >= 360.0:
+        return rows, list(range(level['n_tile_lon']))
+    west, east = np.mod(lon_range[0], 360.0), np.mod(lon_range[1], 360.0)
+    n_tile_lon = level['n_tile_lon']
+    first = min(int(west // tile_degrees), n_tile_lon - 1)
+    last = min(int(east // tile_degrees), n_tile_lon - 1)
+    if west <= east:
+        return rows, list(range(first, last + 1))
+    return rows, list(range(first, n_tile_lon)) + list(range(0, last + 1))
+
+
+def read_viewport(pyramid_path, split, variable, lat_range=(-90.0, 90.0), lon_range=(0.0, 360.0), zoom=None,
+                  years=None, stats=('mean', 'count'), max_cells=20000):
+    """
+    reads only the tiles of a viewport and stitches them into (time, lat, lon) mosaics, tiles without data are
+    filled with NaN (count 0)
+    Args:
+        pyramid_path (str): folder of the pyramid written by build_tile_pyramid
+        split (str): group split (e.g., "3")
+        variable (str): statistic column (e.g., "sea_surface_temp_mean")
+        lat_range, lon_range (tuple): viewport, see viewport_tiles
+        zoom (int): zoom level, if None the finest with at most max_cells cells in the viewport
+        years (tuple): (first, last) year, inclusive, None for all months
+        stats (tuple): any of mean, count, min, max
+    Returns:
+        dict: mosaics per stat, cell south edges 'lat', cell west edges 'lon' (continuous across the 0 meridian,
+              so they can exceed 360), 'year', 'month', 'zoom', 'cell_degrees' and the (row, column) 'tiles' read
+    """
+    pyramid_meta = load_pyramid_meta(pyramid_path, split)
+    if zoom is None:
+        zoom = zoom_for_viewport(pyramid_meta, lat_range, lon_range, max_cells)
+    level = pyramid_meta['levels'][zoom]
+    tile_cells = pyramid_meta['tile_cells']
+    rows, columns = viewport_tiles(pyramid_meta, zoom, lat_range, lon_range)
+
+    time_axis = np.arange(pyramid_meta['n_time'])
+    first, stop = 0, pyramid_meta['n_time']
+    if years is not None:
+        first = max(0, (years[0] - pyramid_meta['first_year']) * 12)
+        stop = min(stop, (years[1] - pyramid_meta['first_year'] + 1) * 12)
+        stop = max(first, stop)
+
+    index = np.load(tile_path(pyramid_path, split, variable, zoom, 'tiles'))
+    stored = {}
+    for stat in set(stats) | ({'mean'} if set(stats) - set(level['stats']) else set()):
+        if stat in level['stats']:
+            stored[stat] = np.load(tile_path(pyramid_path, split, variable, zoom, stat), mmap_mode='r')
+
+    def mosaic(stat):
+        tiles = stored[stat]
+        empty = np.full((stop - first, tile_cells, tile_cells), 0 if stat == 'count' else np.nan, dtype=tiles.dtype)
+        # each tile holds all months contiguously, so every read below is one slice of one file region
+        return np.concatenate([
+            np.concatenate([tiles[index[row, column], first:stop] if index[row, column] >= 0 else empty
+                            for column in columns], axis=2) for row in rows
+        ], axis=1)
+
+    result = {stat: mosaic(stat) for stat in stored}
+    # the native level holds one box per cell: min = max = mean and count is 0/1
+    for stat in stats:
+        if stat not in stored:
+            mean = result['mean']
+            result[stat] = (~np.isnan(mean)).astype(stat_dtype(level, stat)) if stat == 'count' else mean.copy()
+    result = {stat: result[stat] for stat in stats}
+
+    cell_degrees = level['cell_degrees']
+    lat = -90.0 + np.concatenate([(row * tile_cells + np.arange(tile_cells)) for row in rows]) * cell_degrees
+    lon = np.concatenate([(column * tile_cells + np.arange(tile_cells)) for column in columns]) * cell_degrees
+    # columns after a wrap around continue east of 360
+    lon = lon + 360.0 * np.concatenate([[0.0], np.cumsum(np.diff(lon) < 0)])
+
+    # drop the padding cells beyond the grid edges
+    keep_lat = np.concatenate([(row * tile_cells + np.arange(tile_cells)) < level['n_lat'] for row in rows])
+    keep_lon = np.concatenate([(column * tile_cells + np.arange(tile_cells)) < level['n_lon'] for column in columns])
+    for stat in stats:
+        result[stat] = result[stat][:, keep_lat][:, :, keep_lon]
+
+    result.update({
+        'lat': lat[keep_lat],
+        'lon': lon[keep_lon],
+        'year': pyramid_meta['first_year'] + time_axis[first:stop] // 12,
+        'month': time_axis[first:stop] % 12 + 1,
+        'zoom': zoom,
+        'cell_degrees': cell_degrees,
+        'tiles': [(row, column) for row in rows for column in columns],
+    })
+    return result
+
+
+def viewport_frames(viewport, stat='mean'):
+    """
+    long format DataFrame of the non-empty cells of a read_viewport result with a 'date' frame column for
+    plotly animation_frame / folium time sliders; latitude and longitude are cell centres, longitudes in [-180, 180)
+    """
+    values = viewport[stat]
+    t, i, j = np.nonzero(~np.isnan(values) if values.dtype.kind == 'f' else values > 0)
+    half = viewport['cell_degrees'] / 2.0
+    dates = np.asarray([f"{year}-{month:02d}" for year, month in zip(viewport['year'], viewport['month'])])
+    df = pd.DataFrame({
+        'date': dates[t],
+        'latitude': np.minimum(viewport['lat'][i] + half, 90.0),
+        'longitude': np.mod(viewport['lon'][j] + half + 180.0, 360.0) - 180.0,
+        stat: values[t, i, j],
+    })
+    if stat != 'count' and 'count' in viewport:
+        df['count'] = viewport['count'][t, i, j]
+    return df
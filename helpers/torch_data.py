@@ -0,0 +1,241 @@
+"""streaming float32 batches from the on-disk per-group arrow/parquet splits for PyTorch training"""
+import os
+import json
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from helpers.extraction import FMISS
+
+try:
+    import torch
+    from torch.utils.data import DataLoader, IterableDataset, get_worker_info
+except ImportError:  # the numpy batch iterator works without torch
+    torch = None
+    DataLoader = None
+    IterableDataset = object
+
+    def get_worker_info():
+        return None
+
+
+def split_data_files(dataset_path, split):
+    """
+    data files of a split in load order: the arrow files listed in state.json (save_to_disk layout)
+    or the parquet files of the split folder
+    """
+    split_path = os.path.join(dataset_path, str(split))
+    state_path = os.path.join(split_path, "state.json")
+    if os.path.exists(state_path):
+        with open(state_path, "r", encoding="utf-8") as f:
+            return [os.path.join(split_path, data_file["filename"]) for data_file in json.load(f)["_data_files"]]
+    files = sorted(f for f in os.listdir(split_path) if f.endswith(".parquet"))
+    if not files:
+        raise FileNotFoundError(f"No arrow or parquet data files in {split_path}")
+    return [os.path.join(split_path, f) for f in files]
+
+
+def list_read_units(data_files):
+    """
+    (file, unit, rows) triples of the parts that can be read independently: record batches of arrow stream files,
+    row groups of parquet files; reading the arrow batch list only touches the memory-mapped batch headers
+    """
+    units = []
+    for path in data_files:
+        if path.endswith(".parquet"):
+            metadata = pq.ParquetFile(path).metadata
+            units.extend((path, i, metadata.row_group(i).num_rows) for i in range(metadata.num_row_groups))
+        else:
+            with pa.memory_map(path, "r") as source:
+                units.extend((path, i, batch.num_rows) for i, batch in enumerate(pa.ipc.open_stream(source)))
+    return units
+
+
+def read_unit(path, unit, columns, open_files):
+    """
+    one record batch / row group as a float32 (rows, columns) array, nulls and FMISS become NaN
+    open_files caches the ParquetFile or the memory-mapped record batches of every file already read
+    """
+    if path not in open_files:
+        if path.endswith(".parquet"):
+            open_files[path] = pq.ParquetFile(path)
+        else:
+            open_files[path] = list(pa.ipc.open_stream(pa.memory_map(path, "r")))
+
+    if path.endswith(".parquet"):
+        table = open_files[path].read_row_group(unit, columns=columns)
+        arrays = [table.column(column) for column in columns]
+    else:
+        batch = open_files[path][unit]
+        arrays = [batch.column(column) for column in columns]
+
+    values = np.empty((len(arrays[0]) if arrays else 0, len(columns)), dtype=np.float32)
+    for j, array in enumerate(arrays):
+        if pa.types.is_dictionary(array.type):
+            raise TypeError(f"Column '{columns[j]}' is not numeric")
+        values[:, j] = array.to_numpy(zero_copy_only=False)
+    values[values == FMISS] = np.nan
+    return values
+
+
+def shard_info(rank=None, world_size=None):
+    """
+    (shard index, number of shards) of the calling DataLoader worker across all ranks
+    rank and world_size default to the initialized torch.distributed process group, else to a single rank
+    """
+    if rank is None or world_size is None:
+        if torch is not None and torch.distributed.is_available() and torch.distributed.is_initialized():
+            rank, world_size = torch.distributed.get_rank(), torch.distributed.get_world_size()
+        else:
+            rank, world_size = 0, 1
+    worker = get_worker_info()
+    worker_id, num_workers = (worker.id, worker.num_workers) if worker is not None else (0, 1)
+    return rank * num_workers + worker_id, world_size * num_workers
+
+
+class ICOADSStreamingDataset(IterableDataset):
+    """
+    iterable dataset yielding fixed-size float32 batches of selected columns of one or more group splits
+    the splits are read record batch by record batch from disk, so memory is bounded by the shuffle buffer;
+    units (record batches / row groups) are dealt round robin to the DataLoader workers of all ranks and the
+    assignment only depends on the seed, the epoch and the shard layout; every shard yields the same number of
+    batches, as DDP needs the same number of steps on every rank: with drop_last all shards stop at the full
+    batches of the smallest one, otherwise the smaller shards repeat their first rows up to the rows of the
+    largest one, so every row is seen at least once per epoch
+    Args:
+        dataset_path (str): output folder of parse_all_groups_arrow / save_to_disk, or a parquet layout
+        splits (str or list): group split(s), all need the selected columns
+        columns (list): numeric columns, e.g. ["latitude", "longitude", "sea_surface_temp_mean"]
+        batch_size (int): rows per batch
+        shuffle_buffer (int): rows kept in the shuffle buffer, 0 keeps the on-disk order within the units
+        shuffle_units (bool): permute the unit order every epoch, None shuffles the units whenever shuffle_buffer
+                              is set; note that the round robin dealing makes the shard of every unit depend on it
+        seed (int): seed of the unit order and the shuffle buffer
+        fill_value (float): replaces missing values if given, otherwise they stay NaN
+        return_mask (bool): also yield a boolean (batch, columns) mask of present values
+        drop_last (bool): drop the last incomplete batch and the rows beyond the full batches of the smallest shard
+        rank, world_size (int): distributed shard layout, see shard_info
+    """
+
+    def __init__(self, dataset_path, splits, columns, batch_size=1024, shuffle_buffer=0, seed=0, fill_value=None,
+                 return_mask=False, drop_last=False, rank=None, world_size=None, shuffle_units=None):
+        self.splits = [splits] if isinstance(splits, (str, int)) else list(splits)
+        self.columns = list(columns)
+        self.batch_size = batch_size
+        self.shuffle_buffer = shuffle_buffer
+        self.shuffle_units = bool(shuffle_buffer) if shuffle_units is None else shuffle_units
+        self.seed = seed
+        self.fill_value = fill_value
+        self.return_mask = return_mask
+        self.drop_last = drop_last
+        self.rank = rank
+        self.world_size = world_size
+        self.epoch = 0
+        self.units = list_read_units([path for split in self.splits for path in split_data_files(dataset_path, split)])
+
+    def set_epoch(self, epoch):
+        """
+        changes the shuffled unit order and shuffle buffer draws of the next iteration
+        """
+        self.epoch = epoch
+
+    def shard_units(self):
+        """
+        units of the calling shard, the shard index and the number of rows every shard yields
+        """
+        units = self.units
+        if self.shuffle_units:
+            order = np.random.default_rng((self.seed, self.epoch)).permutation(len(units))
+            units = [units[i] for i in order]
+        shard, num_shards = shard_info(self.rank, self.world_size)
+        shard_rows = [sum(rows for _, _, rows in units[i::num_shards]) for i in range(num_shards)]
+        if self.drop_last:
+            n_rows = min(shard_rows) // self.batch_size * self.batch_size
+        else:
+            n_rows = max(shard_rows)
+        return units[shard::num_shards], shard, n_rows
+
+    def shard_values(self, units, n_rows):
+        """
+        (rows, columns) arrays of the units of a shard cut or repeated to exactly n_rows rows, a shard without
+        units repeats the units of all shards
+        """
+        open_files = {}
+        source = units or self.units
+        remaining, i = n_rows, 0
+        while remaining > 0:
+            path, unit, _ = source[i % len(source)]
+            values = read_unit(path, unit, self.columns, open_files)[:remaining]
+            remaining -= len(values)
+            i += 1
+            yield values
+
+    def finish(self, batch):
+        missing = np.isnan(batch)
+        if self.fill_value is not None:
+            batch[missing] = self.fill_value
+        return (batch, ~missing) if self.return_mask else batch
+
+    def iter_numpy(self):
+        """
+        yields the batches of the calling shard as numpy arrays (__iter__ yields the same batches as tensors)
+        the rows live in one preallocated buffer: a shuffled batch is drawn without replacement and its slots are
+        refilled from the tail of the buffer, so every batch costs O(batch_size) copies, not O(shuffle_buffer)
+        """
+        units, shard, n_rows = self.shard_units()
+        rng = np.random.default_rng((self.seed, self.epoch, shard))
+        buffer = np.empty((self.shuffle_buffer + self.batch_size, len(self.columns)), dtype=np.float32)
+        filled = 0
+
+        for values in self.shard_values(units, n_rows):
+            if filled + len(values) > len(buffer):
+                grown = np.empty((max(2 * len(buffer), filled + len(values)), len(self.columns)), dtype=np.float32)
+                grown[:filled] = buffer[:filled]
+                buffer = grown
+            buffer[filled:filled + len(values)] = values
+            filled += len(values)
+
+            if self.shuffle_buffer:
+                while filled >= self.shuffle_buffer + self.batch_size:
+                    take = rng.choice(filled, self.batch_size, replace=False)
+                    yield self.finish(buffer[take])
+                    # move the tail rows that were not drawn into the drawn slots before the tail
+                    tail_start = filled - self.batch_size
+                    drawn = np.zeros(self.batch_size, dtype=bool)
+                    drawn[take[take >= tail_start] - tail_start] = True
+                    buffer[take[take < tail_start]] = buffer[tail_start:filled][~drawn]
+                    filled = tail_start
+            else:
+                n_full = filled // self.batch_size * self.batch_size
+                for start in range(0, n_full, self.batch_size):
+                    yield self.finish(buffer[start:start + self.batch_size].copy())
+                buffer[:filled - n_full] = buffer[n_full:filled]
+                filled -= n_full
+
+        rest = buffer[:filled]
+        if self.shuffle_buffer:
+            rest = rest[rng.permutation(filled)]
+        n_full = filled // self.batch_size * self.batch_size
+        for start in range(0, n_full, self.batch_size):
+            yield self.finish(rest[start:start + self.batch_size].copy())
+        if not self.drop_last and n_full < filled:
+            yield self.finish(rest[n_full:].copy())
+
+    def __iter__(self):
+        if torch is None:
+            raise ImportError("PyTorch is required for tensor batches, use iter_numpy() for numpy batches")
+        for batch in self.iter_numpy():
+            if self.return_mask:
+                yield torch.from_numpy(batch[0]), torch.from_numpy(batch[1])
+            else:
+                yield torch.from_numpy(batch)
+
+
+def make_icoads_dataloader(dataset_path, splits, columns, batch_size=1024, num_workers=2, **kwargs):
+    """
+    DataLoader over an ICOADSStreamingDataset, batching is done by the dataset so the loader runs with
+    batch_size=None; call loader.dataset.set_epoch(epoch) before every epoch when shuffling
+    """
+    if torch is None:
+        raise ImportError("PyTorch is required for make_icoads_dataloader")
+    dataset = ICOADSStreamingDataset(dataset_path, splits, columns, batch_size=batch_size, **kwargs)
+    return DataLoader(dataset, batch_size=None, num_workers=num_workers, persistent_workers=False)
@@ -0,0 +1,132 @@
+"""batched per-box linear trends with significance over the (time, lat, lon) cubes"""
+import os
+import warnings
+import numpy as np
+from scipy import stats
+from helpers.cubes import load_cube, time_index
+
+
+def deseasonalize(values):
+    """
+    subtracts the mean of every calendar month per cell from a (time, cells) block starting in January,
+    months without any data in a cell stay NaN
+    """
+    n_time = values.shape[0]
+    n_years = -(-n_time // 12)
+    padded = np.full((n_years * 12,) + values.shape[1:], np.nan, dtype=np.float64)
+    padded[:n_time] = values
+    by_month = padded.reshape((n_years, 12) + values.shape[1:])
+    with warnings.catch_warnings():
+        # calendar months without data in a cell ("mean of empty slice")
+        warnings.simplefilter('ignore', RuntimeWarning)
+        climatology = np.nanmean(by_month, axis=0)
+    return (by_month - climatology).reshape(padded.shape)[:n_time]
+
+
+def fit_trends(values, times):
+    """
+    ordinary least squares fit values = intercept + slope * times for every column of a (time, cells) block,
+    NaN entries are left out of each fit
+    Returns:
+        dict: slope, intercept, stderr, t, p_value (two sided, n - 2 degrees of freedom) and count per cell,
+              NaN where fewer than 3 values are present
+    """
+    valid = ~np.isnan(values)
+    y = np.where(valid, values, 0.0)
+    x = np.where(valid, times[:, None], 0.0)
+
+    n = valid.sum(axis=0).astype(np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        x_mean = x.sum(axis=0) / n
+        y_mean = y.sum(axis=0) / n
+        dx = np.where(valid, x - x_mean, 0.0)
+        dy = np.where(valid, y - y_mean, 0.0)
+        sxx = np.einsum('ij,ij->j', dx, dx)
+        sxy = np.einsum('ij,ij->j', dx, dy)
+        slope = sxy / sxx
+        intercept = y_mean - slope * x_mean
+
+        residual = np.where(valid, dy - slope * dx, 0.0)
+        sse = np.einsum('ij,ij->j', residual, residual)
+        dof = n - 2
+        stderr = np.sqrt(sse / dof / sxx)
+        t = slope / stderr
+        p_value = 2.0 * stats.t.sf(np.abs(t), dof)
+
+    enough = (n >= 3) & (sxx > 0)
+    result = {'slope': slope, 'intercept': intercept, 'stderr': stderr, 't': t, 'p_value': p_value}
+    for key, array in result.items():
+        result[key] = np.where(enough, array, np.nan)
+    # a perfect fit has zero standard error, its trend is as significant as it gets
+    result['p_value'] = np.where(enough & (sse == 0) & (slope != 0), 0.0, result['p_value'])
+    result['count'] = n.astype(np.int32)
+    return result
+
+
+def compute_trend_grids(cube_path, split, variable, years=None, deseasonalize_months=True, min_count=24,
+                        rows_per_block=8, output_path=None):
+    """
+    per box linear trend of a cube variable with p-values, all boxes of a block of latitude rows are fitted at once
+    Args:
+        cube_path (str): folder of the cubes written by build_group_cubes
+        split (str): group split (e.g., "3")
+        variable (str): cube variable (e.g., "sea_surface_temp_mean")
+        years (tuple): (first, last) year, inclusive, None for the whole cube
+        deseasonalize_months (bool): remove the mean annual cycle of every box before fitting
+        min_count (int): boxes with fewer months of data get NaN trends
+        rows_per_block (int): latitude rows fitted at once, bounds the temporary memory
+        output_path (str): npz file, defaults to cube_path/{split}/trends/{variable}.npz
+    Returns:
+        dict: (lat, lon) grids slope_per_decade, p_value, stderr_per_decade and count, plus the lat/lon axes
+    """
+    cube, coords = load_cube(cube_path, split, variable)
+    first = 0
+    stop = coords['n_time']
+    if years is not None:
+        first = max(0, time_index(coords, years[0], 1))
+        stop = min(stop, time_index(coords, years[1], 12) + 1)
+    # the fit time axis is in decimal years from the first month
+    times = coords['year'][first:stop] + (coords['month'][first:stop] - 1) / 12.0
+    times = times - times[0]
+
+    n_lat, n_lon = coords['n_lat'], coords['n_lon']
+    grids = {
+        'slope_per_decade': np.full((n_lat, n_lon), np.nan, dtype=np.float32),
+        'p_value': np.full((n_lat, n_lon), np.nan, dtype=np.float32),
+        'stderr_per_decade': np.full((n_lat, n_lon), np.nan, dtype=np.float32),
+        'count': np.zeros((n_lat, n_lon), dtype=np.int32),
+    }
+
+    for row in range(0, n_lat, rows_per_block):
+        rows = slice(row, min(row + rows_per_block, n_lat))
+        block = np.asarray(cube[first:stop, rows], dtype=np.float64).reshape(stop - first, -1)
+        if deseasonalize_months:
+            # the block has to start in January for the calendar month reshape
+            offset = coords['month'][first] - 1
+            block = deseasonalize(np.concatenate([np.full((offset, block.shape[1]), np.nan), block]))[offset:]
+        fit = fit_trends(block, times)
+
+        shape = (rows.stop - rows.start, n_lon)
+        keep = fit['count'] >= min_count
+        grids['slope_per_decade'][rows] = np.where(keep, fit['slope'] * 10.0, np.nan).reshape(shape)
+        grids['p_value'][rows] = np.where(keep, fit['p_value'], np.nan).reshape(shape)
+        grids['stderr_per_decade'][rows] = np.where(keep, fit['stderr'] * 10.0, np.nan).reshape(shape)
+        grids['count'][rows] = fit['count'].reshape(shape)
+
+    if output_path is None:
+        output_path = os.path.join(cube_path, split, "trends", f"{variable}.npz")
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    grids['lat'] = np.asarray(coords['lat'], dtype=np.float32)
+    grids['lon'] = np.asarray(coords['lon'], dtype=np.float32)
+    grids['years'] = np.asarray([coords['year'][first], coords['year'][stop - 1]])
+    np.savez(output_path, **grids)
+
+    significant = int(np.sum(grids['p_value'] < 0.05))
+    fitted = int(np.sum(~np.isnan(grids['slope_per_decade'])))
+    print(f"Trends of {variable} (split {split}): {fitted:,} boxes fitted, {significant:,} significant at p < 0.05")
+    return grids
+
+
+def load_trend_grids(cube_path, split, variable):
+    with np.load(os.path.join(cube_path, split, "trends", f"{variable}.npz")) as grids:
+        return {key: grids[key] for key in grids.files}
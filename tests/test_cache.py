@@ -0,0 +1,17 @@
+"""split invalidation of the ICOADS subset cache"""
+import helpers.hf as hf
+from helpers.hf import ICOADSCache
+
+
+def test_invalidate_drops_filtered_entries_of_the_split(monkeypatch):
+    monkeypatch.setattr(hf, "dataset_nbytes", lambda dataset: 1)
+    cache = ICOADSCache(max_entries=None)
+    for key in ["3", ("3", ("year",), "None"), ("3", None, "(year >= 1970)"), "4", ("4", None, "(month == 1)")]:
+        cache.put(key, object())
+
+    cache.invalidate("3")
+    assert list(cache.entries) == ["4", ("4", None, "(month == 1)")]
+    assert cache.nbytes == 2
+
+    cache.invalidate()
+    assert len(cache) == 0 and cache.nbytes == 0
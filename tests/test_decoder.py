@@ -0,0 +1,86 @@
+"""parity of the vectorized decode_msg1_buffer with the scalar unpack -> convert -> columns path"""
+import numpy as np
+import pandas as pd
+import pytest
+from helpers.extraction import (
+    FMISS,
+    GROUP_DEFINITIONS,
+    convert_to_true_values,
+    create_record_columns,
+    decode_msg1_buffer,
+    unpack_msg1_record,
+)
+from helpers.synthetic import generate_msg1_records
+
+SOURCE_FILE = "MSG1.197001.gz"
+
+
+def decode_scalar(data, source_file):
+    """
+    the record loop of parse_tar_file: {group: list of record dicts}
+    """
+    records = {}
+    for offset in range(0, len(data) - 63, 64):
+        record_bytes = data[offset:offset + 64]
+        if (record_bytes[1] % 16) == 1:
+            coded = unpack_msg1_record(record_bytes)
+            if coded:
+                ftrue = convert_to_true_values(coded, coded[8])
+                records.setdefault(coded[8], []).append(create_record_columns(ftrue, coded[8], source_file))
+    return records
+
+
+def mixed_buffer(group, other_group, rng):
+    """
+    records of a group interleaved with records of another group, all-missing (FMISS) records,
+    records of the wrong type and trailing bytes that do not form a complete record
+    """
+    records = generate_msg1_records(group, 1970, 1, 200, missing_ratio=0.2, rng=rng)
+    missing = generate_msg1_records(group, 1970, 1, 20, missing_ratio=1.0, rng=rng)
+    others = generate_msg1_records(other_group, 1970, 1, 30, rng=rng)
+    wrong_type = generate_msg1_records(group, 1970, 1, 10, rng=rng)
+    wrong_type[:, 1] = (wrong_type[:, 1] // 16) * 16 + 2
+
+    stacked = np.concatenate([records, missing, others, wrong_type])
+    return stacked[rng.permutation(len(stacked))].tobytes() + b"\x00" * 17
+
+
+def assert_tables_equal(batch, scalar):
+    expected = pd.DataFrame(scalar)
+    actual = pd.DataFrame(batch)
+    assert list(actual.columns) == list(expected.columns)
+    for column in expected.columns:
+        assert actual[column].dtype == expected[column].dtype, column
+        np.testing.assert_array_equal(actual[column].to_numpy(), expected[column].to_numpy(), err_msg=column)
+
+
+@pytest.mark.parametrize("group", sorted(GROUP_DEFINITIONS))
+def test_batch_decoder_matches_scalar_decoder(group):
+    rng = np.random.default_rng(group)
+    other_group = 3 if group != 3 else 4
+    data = mixed_buffer(group, other_group, rng)
+
+    scalar = decode_scalar(data, SOURCE_FILE)
+    batch = decode_msg1_buffer(data, SOURCE_FILE)
+
+    assert sorted(batch) == sorted(scalar) == sorted([group, other_group])
+    for decoded_group in scalar:
+        assert_tables_equal(batch[decoded_group], scalar[decoded_group])
+
+
+@pytest.mark.parametrize("group", sorted(GROUP_DEFINITIONS))
+def test_missing_values_decode_to_fmiss(group):
+    data = generate_msg1_records(group, 1999, 12, 25, missing_ratio=1.0, rng=np.random.default_rng(0)).tobytes()
+    table = decode_msg1_buffer(data, SOURCE_FILE)[group]
+    statistics = [column for column in table if column.endswith(('_tercile1', '_median', '_tercile3', '_mean'))]
+    assert len(statistics) == 16
+    for column in statistics:
+        assert np.all(table[column] == FMISS), column
+    assert_tables_equal(table, decode_scalar(data, SOURCE_FILE)[group])
+
+
+def test_buffer_without_valid_records():
+    records = generate_msg1_records(3, 1970, 1, 5, rng=np.random.default_rng(0))
+    records[:, 1] = 0
+    assert decode_msg1_buffer(records.tobytes() + b"\x01" * 63, SOURCE_FILE) == {}
+    assert decode_scalar(records.tobytes(), SOURCE_FILE) == {}
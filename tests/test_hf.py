@@ -0,0 +1,32 @@
+"""pushdown scans of memory-mapped splits and the cache byte budget"""
+import numpy as np
+import pyarrow.dataset as pads
+from datasets import Dataset, DatasetDict, concatenate_datasets, load_from_disk
+from helpers.hf import dataset_nbytes, scan_arrow_split
+
+
+def saved_split(tmp_path):
+    Dataset.from_dict({"year": np.arange(1000) % 10 + 1970, "value": np.arange(1000.0)}).save_to_disk(str(tmp_path))
+    return load_from_disk(str(tmp_path))
+
+
+def test_projection_stays_memory_mapped(tmp_path):
+    dataset = saved_split(tmp_path)
+    view = scan_arrow_split(dataset, ["value"])
+    assert view.column_names == ["value"]
+    assert view.cache_files == dataset.cache_files
+    np.testing.assert_array_equal(view["value"], np.arange(1000.0))
+
+
+def test_filter_copies_only_the_matching_rows(tmp_path):
+    result = scan_arrow_split(saved_split(tmp_path), ["value"], pads.field("year") == 1971)
+    assert result.cache_files == []
+    np.testing.assert_array_equal(result["value"], np.arange(1.0, 1000.0, 10.0))
+
+
+def test_cache_budget_counts_only_in_memory_tables(tmp_path):
+    dataset = saved_split(tmp_path)
+    assert dataset_nbytes(dataset) == 0
+    assert dataset_nbytes(scan_arrow_split(dataset, ["value"], pads.field("year") == 1971)) == 100 * 8
+    in_memory = Dataset.from_dict({"value": np.arange(10.0)})
+    assert dataset_nbytes(DatasetDict({"3": concatenate_datasets([dataset, in_memory])})) == 10 * 8
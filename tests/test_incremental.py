@@ -0,0 +1,26 @@
+"""the incremental ingest reports every member as a metrics event"""
+import os
+from helpers.incremental import parse_all_groups_incremental
+from helpers.metrics import CallbackSink, PipelineMetrics
+from test_streaming import write_tar_with_corrupt_member
+
+
+def test_members_and_member_errors_are_events(tmp_path, capsys):
+    tar_path = write_tar_with_corrupt_member(tmp_path)
+    events = []
+    metrics = PipelineMetrics([CallbackSink(events.append)])
+    output_path, group_rows = parse_all_groups_incremental(os.path.dirname(tar_path), [os.path.basename(tar_path)],
+                                                           str(tmp_path / "out"), workers=1, metrics=metrics)
+    assert group_rows == {3: 4000}
+
+    members = [event for event in events if event['event'] == 'member']
+    errors = [event for event in events if event['event'] == 'member_error']
+    assert [event['member'] for event in members] == ["MSG1.197001.gz", "MSG1.197003.gz"]
+    assert all(event['records'] == 2000 and event['groups'] == {'3': 2000} for event in members)
+    assert [event['member'] for event in errors] == ["MSG1.197002.gz"]
+    assert metrics.counters[('members_failed', None)] == 1
+
+    # per member lines only go to the metrics, the failed member is still listed at the end
+    out = capsys.readouterr().out
+    assert "MSG1.197001.gz" not in out
+    assert "MSG1.197002.gz" in out
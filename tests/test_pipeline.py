@@ -0,0 +1,45 @@
+"""the threaded ingestion pipeline keeps input order and a bounded number of members in flight"""
+import gzip
+import threading
+import time
+import types
+import helpers.pipeline as pipeline
+from helpers.extraction import decode_msg1_buffer, list_tar_members
+from helpers.synthetic import write_synthetic_tar
+
+
+def test_slow_member_bounds_members_in_flight(tmp_path, monkeypatch):
+    units = list_tar_members(write_synthetic_tar(str(tmp_path), 3, [1970, 1971, 1972], 50))
+    slow_member = units[5][1]
+    decompressed = []
+    lock = threading.Lock()
+
+    def decompress(raw):
+        with lock:
+            decompressed.append(1)
+        return gzip.decompress(raw)
+
+    def decode(data, source_file, keep_raw=False):
+        if source_file == slow_member:
+            time.sleep(0.5)
+        return decode_msg1_buffer(data, source_file, keep_raw)
+
+    monkeypatch.setattr(pipeline, "gzip", types.SimpleNamespace(decompress=decompress))
+    monkeypatch.setattr(pipeline, "decode_msg1_buffer", decode)
+
+    queue_depth, decompress_threads, decode_threads = 2, 2, 3
+    bound = queue_depth + decompress_threads + decode_threads
+    written = []
+    in_flight = []
+
+    def write(unit, tables, error):
+        assert error is None
+        in_flight.append(len(decompressed) - len(written))
+        written.append(unit[1])
+
+    pipeline.run_ingestion_pipeline(units, write, queue_depth, decompress_threads, decode_threads)
+
+    assert written == [unit[1] for unit in units]
+    assert max(in_flight) <= bound
+    # without the bound every member after the slow one would have been decompressed while it was stuck
+    assert in_flight[5] < len(units) - 5
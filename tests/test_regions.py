@@ -0,0 +1,38 @@
+"""region tables are only cached when the land lookup worked"""
+import os
+import urllib.error
+import numpy as np
+import pytest
+import helpers.regions as regions
+from helpers.regions import load_region_table, region_table_path
+
+
+@pytest.fixture(autouse=True)
+def fresh_tables(monkeypatch):
+    monkeypatch.setattr(regions, "_UNPERSISTED_TABLES", {})
+
+
+def test_table_is_not_cached_when_the_download_fails(tmp_path, monkeypatch):
+    def offline(resolution):
+        raise urllib.error.URLError("offline")
+
+    monkeypatch.setattr(regions, "land_percent_grid", offline)
+    table = load_region_table(10.0, str(tmp_path))
+    assert (table['land_percent'] == 255).all()
+    assert not os.path.exists(region_table_path(10.0, str(tmp_path)))
+    assert load_region_table(10.0, str(tmp_path)) is table
+
+
+def test_table_is_cached_when_the_land_lookup_works(tmp_path, monkeypatch):
+    monkeypatch.setattr(regions, "land_percent_grid", lambda resolution: np.zeros((19, 36), dtype=np.uint8))
+    load_region_table(10.0, str(tmp_path))
+    assert os.path.exists(region_table_path(10.0, str(tmp_path)))
+
+
+def test_unexpected_land_errors_propagate(tmp_path, monkeypatch):
+    def broken(resolution):
+        raise ValueError("bug")
+
+    monkeypatch.setattr(regions, "land_percent_grid", broken)
+    with pytest.raises(ValueError):
+        load_region_table(10.0, str(tmp_path))
@@ -0,0 +1,30 @@
+"""the repack index only loads next to the archive it was written with"""
+import os
+import shutil
+import pytest
+from helpers.repack import INDEX_SUFFIX, list_archive_months, load_repack_index, repack_tar
+from helpers.synthetic import write_synthetic_tar
+
+
+def test_index_refuses_another_archive(tmp_path):
+    tar_path = write_synthetic_tar(str(tmp_path), 3, [1970], 50)
+    archive_path = repack_tar(tar_path, str(tmp_path / "small"), frame_records=16)
+    other_path = repack_tar(tar_path, str(tmp_path / "large"), frame_records=1024)
+    assert sum(list_archive_months(archive_path).values()) == 12 * 50
+    load_repack_index(archive_path, verify=True)
+
+    # an interrupted replace leaves the new archive next to the old index
+    shutil.copy(other_path, archive_path)
+    with pytest.raises(ValueError):
+        load_repack_index(archive_path)
+
+    # same size, different content
+    shutil.copy(other_path + INDEX_SUFFIX, archive_path + INDEX_SUFFIX)
+    with open(archive_path, 'r+b') as f:
+        f.seek(os.path.getsize(archive_path) // 2)
+        byte = f.read(1)
+        f.seek(-1, os.SEEK_CUR)
+        f.write(bytes([byte[0] ^ 0xFF]))
+    load_repack_index(archive_path)
+    with pytest.raises(ValueError):
+        load_repack_index(archive_path, verify=True)
@@ -0,0 +1,36 @@
+"""rollups re-accumulate exactly the months whose rows changed"""
+import os
+import numpy as np
+from helpers.column_store import ColumnStoreWriter
+from helpers.extraction import decode_msg1_buffer
+from helpers.hf import load_column_store, load_column_store_meta
+from helpers.rollups import load_rollup, month_row_ranges, refresh_rollups
+from helpers.synthetic import generate_msg1_records
+
+VARIABLE = "sea_surface_temp_mean"
+
+
+def test_rows_rewritten_in_place_are_refreshed(tmp_path, capsys):
+    store_path = str(tmp_path / "store")
+    with ColumnStoreWriter(store_path) as writer:
+        for month in (1, 2, 3):
+            data = generate_msg1_records(3, 1970, month, 200, missing_ratio=0.0, rng=np.random.default_rng(month))
+            writer.write(3, decode_msg1_buffer(data.tobytes(), f"MSG1.1970{month:02d}.gz")[3])
+    refresh_rollups(store_path, "3", str(tmp_path / "rollups"), [VARIABLE], baseline=(1970, 1970))
+    before = load_rollup(str(tmp_path / "rollups"), "3", VARIABLE, "annual")['mean']
+
+    # same rows and source files, one value of February corrected in place
+    start, stop = month_row_ranges(store_path, "3")[(1970, 2)]
+    column = load_column_store(store_path, "3", [VARIABLE])[VARIABLE]
+    row = start + int(np.flatnonzero(~np.isnan(column[start:stop]))[0])
+    dtype = load_column_store_meta(store_path, "3")['dtypes'][VARIABLE]
+    values = np.fromfile(os.path.join(store_path, "3", f"{VARIABLE}.bin"), dtype=dtype)
+    values[row] += 10.0
+    values.tofile(os.path.join(store_path, "3", f"{VARIABLE}.bin"))
+
+    capsys.readouterr()
+    state = refresh_rollups(store_path, "3", str(tmp_path / "rollups"), [VARIABLE], baseline=(1970, 1970))
+    assert "1 changed and 0 removed months" in capsys.readouterr().out
+    assert not np.array_equal(load_rollup(str(tmp_path / "rollups"), "3", VARIABLE, "annual")['mean'], before,
+                              equal_nan=True)
+    assert len(state['months']) == 3
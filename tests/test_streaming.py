@@ -0,0 +1,47 @@
+"""the streaming columnar tar decoder skips corrupt members as a whole, like the scalar parse_tar_file"""
+import gzip
+import io
+import tarfile
+import numpy as np
+import pandas as pd
+from helpers.extraction import iter_tar_record_batches, parse_tar_file, parse_tar_file_columnar
+from helpers.synthetic import generate_msg1_records, synthetic_tar_filename
+
+BLOCK_SIZE = 64 * 256
+
+
+def write_tar_with_corrupt_member(tmp_path):
+    """
+    three monthly members of 2000 records, the second one truncated after its first blocks
+    """
+    rng = np.random.default_rng(0)
+    tar_path = tmp_path / synthetic_tar_filename(3, 1970, 1970)
+    with tarfile.open(tar_path, 'w') as tar:
+        for month in (1, 2, 3):
+            data = gzip.compress(generate_msg1_records(3, 1970, month, 2000, rng=rng).tobytes(), mtime=0)
+            if month == 2:
+                data = data[:len(data) // 2]
+            info = tarfile.TarInfo(f"G3/1970/MSG1.1970{month:02d}.gz")
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return str(tar_path)
+
+
+def test_corrupt_member_is_reported_after_its_good_blocks(tmp_path):
+    tar_path = write_tar_with_corrupt_member(tmp_path)
+    batches = list(iter_tar_record_batches(tar_path, BLOCK_SIZE))
+
+    corrupt = [(tables, error) for member, tables, error in batches if member == "MSG1.197002.gz"]
+    assert len(corrupt) > 1
+    assert all(error is None for tables, error in corrupt[:-1])
+    assert corrupt[-1][0] is None and corrupt[-1][1] is not None
+
+
+def test_columnar_parse_matches_scalar_parse_on_corrupt_member(tmp_path):
+    tar_path = write_tar_with_corrupt_member(tmp_path)
+    scalar = pd.DataFrame(parse_tar_file(tar_path))
+    columnar = pd.DataFrame(parse_tar_file_columnar(tar_path, BLOCK_SIZE)[3])
+
+    assert len(columnar) == len(scalar) == 4000
+    assert set(columnar['month']) == {1, 3}
+    pd.testing.assert_frame_equal(columnar, scalar)
@@ -0,0 +1,46 @@
+"""compact tile pyramid: only non-empty tiles, derived native stats"""
+import os
+import numpy as np
+from helpers.column_store import ColumnStoreWriter
+from helpers.extraction import decode_msg1_buffer
+from helpers.synthetic import generate_msg1_records
+from helpers.tiles import build_tile_pyramid, read_viewport
+
+VARIABLE = "sea_surface_temp_mean"
+
+
+def build(tmp_path):
+    with ColumnStoreWriter(str(tmp_path / "store")) as writer:
+        for month in (1, 2):
+            data = generate_msg1_records(3, 1970, month, 40, rng=np.random.default_rng(month)).tobytes()
+            writer.write(3, decode_msg1_buffer(data, f"MSG1.1970{month:02d}.gz")[3])
+    return build_tile_pyramid(str(tmp_path / "store"), "3", str(tmp_path / "pyramid"), [VARIABLE], tile_cells=4)
+
+
+def test_pyramid_stores_only_non_empty_tiles(tmp_path):
+    meta = build(tmp_path)
+    native = meta['levels'][-1]
+    folder = tmp_path / "pyramid" / "3" / VARIABLE
+    assert sorted(os.listdir(folder)) == sorted(
+        f"z{level['zoom']}_{stat}.npy" for level in meta['levels'] for stat in level['stats'] + ['tiles'])
+    assert native['stats'] == ['mean']
+
+    index = np.load(folder / f"z{native['zoom']}_tiles.npy")
+    assert 0 < (index >= 0).sum() < index.size
+    assert np.load(folder / f"z{native['zoom']}_mean.npy", mmap_mode='r').shape[0] == (index >= 0).sum()
+    assert np.load(folder / "z0_count.npy", mmap_mode='r').dtype == np.dtype(meta['levels'][0]['count_dtype'])
+
+
+def test_read_viewport_fills_empty_tiles_and_derives_native_stats(tmp_path):
+    meta = build(tmp_path)
+    zoom = meta['levels'][-1]['zoom']
+    view = read_viewport(str(tmp_path / "pyramid"), "3", VARIABLE, zoom=zoom, stats=('mean', 'count', 'min', 'max'))
+    valid = ~np.isnan(view['mean'])
+    assert view['mean'].shape == (meta['n_time'], meta['levels'][-1]['n_lat'], meta['levels'][-1]['n_lon'])
+    np.testing.assert_array_equal(view['count'], valid)
+    np.testing.assert_array_equal(view['min'], view['mean'])
+    np.testing.assert_array_equal(view['max'], view['mean'])
+
+    # the coarser levels add up the native boxes
+    top = read_viewport(str(tmp_path / "pyramid"), "3", VARIABLE, zoom=0, stats=('count',))
+    assert top['count'].sum() == valid.sum()
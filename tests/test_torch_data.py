@@ -0,0 +1,60 @@
+"""the streaming dataset yields every row exactly once per epoch, shuffled or not"""
+import numpy as np
+import pytest
+from datasets import Dataset
+from helpers.torch_data import ICOADSStreamingDataset
+
+COLUMNS = ["row", "value"]
+
+
+@pytest.fixture
+def dataset_path(tmp_path):
+    n_rows = 10_000
+    rows = np.arange(n_rows, dtype=np.float64)
+    Dataset.from_dict({"row": rows, "value": rows * 0.5}).save_to_disk(str(tmp_path / "3"), max_shard_size="40KB")
+    return str(tmp_path)
+
+
+def collect(dataset):
+    return np.concatenate(list(dataset.iter_numpy()))
+
+
+def test_unshuffled_batches_keep_the_on_disk_order(dataset_path):
+    batches = list(ICOADSStreamingDataset(dataset_path, "3", COLUMNS, batch_size=333).iter_numpy())
+    assert all(len(batch) == 333 for batch in batches[:-1])
+    np.testing.assert_array_equal(np.concatenate(batches)[:, 0], np.arange(10_000))
+
+
+@pytest.mark.parametrize("shuffle_buffer", [100, 2_000, 50_000])
+def test_shuffle_buffer_yields_every_row_once(dataset_path, shuffle_buffer):
+    dataset = ICOADSStreamingDataset(dataset_path, "3", COLUMNS, batch_size=64, shuffle_buffer=shuffle_buffer, seed=1)
+    rows = collect(dataset)
+    assert not np.array_equal(rows[:, 0], np.arange(10_000))
+    np.testing.assert_array_equal(np.sort(rows[:, 0]), np.arange(10_000))
+    np.testing.assert_array_equal(rows[:, 1], rows[:, 0] * 0.5)
+    np.testing.assert_array_equal(collect(dataset), rows)
+
+    dataset.set_epoch(1)
+    assert not np.array_equal(collect(dataset), rows)
+
+
+def test_shards_cover_all_rows(dataset_path):
+    shards = [collect(ICOADSStreamingDataset(dataset_path, "3", COLUMNS, batch_size=100, shuffle_buffer=500,
+                                             rank=rank, world_size=3))[:, 0] for rank in range(3)]
+    np.testing.assert_array_equal(np.unique(np.concatenate(shards)), np.arange(10_000))
+
+
+@pytest.mark.parametrize("world_size", [2, 3, 4, 12])
+@pytest.mark.parametrize("drop_last", [False, True])
+def test_shards_yield_the_same_number_of_batches(dataset_path, world_size, drop_last):
+    shards = [list(ICOADSStreamingDataset(dataset_path, "3", COLUMNS, batch_size=128, shuffle_buffer=500,
+                                          drop_last=drop_last, rank=rank, world_size=world_size).iter_numpy())
+              for rank in range(world_size)]
+    assert len({len(batches) for batches in shards}) == 1
+    assert len({tuple(len(batch) for batch in batches) for batches in shards}) == 1
+
+    rows = np.concatenate([batch[:, 0] for batches in shards for batch in batches] + [np.empty(0)])
+    if drop_last:
+        assert len(np.unique(rows)) == len(rows)
+    else:
+        np.testing.assert_array_equal(np.unique(rows), np.arange(10_000))
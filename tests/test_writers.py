@@ -0,0 +1,76 @@
+"""writers only publish metadata when the ingest finished without an exception"""
+import os
+import numpy as np
+import pytest
+from datasets import load_from_disk
+from helpers.arrow_writer import GroupArrowWriter
+from helpers.column_store import STORE_INDEX_FILENAME, STORE_META_FILENAME, ColumnStoreWriter
+from helpers.extraction import decode_msg1_buffer
+from helpers.raw_sidecar import SIDECAR_META_FILENAME, RawRecordWriter, decode_raw_fields
+from helpers.synthetic import generate_msg1_records
+
+
+def decoded_table(group=3, n_records=50):
+    data = generate_msg1_records(group, 1970, 1, n_records, rng=np.random.default_rng(0)).tobytes()
+    return decode_msg1_buffer(data, "MSG1.197001.gz", keep_raw=True)[group]
+
+
+def test_group_writer_publishes_metadata_on_success(tmp_path):
+    with GroupArrowWriter(str(tmp_path)) as writer:
+        writer.write(3, decoded_table())
+    assert len(load_from_disk(str(tmp_path))["3"]) == 50
+
+
+@pytest.mark.parametrize("file_format", ["arrow", "parquet"])
+def test_group_writer_skips_metadata_on_failure(tmp_path, file_format):
+    with GroupArrowWriter(str(tmp_path), file_format) as writer:
+        writer.write(3, decoded_table())
+    with pytest.raises(RuntimeError):
+        with GroupArrowWriter(str(tmp_path), file_format) as writer:
+            writer.write(3, decoded_table())
+            raise RuntimeError("ingest failed")
+
+    files = set(os.listdir(tmp_path / "3"))
+    if file_format == "arrow":
+        assert not files & {"state.json", "dataset_info.json"}
+        assert not os.path.exists(tmp_path / "dataset_dict.json")
+        with pytest.raises(Exception):
+            load_from_disk(str(tmp_path))
+    else:
+        assert files == {"data.parquet.partial"}
+
+
+def test_column_store_writer_skips_metadata_on_failure(tmp_path):
+    with ColumnStoreWriter(str(tmp_path)) as writer:
+        writer.write(3, decoded_table())
+    assert os.path.exists(tmp_path / "3" / STORE_META_FILENAME)
+
+    with pytest.raises(RuntimeError):
+        with ColumnStoreWriter(str(tmp_path)) as writer:
+            writer.write(3, decoded_table())
+            raise RuntimeError("ingest failed")
+    assert not os.path.exists(tmp_path / "3" / STORE_META_FILENAME)
+    assert not os.path.exists(tmp_path / "3" / STORE_INDEX_FILENAME)
+    assert all(f.closed for files in writer.files.values() for f in files.values())
+
+
+def test_raw_writer_skips_metadata_on_failure(tmp_path):
+    with RawRecordWriter(str(tmp_path)) as writer:
+        writer.write(3, decoded_table())
+    assert os.path.exists(tmp_path / "3" / SIDECAR_META_FILENAME)
+
+    with pytest.raises(RuntimeError):
+        with RawRecordWriter(str(tmp_path)) as writer:
+            writer.write(3, decoded_table())
+            raise RuntimeError("ingest failed")
+    assert not os.path.exists(tmp_path / "3" / SIDECAR_META_FILENAME)
+
+
+@pytest.mark.parametrize("rows", [slice(5, 40, 3), np.arange(50) % 3 == 0, np.array([49, 2, 2, 17, 0])])
+def test_decode_raw_fields_selection_matches_full_decode(tmp_path, rows):
+    with RawRecordWriter(str(tmp_path)) as writer:
+        writer.write(3, decoded_table())
+    full = decode_raw_fields(str(tmp_path), "3", [1, 2, 12])
+    selected = decode_raw_fields(str(tmp_path), "3", [1, 2, 12], rows=rows, chunk_rows=4)
+    for field in full:
+        np.testing.assert_array_equal(selected[field], full[field][rows])